@@ -100,6 +100,9 @@ void export_nhamiltonian_generic_objects(){
   CMATRIX (nHamiltonian::*expt_get_time_overlap_dia_v1)() = &nHamiltonian::get_time_overlap_dia;
   CMATRIX (nHamiltonian::*expt_get_time_overlap_dia_v2)(vector<int>&) = &nHamiltonian::get_time_overlap_dia;
 
+  vector<CMATRIX> (nHamiltonian::*expt_get_time_overlap_adi_children_v1)() = &nHamiltonian::get_time_overlap_adi_children;
+  vector<CMATRIX> (nHamiltonian::*expt_get_time_overlap_adi_children_v2)(vector<CMATRIX>&) = &nHamiltonian::get_time_overlap_adi_children;
+
 
 
   vector<int> (nHamiltonian::*expt_get_ordering_adi_v1)() = &nHamiltonian::get_ordering_adi; 
@@ -404,6 +407,11 @@ void export_nhamiltonian_generic_objects(){
       .def("get_time_overlap_adi", expt_get_time_overlap_adi_v2)
       .def("get_time_overlap_dia", expt_get_time_overlap_dia_v1)
       .def("get_time_overlap_dia", expt_get_time_overlap_dia_v2)
+      .def("get_basis_transform_children", &nHamiltonian::get_basis_transform_children)
+      .def("get_time_overlap_adi_children", expt_get_time_overlap_adi_children_v1)
+      .def("get_time_overlap_adi_children", expt_get_time_overlap_adi_children_v2)
+      .def("get_hvib_adi_children", &nHamiltonian::get_hvib_adi_children)
+      .def("get_hvib_dia_children", &nHamiltonian::get_hvib_dia_children)
       .def("get_ordering_adi", expt_get_ordering_adi_v1)
       .def("get_ordering_adi", expt_get_ordering_adi_v2)
       .def("get_cum_phase_corr", expt_get_cum_phase_corr_v1)
@@ -398,6 +398,13 @@ public:
   CMATRIX get_time_overlap_dia();
   CMATRIX get_time_overlap_dia(vector<int>& id_);
 
+  // Batched getters - for all the children at once
+  vector<CMATRIX> get_basis_transform_children();
+  vector<CMATRIX> get_time_overlap_adi_children();
+  vector<CMATRIX> get_time_overlap_adi_children(vector<CMATRIX>& U_prev);
+  vector<CMATRIX> get_hvib_adi_children();
+  vector<CMATRIX> get_hvib_dia_children();
+
   vector<int> get_ordering_adi(); 
   vector<int> get_ordering_adi(vector<int>& id_); 
 
@@ -1890,6 +1890,97 @@ CMATRIX nHamiltonian::get_time_overlap_dia(vector<int>& id_){
 
 
 
+///============= Batched accessors for all the children ================
+vector<CMATRIX> nHamiltonian::get_basis_transform_children(){ 
+/**
+  Return the diabatic-to-adiabatic transformation matrices of all the children Hamiltonians
+  (e.g. of all trajectories), in a single call
+*/
+  int nch = children.size();
+  vector<CMATRIX> res;  res.reserve(nch);
+
+  for(int i=0; i<nch; i++){   res.push_back( children[i]->get_basis_transform() );  }
+
+  return res;
+}
+
+
+vector<CMATRIX> nHamiltonian::get_time_overlap_adi_children(){ 
+/**
+  Return the time-overlap matrices in adiabatic basis of all the children Hamiltonians
+*/
+  int nch = children.size();
+  vector<CMATRIX> res;  res.reserve(nch);
+
+  for(int i=0; i<nch; i++){   res.push_back( children[i]->get_time_overlap_adi() );  }
+
+  return res;
+}
+
+
+vector<CMATRIX> nHamiltonian::get_time_overlap_adi_children(vector<CMATRIX>& U_prev){ 
+/**
+  Compute the time-overlap matrices in adiabatic basis of all the children Hamiltonians
+  from the diabatic-to-adiabatic transformation matrices on the previous step:
+
+  St[i] = U_prev[i]^+ * U[i]
+
+  U_prev - the transformation matrices of all the children on the previous step, as 
+  returned by the `get_basis_transform_children()`
+*/
+  int nch = children.size();
+
+  if(U_prev.size()!=nch){
+    cout<<"ERROR in get_time_overlap_adi_children: The number of the matrices in U_prev = "<<U_prev.size()
+        <<" is not equal to the number of the children Hamiltonians = "<<nch<<"\nExiting...\n";
+    exit(0);
+  }
+
+  vector<CMATRIX> res;  res.reserve(nch);
+
+  for(int i=0; i<nch; i++){  
+
+    if(children[i]->basis_transform_mem_status==0){
+      cout<<"Error in get_time_overlap_adi_children: The basis_transform matrix of the child "<<i
+          <<" is not allocated anywhere\nExiting...\n";
+      exit(0);
+    }
+    res.push_back( U_prev[i].H() * (*children[i]->basis_transform) ); 
+  }
+
+  return res;
+}
+
+
+vector<CMATRIX> nHamiltonian::get_hvib_adi_children(){ 
+/**
+  Return the vibronic Hamiltonian matrices in the adiabatic basis of all the children Hamiltonians
+*/
+  int nch = children.size();
+  vector<CMATRIX> res;  res.reserve(nch);
+
+  for(int i=0; i<nch; i++){   res.push_back( children[i]->get_hvib_adi() );  }
+
+  return res;
+}
+
+
+vector<CMATRIX> nHamiltonian::get_hvib_dia_children(){ 
+/**
+  Return the vibronic Hamiltonian matrices in the diabatic basis of all the children Hamiltonians
+*/
+  int nch = children.size();
+  vector<CMATRIX> res;  res.reserve(nch);
+
+  for(int i=0; i<nch; i++){   res.push_back( children[i]->get_hvib_dia() );  }
+
+  return res;
+}
+
+
+
+
+
 vector<int> nHamiltonian::get_ordering_adi(){ 
 /**
   Return the permutation describing the ordering of the adiabatic states
@@ -20,6 +20,8 @@ if sys.platform=="cygwin":
     from cyglibra_core import *
 elif sys.platform=="linux" or sys.platform=="linux2":
     from liblibra_core import *
+
+from . import ff_cache
 
 
 
@@ -34,7 +36,19 @@ def Load_MMFF94(force_field,
                 ff_file32  = "data/force_fields/mmff94/mmff94_angles2.dat",
                 ff_file33  = "data/force_fields/mmff94/mmff94_angles3.dat",
                 ff_file4  = "data/force_fields/mmff94/mmff94_torsions.dat",
-                ff_file5  = "data/force_fields/mmff94/mmff94_oop.dat" ):
+                ff_file5  = "data/force_fields/mmff94/mmff94_oop.dat", use_cache=True ):
+    files = [ff_file11, ff_file12, ff_file21, ff_file22, ff_file23,
+             ff_file31, ff_file32, ff_file33, ff_file4, ff_file5]
+    blocks = ff_cache.load(_parse_MMFF94, files, use_cache)
+    ff_cache.apply(force_field, blocks)
+
+
+
+def _parse_MMFF94(ff_file11, ff_file12, ff_file21, ff_file22, ff_file23,
+                  ff_file31, ff_file32, ff_file33, ff_file4, ff_file5):
+##
+# Parses the MMFF94 parameter file(s) into the list of records for ff_cache.pack()
+#
 
 
 #------- Here are some basic patterns -------------
@@ -182,6 +196,8 @@ def Load_MMFF94(force_field,
     A2 = f.readlines()
     f.close()
 
+    records = []
+
     class atomrecord:
         pass
 
@@ -226,9 +242,7 @@ def Load_MMFF94(force_field,
             ff.Atom_pbci        = float(a[m1.start('Atom_pbci'):m1.end('Atom_pbci')])
             ff.Atom_fcadj       = float(a[m1.start('Atom_fcadj'):m1.end('Atom_fcadj')])
 
-            atom_record = Atom_Record()
-            atom_record.set(ff)
-            res = force_field.Add_Atom_Record(atom_record)                       
+            records.append( ("Atom", vars(ff), ()) )
             print("load type", ff.Atom_ff_type)
 
         if m2!=None:
@@ -246,7 +260,7 @@ def Load_MMFF94(force_field,
         if m8!=None:
             ff_par["ForceField_Name"] = a[m8.start('FF_name_value'):m8.end('FF_name_value')]
 
-    force_field.set(ff_par)
+    records.append( ("set", dict(ff_par), ()) )
 
     for a in A2:
         m1 = re.search(MMFF94_Atom_Type_Record2,a)
@@ -264,9 +278,7 @@ def Load_MMFF94(force_field,
             ff.Atom_ff_eq_int_type4 = int(float(a[m1.start('Atom3_ff_int_type'):m1.end('Atom3_ff_int_type')]))
             ff.Atom_ff_eq_int_type5 = int(float(a[m1.start('Atom4_ff_int_type'):m1.end('Atom4_ff_int_type')]))
 
-            atom_record = Atom_Record()
-            atom_record.set(ff)
-            res = force_field.Add_Atom_Record(atom_record)
+            records.append( ("Atom", vars(ff), ()) )
 
 
  
@@ -300,9 +312,7 @@ def Load_MMFF94(force_field,
             ff.Bond_k_bond      = float(a[m1.start('Bond_k_bond'):m1.end('Bond_k_bond')])
             ff.Bond_r_eq        = float(a[m1.start('Bond_r_eq'):m1.end('Bond_r_eq')])
 
-            bond_record = Bond_Record()
-            bond_record.set(ff)
-            res = force_field.Add_Bond_Record(bond_record)            
+            records.append( ("Bond", vars(ff), ()) )
 
     for a in A2:
         m1 = re.search(MMFF94_Bond_Type_Record2,a)
@@ -314,9 +324,7 @@ def Load_MMFF94(force_field,
             ff.Bond_type_index  = int(float(a[m1.start('X_type_index'):m1.end('X_type_index')]))
             ff.Bond_bci         = float(a[m1.start('Bond_bci'):m1.end('Bond_bci')])         
 
-            bond_record = Bond_Record()
-            bond_record.set(ff)
-            res = force_field.Add_Bond_Record(bond_record)
+            records.append( ("Bond", vars(ff), ()) )
 
     print("Setting parameters for rule-based calculations")
     for a in A3:
@@ -329,11 +337,7 @@ def Load_MMFF94(force_field,
             ff.Bond_r_eq_ref    = float(a[m1.start('Bond_r_eq'):m1.end('Bond_r_eq')])
             ff.Bond_k_bond_ref  = float(a[m1.start('Bond_k_bond'):m1.end('Bond_k_bond')])
 
-            bond_record = Bond_Record()
-            bond_record.set(ff)
-#            bond_record.show_info()
-            res = force_field.Add_Bond_Record(bond_record)
-            print(res)
+            records.append( ("Bond", vars(ff), ()) )
 
 
 
@@ -370,9 +374,7 @@ def Load_MMFF94(force_field,
             ff.Angle_k_angle      = float(a[m1.start('Angle_k_angle'):m1.end('Angle_k_angle')])
             ff.Angle_theta_eq     = float(a[m1.start('Angle_theta_eq'):m1.end('Angle_theta_eq')])
 
-            angle_record = Angle_Record()
-            angle_record.set(ff) 
-            res = force_field.Add_Angle_Record(angle_record,0)
+            records.append( ("Angle", vars(ff), (0,)) )
 
     for a in A2:
         m1 = re.search(MMFF94_Angle_Type_Record2,a)
@@ -385,9 +387,7 @@ def Load_MMFF94(force_field,
             ff.Angle_kijk_sb      = float(a[m1.start('Angle_k_ijk'):m1.end('Angle_k_ijk')])
             ff.Angle_kkji_sb      = float(a[m1.start('Angle_k_kji'):m1.end('Angle_k_kji')])
 
-            angle_record = Angle_Record()
-            angle_record.set(ff)
-            res = force_field.Add_Angle_Record(angle_record,1)
+            records.append( ("Angle", vars(ff), (1,)) )
 
 
 #    print "Printing all angle records in this force field"
@@ -418,9 +418,7 @@ def Load_MMFF94(force_field,
             ff.Dihedral_vphi      = float(a[m1.start('Tors_V1'):m1.end('Tors_V1')])
 
 
-            dihedral_record = Dihedral_Record()
-            dihedral_record.set(ff)
-            res = force_field.Add_Dihedral_Record(dihedral_record,0)
+            records.append( ("Dihedral", vars(ff), (0,)) )
 
 #    print "Printing all dihedral(torsion) records in this force field"
 #    force_field.show_dihedral_records();
@@ -446,15 +444,10 @@ def Load_MMFF94(force_field,
             ff.Dihedral_vphi      = float(a[m1.start('Dihedral_vphi'):m1.end('Dihedral_vphi')])
 
 
-            dihedral_record = Dihedral_Record()
-            dihedral_record.set(ff)
-            res = force_field.Add_Improper_Record(dihedral_record)
+            records.append( ("Improper", vars(ff), ()) )
 
 #    print "Printing all improper(oop) records in this force field"
 #    force_field.show_improper_records();
 
-
-
-
-
+    return records
 
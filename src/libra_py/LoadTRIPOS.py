@@ -20,13 +20,25 @@ if sys.platform=="cygwin":
     from cyglibra_core import *
 elif sys.platform=="linux" or sys.platform=="linux2":
     from liblibra_core import *
+
+from . import ff_cache
 
 
 
 def Load_TRIPOS(force_field, ff_file1 = "data/force_fields/tripos/tripos.dat",
                              ff_file2 = "data/force_fields/tripos/tripos_bonds.dat",
                              ff_file3 = "data/force_fields/tripos/tripos_angles.dat",
-                             ff_file4 = "data/force_fields/tripos/tripos_dihedrals.dat"):
+                             ff_file4 = "data/force_fields/tripos/tripos_dihedrals.dat", use_cache=True ):
+    files = [ff_file1, ff_file2, ff_file3, ff_file4]
+    blocks = ff_cache.load(_parse_TRIPOS, files, use_cache)
+    ff_cache.apply(force_field, blocks)
+
+
+
+def _parse_TRIPOS(ff_file1, ff_file2, ff_file3, ff_file4):
+##
+# Parses the TRIPOS parameter file(s) into the list of records for ff_cache.pack()
+#
 
     
 
@@ -110,6 +122,8 @@ def Load_TRIPOS(force_field, ff_file1 = "data/force_fields/tripos/tripos.dat",
     f   = open(ff_file1,'r')
     A = f.readlines()
     f.close()
+    records = []
+
     class atomrecord:
         pass
     ff_par = {}
@@ -130,9 +144,7 @@ def Load_TRIPOS(force_field, ff_file1 = "data/force_fields/tripos/tripos.dat",
             ff.Atom_sigma       = float(a[m1.start('Atom_sigma'):m1.end('Atom_sigma')])
             ff.Atom_epsilon     = float(a[m1.start('Atom_epsilon'):m1.end('Atom_epsilon')])
 
-            atom_record = Atom_Record()
-            atom_record.set(ff)
-            res = force_field.Add_Atom_Record(atom_record)
+            records.append( ("Atom", vars(ff), ()) )
             
             print("load type", ff.Atom_ff_type)
 
@@ -151,7 +163,7 @@ def Load_TRIPOS(force_field, ff_file1 = "data/force_fields/tripos/tripos.dat",
         if m8!=None:
             ff_par["ForceField_Name"] = a[m8.start('FF_name_value'):m8.end('FF_name_value')]
 
-    force_field.set(ff_par)
+    records.append( ("set", dict(ff_par), ()) )
 
 
 
@@ -174,10 +186,7 @@ def Load_TRIPOS(force_field, ff_file1 = "data/force_fields/tripos/tripos.dat",
             ff.Bond_r_eq        = float(a[m1.start('Bond_r_eq'):m1.end('Bond_r_eq')])
 
 
-            bond_record = Bond_Record()
-            bond_record.set(ff)
-            #bond_record.show_info()
-            res = force_field.Add_Bond_Record(bond_record)            
+            records.append( ("Bond", vars(ff), ()) )
 
 
 #----------------- Angles -------------------------------------
@@ -198,10 +207,7 @@ def Load_TRIPOS(force_field, ff_file1 = "data/force_fields/tripos/tripos.dat",
             ff.Angle_k_angle    = float(a[m1.start('Angle_k_angle'):m1.end('Angle_k_angle')])
             ff.Angle_theta_eq   = float(a[m1.start('Angle_theta_eq'):m1.end('Angle_theta_eq')])
 
-            angle_record = Angle_Record()
-            angle_record.set(ff)
-            #angle_record.show_info()
-            res = force_field.Add_Angle_Record(angle_record)
+            records.append( ("Angle", vars(ff), ()) )
 
 
 #----------------- Dihedrals -------------------------------------
@@ -223,13 +229,7 @@ def Load_TRIPOS(force_field, ff_file1 = "data/force_fields/tripos/tripos.dat",
             ff.Dihedral_mult    = int(float(a[m1.start('Dihedral_mult'):m1.end('Dihedral_mult')]))
             ff.Dihedral_vphi    = float(a[m1.start('Dihedral_vphi'):m1.end('Dihedral_vphi')])
 
-            dihedral_record = Dihedral_Record()
-            dihedral_record.set(ff)
-            #dihedral_record.show_info()
-            res = force_field.Add_Dihedral_Record(dihedral_record)
-
-
-
-
+            records.append( ("Dihedral", vars(ff), ()) )
 
+    return records
 
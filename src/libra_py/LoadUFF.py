@@ -20,16 +20,29 @@ if sys.platform=="cygwin":
     from cyglibra_core import *
 elif sys.platform=="linux" or sys.platform=="linux2":
     from liblibra_core import *
+
+from . import ff_cache
 
 
 
-def Load_UFF(force_field, ff_file="uff.dat"):
+def Load_UFF(force_field, ff_file="uff.dat", use_cache=True):
 ##
 # This function loads data into the force field object provided, assuming a specific format of the input file 
 # In this case we assume the input file is formatted to provide some data to set UFF force field
 #
 # \param[in, out] force_field This is the object which we want to setup
 # \param[in] ff_file The name of the file containing all necessary parameters. Default = "uff.dat"
+# \param[in] use_cache Whether to reuse the parameters parsed before, see ff_cache.load(). Default = True
+#
+    files = [ff_file]
+    blocks = ff_cache.load(_parse_UFF, files, use_cache)
+    ff_cache.apply(force_field, blocks)
+
+
+
+def _parse_UFF(ff_file):
+##
+# Parses the UFF parameter file(s) into the list of records for ff_cache.pack()
 #
 
 #------- Here are some basic patterns -------------
@@ -101,6 +114,8 @@ def Load_UFF(force_field, ff_file="uff.dat"):
     f.close()
 
 
+    records = []
+
     class atomrecord:
         pass
 
@@ -136,9 +151,7 @@ def Load_UFF(force_field, ff_file="uff.dat"):
             sz = len(vAtom_ff_type)     
             ff.Atom_ff_type = vAtom_ff_type[1:sz-1]
 
-            atom_record = Atom_Record()
-            atom_record.set(ff)
-            res = force_field.Add_Atom_Record(atom_record)
+            records.append( ("Atom", vars(ff), ()) )
             
             #print "load type", ff.Atom_ff_type
 
@@ -162,5 +175,7 @@ def Load_UFF(force_field, ff_file="uff.dat"):
             ff_par["elec_scale12"] = float(a[m10.start('FF_elec_scale12_value'):m10.end('FF_elec_scale12_value')])
 
 
-    force_field.set(ff_par)
+    records.append( ("set", dict(ff_par), ()) )
+
+    return records
 
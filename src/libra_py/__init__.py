@@ -26,6 +26,7 @@ __all__ = ["dynamics",
            "DFTB_methods",
            "dynamics_plotting",
            "ERGO_methods",
+           "ff_cache",
            "fgr_py",
            "fit",
            "fix_motion",
@@ -51,6 +52,7 @@ __all__ = ["dynamics",
            "parse_gamess",
            "pdos",
            "probabilities",
+           "profiling",
            "psi4_methods",
            "QE_methods",
            "QE_utils",
@@ -64,3 +66,18 @@ __all__ = ["dynamics",
            "vesta2qe"
           ]
 
+
+import importlib
+
+def __getattr__(name):
+    """
+    Imports the submodules listed in `__all__` on the first access (PEP 562), so that
+    `import libra_py` stays cheap and `libra_py.data_conv` still works without the explicit import
+    """
+    if name in __all__:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError(F"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted( set(globals().keys()) | set(__all__) )
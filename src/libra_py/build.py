@@ -20,6 +20,7 @@ import os
 import sys
 import math
 import copy
+import numpy as np
 
 if sys.platform=="cygwin":
     from cyglibra_core import *
@@ -78,6 +79,47 @@ def read_xyz(filename, inp_units=1, out_units=0):
     return L, coords
 
 
+def read_xyz_frames(filename, inp_units=1, out_units=0):
+    """Read a multi-frame xyz file (e.g. an MD trajectory) into a single np.array
+    
+    Args:
+        filename ( string ): the name of the xyz file to read
+        inp_units ( int ): defines the coordinates' units in the input file:
+
+            * 0 - Bohr
+            * 1 - Angstrom ( default )
+
+        out_units ( int ): defines the output coordinates' units:
+
+            * 0 - Bohr ( default )
+            * 1 - Angstrom
+
+    Returns: 
+        tuple: (L, coords), where:
+ 
+            * L ( list of N strings ): the labels of N atoms (taken from the first frame)
+            * coords ( np.array( (nframes, N, 3) ) ): the coordinates of N atoms in all frames [defined by out_units]
+
+    """
+
+    f = open(filename,"r")
+    A = f.readlines()
+    f.close()
+
+    Natoms = int(float(A[0].split()[0]))
+    nframes = int(len(A)/(Natoms+2))
+
+    L = [ A[2+i].split()[0] for i in range(Natoms) ]
+
+    coords = np.zeros( (nframes, Natoms, 3) )
+    for t in range(nframes):
+        start = t*(Natoms+2) + 2
+        coords[t] = [ a.split()[1:4] for a in A[start:start+Natoms] ]
+
+    return L, coords * units.length_converter(inp_units, out_units)
+
+
+
 def make_xyz(L, R, inp_units=0, out_units=1):
     """Convert atomic labels and coordinates to a string formatted according to xyz
 
@@ -322,29 +364,110 @@ def generate_replicas_xyz2(L, R, tv1, tv2, tv3, Nx, Ny, Nz, inp_units=0, out_uni
 
     """
 
-    nat = len(R)
+    lab, R_np = generate_replicas_np(L, vectors2nparray(R), tv1, tv2, tv3, Nx, Ny, Nz, inp_units, out_units)
+
+    return lab, nparray2vectors(R_np)
+
+
+
+def vectors2nparray(R):
+    """Converts a list of VECTOR objects (or a VECTORList) into a 2D np.array
+
+    Args:
+        R ( list of N VECTOR objects or VECTORList ): the vectors to convert
+
+    Returns:
+        np.array( (N, 3) ): the Cartesian components of all vectors, one row per vector
+
+    """
+
+    return np.array( [ [r.x, r.y, r.z] for r in R ], dtype=float ).reshape(-1, 3)
 
-    lab, newR = [], []
+
+
+def nparray2vectors(R):
+    """Converts a 2D np.array of shape (N, 3) into a list of VECTOR objects
+
+    Args:
+        R ( np.array( (N, 3) ) ): the Cartesian components of N vectors
+
+    Returns:
+        list of N VECTOR objects: the vectors
+
+    """
+
+    return [ VECTOR(r[0], r[1], r[2]) for r in np.asarray(R, dtype=float).tolist() ]
+
+
+
+def _to_3d(v):
+    """Converts a VECTOR or a 3-element sequence into a np.array of shape (3,)
+    """
+
+    if isinstance(v, VECTOR):
+        return np.array([v.x, v.y, v.z], dtype=float)
+
+    return np.asarray(v, dtype=float).reshape(3)
+
+
+
+def generate_replicas_np(L, R, tv1, tv2, tv3, Nx, Ny, Nz, inp_units=0, out_units=0):
+    """
+
+    The NumPy version of the `generate_replicas_xyz2` function. All the replicas are 
+    generated at once by broadcasting the lattice translations over the atoms, so it
+    can be used to build supercells with 10^5 - 10^6 atoms. The order of the atoms
+    in the output is the same as in `generate_replicas_xyz2`: for each atom of the original
+    set, all its replicas are listed (the nz index runs the fastest)
+
+    Args:
+        L ( list of N strings ): atomic labels
+        R ( np.array( (N, 3) ) ): initial atomic coords [defined by inp_units] 
+        tv1 ( VECTOR or list of 3 doubles ): translation vector in direction 1 [defined by inp_units] 
+        tv2 ( VECTOR or list of 3 doubles ): translation vector in direction 2 [defined by inp_units] 
+        tv3 ( VECTOR or list of 3 doubles ): translation vector in direction 3 [defined by inp_units] 
+        Nx ( int ): the number of cells along the vector tv1
+        Ny ( int ): the number of cells along the vector tv2
+        Nz ( int ): the number of cells along the vector tv3
+        inp_units ( int ): defines the units of variables R, tv1, tv2, and tv3:
+
+            * 0 - Bohr ( default )
+            * 1 - Angstrom 
+
+        out_units ( int ): defines the units of the coordinates returned:
+
+            * 0 - Bohr ( default )
+            * 1 - Angstrom 
+
+    Returns:
+        tuple: (lab, newR), where:
+ 
+            * lab ( list of N*Nx*Ny*Nz strings ): the labels of all atoms and their corresponding replicas
+            * newR ( np.array( (N*Nx*Ny*Nz, 3) ) ): the coordinates of all replicated atoms [defined by out_units]
+
+    """
+
+    R = np.asarray(R, dtype=float).reshape(-1, 3)
+    nat = R.shape[0]
     scl = units.length_converter(inp_units, out_units)
 
-    for i in range(0,nat):
+    nx, ny, nz = np.meshgrid(np.arange(Nx), np.arange(Ny), np.arange(Nz), indexing="ij")
+    nx, ny, nz = nx.reshape(-1, 1), ny.reshape(-1, 1), nz.reshape(-1, 1)
+    ncells = nx.shape[0]
 
-        for nx in range(0,Nx):
-            for ny in range(0,Ny):
-                for nz in range(0,Nz):
-                 
-                    # Now apply PBC
-                    r = VECTOR(R[i] + nx * tv1 + ny * tv2 + nz * tv3) * scl
+    # Same order of summation as in the VECTOR-based version
+    newR = R[:, np.newaxis, :] + (nx * _to_3d(tv1))[np.newaxis, :, :]
+    newR = newR + (ny * _to_3d(tv2))[np.newaxis, :, :]
+    newR = newR + (nz * _to_3d(tv3))[np.newaxis, :, :]
+    newR = newR.reshape(nat * ncells, 3) * scl
 
-                    lab.append(L[i])
-                    newR.append(r)
+    lab = np.repeat(np.array(L, dtype=object), ncells).tolist()
 
     return lab, newR
 
 
 
 
-
 def crop_sphere_xyz(infile, outfile, Rcut):
     """
     
@@ -462,33 +585,10 @@ def crop_sphere_xyz2(L, R, Rcut):
     """
 
 
-    # Compute COM
-    Rcom = VECTOR(0.0, 0.0, 0.0)
-
-    for r in R:
-        Rcom = Rcom + r
-
-    # Geometric center
-    Natoms = len(R)
-    Rcom = Rcom / Natoms
-
- 
-    # Compute remaining number of atoms
-    Nat = 0
-    indx = []
-    for i in range(0,Natoms):
-        r = (R[i] - Rcom).length()
-        if(r<=Rcut):
-            Nat = Nat + 1
-            indx.append(i)
-            
+    indx, lab = crop_indices(L, vectors2nparray(R), lambda dr: np.linalg.norm(dr, axis=1) <= Rcut)
 
-    # Prepare the coordinates and labels of the remaining atoms
-    coords = []
-    lab = []     
-    for i in indx:
-        coords.append(R[i])
-        lab.append(L[i])
+    # Prepare the coordinates of the remaining atoms
+    coords = [ R[i] for i in indx ]
 
     return lab, coords
 
@@ -528,64 +628,138 @@ def crop_sphere_xyz3(L, R, Rcut, pairs, new_L):
     """
 
 
-    # Compute COM
-    Rcom = VECTOR(0.0, 0.0, 0.0)
+    indx, lab = crop_indices(L, vectors2nparray(R), lambda dr: np.linalg.norm(dr, axis=1) <= Rcut, None, pairs, new_L)
 
-    for r in R:
-        Rcom = Rcom + r
+    # Prepare the coordinates of the remaining and capping atoms
+    coords = [ R[i] for i in indx ]
 
-    # Geometric center
-    Natoms = len(R)
-    Rcom = Rcom / Natoms
+    return lab, coords
+
+
+
+def crop_indices(L, R, inside, center=None, pairs=None, new_L=None):
+    """
 
+    This function determines which atoms remain after cropping the system to a given shape 
+    and which atoms outside of the shape are kept (relabeled) to cap the dangling bonds. 
+    All the tests are done on np.arrays, so the function scales well to large systems
+
+    Args: 
+        L ( list of N strings ): element names
+        R ( np.array( (N, 3) ) ): coordinates of the particles [ Bohr ]
+        inside ( function ): the function that defines the shape. It takes the np.array( (N, 3) )
+            of the atomic positions relative to `center` and returns np.array( N ) of bools, which
+            are True for the atoms inside the shape
+        center ( list of 3 doubles or None ): the center of the shape [ Bohr ], if None, the 
+            GEOMETRIC center of the system is used [ default: None ]
+        pairs ( list of [int, int, ...] lists or None ): the first two integers in each item describe 
+            the indices of the connected atoms, same format as in `crop_sphere_xyz3` [ default: None - no capping ]
+        new_L ( dictionary(string:string) or None ): a map defining the labels of the capping atoms, 
+            same as in `crop_sphere_xyz3` [ default: None - no capping ]
+
+    Returns:
+        tuple: (indx, lab), where:
  
-    # Compute remaining number of atoms
-    Nat = 0
-    indx = []
-    for i in range(0,Natoms):
-        r = (R[i] - Rcom).length()
-        if(r<=Rcut):
-            Nat = Nat + 1
-            indx.append(i)
-            
+            * indx ( list of ints ): the indices of all the remaining atoms, the capping atoms 
+                go after the atoms inside the shape
+            * lab ( list of strings ): the labels of all the remaining atoms
 
-    # Prepare the coordinates and labels of the remaining atoms
-    coords = []
-    lab = []     
-    for i in indx:
-        coords.append(R[i])
-        lab.append(L[i])
+    """
 
+    R = np.asarray(R, dtype=float).reshape(-1, 3)
 
-    # Now add a number of atoms that are ourside the sphere
-    added = [] # indices of the added atoms - we need them to avoid a multiple placing
-    for it in pairs:
-           
-        if (it[0] in indx and it[1] in indx):  # both atoms are within the sphere
-            pass
-        elif (it[0] in indx and it[1] not in indx):  # it[0] is inside, it[1] is outside
-            if it[1] not in added:
-
-                new_lab = new_L[ L[it[0]] ]  # new label
-                if new_lab == "none":
-                    pass
-                else:
-                    coords.append(R[it[1]])
-                    lab.append(new_lab)            
-                    added.append(it[1])
-
-        elif (it[1] in indx and it[0] not in indx):  # it[1] is inside, it[0] is outside
-            if it[0] not in added:
-                new_lab = new_L[ L[it[1]] ]  # new label
-                if new_lab == "none":
-                    pass
-                else:
-                    coords.append(R[it[0]])
-                    lab.append(new_lab)
-                    added.append(it[0])
+    if center is None:
+        center = np.mean(R, axis=0)
 
+    mask = np.asarray(inside(R - np.asarray(center, dtype=float)), dtype=bool)
+    indx = np.nonzero(mask)[0].tolist()
+    lab = [ L[i] for i in indx ]
 
-    return lab, coords
+    if pairs is None or new_L is None or len(pairs)==0:
+        return indx, lab
+
+    # Pairs across the surface of the shape: in_atom is inside, out_atom is outside
+    p = np.array( [ [it[0], it[1]] for it in pairs ], dtype=int)
+    in0, in1 = mask[p[:,0]], mask[p[:,1]]
+    cross_pair = np.logical_xor(in0, in1)
+    in_atom = np.where(in0, p[:,0], p[:,1])[cross_pair]
+    out_atom = np.where(in0, p[:,1], p[:,0])[cross_pair]
+
+    # Pairs that lead to "none" label do not place the atom
+    new_labs = np.array( [ new_L[ L[i] ] for i in in_atom ], dtype=object)
+    keep = new_labs != "none"
+    out_atom, new_labs = out_atom[keep], new_labs[keep]
+
+    # Each outside atom is placed only once - the first occurrence in the pairs list defines the label
+    _, first = np.unique(out_atom, return_index=True)
+    first = np.sort(first)
+
+    indx = indx + out_atom[first].tolist()
+    lab = lab + new_labs[first].tolist()
+
+    return indx, lab
+
+
+
+def crop_sphere_np(L, R, Rcut, pairs=None, new_L=None, center=None):
+    """
+
+    The NumPy version of the `crop_sphere_xyz2` and `crop_sphere_xyz3` functions. It removes all atoms that 
+    are outside of a sphere of Rcut radius and optionally caps the dangling bonds formed at cropping
+
+    Args: 
+        L ( list of N strings ): element names
+        R ( np.array( (N, 3) ) ): coordinates of the particles [ Bohr ]
+        Rcut ( double ): the radius of the sphere [ Bohr ]
+        pairs ( list of [int, int, ...] lists or None ): connectivity, see `crop_sphere_xyz3` [ default: None ]
+        new_L ( dictionary(string:string) or None ): capping labels, see `crop_sphere_xyz3` [ default: None ]
+        center ( list of 3 doubles or None ): the center of the sphere [ Bohr ], if None, the 
+            GEOMETRIC center of the system is used [ default: None ]
+
+    Returns:
+        tuple: (lab, coords), where:
+ 
+            * lab ( list of M strings ): the labels of all remaining atoms
+            * coords ( np.array( (M, 3) ) ): the coordinates of all remaining atoms
+
+    """
+
+    R = np.asarray(R, dtype=float).reshape(-1, 3)
+    indx, lab = crop_indices(L, R, lambda dr: np.linalg.norm(dr, axis=1) <= Rcut, center, pairs, new_L)
+
+    return lab, R[indx]
+
+
+
+def crop_shape_np(L, R, inside, pairs=None, new_L=None, center=None):
+    """
+
+    Same as `crop_sphere_np`, but for an arbitrary shape defined by the `inside` function, e.g.
+    a box: 
+
+        >>> lab, coords = crop_shape_np(L, R, lambda dr: np.all(np.abs(dr) <= 10.0, axis=1) )
+
+    Args: 
+        L ( list of N strings ): element names
+        R ( np.array( (N, 3) ) ): coordinates of the particles [ Bohr ]
+        inside ( function ): the shape definition, see `crop_indices`
+        pairs ( list of [int, int, ...] lists or None ): connectivity, see `crop_sphere_xyz3` [ default: None ]
+        new_L ( dictionary(string:string) or None ): capping labels, see `crop_sphere_xyz3` [ default: None ]
+        center ( list of 3 doubles or None ): the center of the shape [ Bohr ], if None, the 
+            GEOMETRIC center of the system is used [ default: None ]
+
+    Returns:
+        tuple: (lab, coords), where:
+ 
+            * lab ( list of M strings ): the labels of all remaining atoms
+            * coords ( np.array( (M, 3) ) ): the coordinates of all remaining atoms
+
+    """
+
+    R = np.asarray(R, dtype=float).reshape(-1, 3)
+    indx, lab = crop_indices(L, R, inside, center, pairs, new_L)
+
+    return lab, R[indx]
 
 
 
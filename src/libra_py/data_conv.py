@@ -324,9 +324,7 @@ def list2MATRIX(data):
 
     N = len(data)
     res = MATRIX(N,1)
-    
-    for n in range(0,N):
-        res.set(n, 0, data[n])
+    res.from_buffer( np.ascontiguousarray(data, dtype=np.float64) )
 
     return res
 
@@ -335,6 +333,8 @@ def nparray2MATRIX(data):
     """
     Converts 2D np.array of shape( N, M ) doubles into a MATRIX( N, M ) object
     The numpy array can contain either complex or real values    
+    The data are copied in bulk; non-C-contiguous arrays (e.g. Fortran-ordered or sliced) are copied
+    to the C order first
 
     Args:
         data ( 2D np.array of dimension N x M ): data to be converted
@@ -347,10 +347,7 @@ def nparray2MATRIX(data):
     M = data.shape[1]
     
     res = MATRIX(N,M)
-    
-    for n in range(0,N):
-        for m in range(0,M):
-            res.set(n, m, data[n][m].real)
+    res.from_buffer( np.ascontiguousarray(np.real(data), dtype=np.float64) )
 
     return res
 
@@ -359,6 +356,8 @@ def nparray2CMATRIX(data):
     """
     Converts 2D np.array of shape( N, M ) doubles into a CMATRIX( N, M ) object
     The numpy array should be complex   
+    The data are copied in bulk; non-C-contiguous arrays (e.g. Fortran-ordered or sliced) are copied
+    to the C order first
  
     Args:
         data ( 2D np.array of dimension N x M ): data to be converted
@@ -371,10 +370,7 @@ def nparray2CMATRIX(data):
     M = data.shape[1]
 
     res = CMATRIX(N,M)
-
-    for n in range(0,N):
-        for m in range(0,M):
-            res.set(n, m, data[n][m])
+    res.from_buffer( np.ascontiguousarray(data, dtype=np.complex128) )
 
     return res
 
@@ -385,6 +381,7 @@ def MATRIX2nparray( data ):
     """
     Converts both Libra MATRIX ( N, M ) object and CMATRIX ( N, M ) object 
     into a 2D np.array of shape( N, M )
+    The data are copied in bulk, the returned array does not share the memory with the MATRIX
     
     Args:
         data ( Libra MATRIX object of dimension N x M ): data to be converted
@@ -395,15 +392,31 @@ def MATRIX2nparray( data ):
 
     N = data.num_of_rows
     M = data.num_of_cols
-    
-    res = []
-    
-    for n in range(0,N):
-        res.append( [] )
-        for m in range(0,M):
-            res[n].append(data.get(n,m))
 
-    return np.array(res)
+    dtype = np.float64
+    if isinstance(data, CMATRIX):
+        dtype = np.complex128
+    elif isinstance(data, IMATRIX):
+        dtype = np.intc
+
+    return np.frombuffer(data.to_bytearray(), dtype=dtype).reshape(N, M)
+
+
+
+def MATRIXList2nparray( data ):
+    """
+    Converts a list of Libra MATRIX ( N, M ) or CMATRIX ( N, M ) objects (e.g. MATRIXList
+    or CMATRIXList, such as returned by the `get_basis_transform_children()` or
+    `get_hvib_adi_children()` methods of the nHamiltonian) into a stacked 3D np.array
+
+    Args:
+        data ( list of K Libra MATRIX or CMATRIX objects of dimension N x M ): data to be converted
+    Returns:
+        3d np.array: np.array of shape( K, N, M )
+
+    """
+
+    return np.array( [ MATRIX2nparray(x) for x in data ] )
 
 
 
@@ -424,14 +437,7 @@ def matrix2list(q):
 
     """
     
-    list_q = []
-    
-    ndof = q.num_of_rows
-    
-    for idof in range(ndof):
-        list_q.append( q.get(idof, 0) )
-        
-    return list_q
+    return MATRIX2nparray(q)[:, 0].tolist()
 
 
 
@@ -51,7 +51,6 @@ __email__ = "alexvakimov@gmail.com"
 __url__ = "https://quantum-dynamics-hub.github.io/libra/index.html"
 
 
-import h5py
 import numpy as np
 
 import os
@@ -69,6 +68,21 @@ from . import units
 from . import data_read
 
 
+_h5py_module = None
+
+def _h5py():
+    """
+    Returns the h5py module, importing it on the first call, so that importing this module
+    does not need h5py
+    """
+
+    global _h5py_module
+    if _h5py_module is None:
+        import h5py
+        _h5py_module = h5py
+    return _h5py_module
+
+
 class mem_saver:
     """
     This class is needed for saving variables into a dictionary
@@ -100,6 +114,9 @@ class mem_saver:
         
         # "Numpy" data - elements are numpy arrays
         self.np_data = {}
+
+        # Attributes of the data sets, to be saved along with them
+        self.attrs = {}
         
         
         # Only initialize the "raw" data, don't touch the numpy
@@ -151,6 +168,21 @@ class mem_saver:
             
         else:
             print(F"ERROR: the dtype = {dtype} is not allowed in add_dataset")
+
+
+    def add_attrs(self, data_name, attrs):
+        """
+        To attach the attributes to the data set
+
+        Args:
+            data_name (string): the name of the data set
+            attrs (dictionary): the attributes, saved into the group of the data set by `save_data`
+
+        """
+
+        if data_name not in self.attrs.keys():
+            self.attrs[data_name] = {}
+        self.attrs[data_name].update(attrs)
                 
     
               
@@ -235,7 +267,7 @@ class mem_saver:
         #    print(key, self.np_data[key] )
   
         
-        with h5py.File(filename, mode) as f:
+        with _h5py().File(filename, mode) as f:
             
             for data_name in data_names:                
                 if data_name in self.np_data.keys():
@@ -244,6 +276,9 @@ class mem_saver:
                                                         
                     g = f.create_group(data_name)                                                            
                     g.create_dataset("data", data = self.np_data[data_name])
+
+                    if data_name in self.attrs.keys():
+                        g.attrs.update(self.attrs[data_name])
                     
                 else:
                     print(F"{data_name} is not in the list {self.np_data.keys()}" )
@@ -275,7 +310,7 @@ class hdf5_saver:
         self.r_compression_level = 4
         self.i_compression_level = 9
 
-        with h5py.File(self.filename, "w") as f:
+        with _h5py().File(self.filename, "w") as f:
             g = f.create_group("default")
             g.create_dataset("data", data=[])
 
@@ -327,7 +362,7 @@ class hdf5_saver:
 
         """
 
-        with h5py.File(self.filename, "a") as f:
+        with _h5py().File(self.filename, "a") as f:
             g = f.create_group(data_set_name)
             g.attrs["dim"] = dim
             g.attrs["data_type"] = data_type
@@ -350,17 +385,32 @@ class hdf5_saver:
                     g.create_dataset("data", dim, dtype=int, maxshape=dim)
 
 
+    def add_attrs(self, data_set_name, attrs):
+        """
+
+        Args:
+
+            data_set_name ( string ): the name of the data set
+            attrs ( dictionary ): the attributes to be attached to the group of the data set
+
+        """
+
+        with _h5py().File(self.filename, "a") as f:
+            if data_set_name in f:
+                f[data_set_name].attrs.update(attrs)
+
+
     def save_scalar(self, istep, data_name, data):
 
         if data_name in self.keywords:
-            with h5py.File(self.filename, "a") as f:
+            with _h5py().File(self.filename, "a") as f:
                 f[F"{data_name}/data"][istep] = data
 
 
     def save_multi_scalar(self, istep, iscal, data_name, data):
 
         if data_name in self.keywords:
-            with h5py.File(self.filename, "a") as f:
+            with _h5py().File(self.filename, "a") as f:
                 f[F"{data_name}/data"][istep, iscal] = data
 
 
@@ -379,7 +429,7 @@ class hdf5_saver:
 
             nx, ny = data.num_of_rows, data.num_of_cols
 
-            with h5py.File(self.filename, "a") as f:
+            with _h5py().File(self.filename, "a") as f:
       
                 for i in range(nx):
                     for j in range(ny):
@@ -401,7 +451,7 @@ class hdf5_saver:
 
             nx, ny = data.num_of_rows, data.num_of_cols
 
-            with h5py.File(self.filename, "a") as f:
+            with _h5py().File(self.filename, "a") as f:
 
                 for i in range(nx):
                     for j in range(ny):
@@ -21,10 +21,8 @@ import os
 import sys
 import math
 import copy
-import scipy
 
 import numpy as np
-from scipy.interpolate import griddata
 
 if sys.platform=="cygwin":
     from cyglibra_core import *
@@ -87,6 +85,8 @@ def plot_map(ax, x_grid, y_grid, z_values, colormap="plasma", resolution=30j, sa
 
 
     """
+
+    from scipy.interpolate import griddata
     
     
     npts_x = len(x_grid)
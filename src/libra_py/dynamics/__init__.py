@@ -9,6 +9,7 @@
 
 __all__ = ["exact",
            "heom",
+           "sweep",
            "tsh",
           ]
 
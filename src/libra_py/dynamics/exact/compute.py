@@ -12,6 +12,9 @@
    :platform: Unix, Windows
    :synopsis: This module implements functions for doing exact on-the-grid dynamics
        List of functions:
+           * grid_coordinates(wfc)
+           * compute_grid_Hamiltonian(wfc, _potential, model_params, cache_dir=None)
+           * set_grid_Hamiltonian(wfc, ham)
            * init_wfc(params, _potential, model_params )
            * run_dynamics(wfc, params, model_params, savers)
            * run_relaxation(_params, _potential, model_params)
@@ -37,8 +40,8 @@ import sys
 import math
 import copy
 import time
+import hashlib
 
-import h5py
 import numpy as np
 
 if sys.platform=="cygwin":
@@ -50,24 +53,145 @@ import util.libutil as comn
 import libra_py.units as units
 import libra_py.data_outs as data_outs
 import libra_py.data_savers as data_savers
+import libra_py.data_conv as data_conv
+import libra_py.profiling as profiling
 
 from . import save
 
 
 
+def grid_coordinates(wfc):
+    """
+    Computes the coordinates of all the grid points of the wavefunction
+
+    The points are ordered in the same way as in the `gmap` member of Wfcgrid2, 
+    that is the last DOF changes the fastest
+
+    Args:
+        wfc ( Wfcgrid2 ): the wavefunction object
+
+    Returns:
+        numpy.array(Npts, ndof): the coordinates of all the grid points
+
+    """
+
+    npts = list(wfc.npts)
+    rmin = np.array(list(wfc.rmin))
+    dr = np.array(list(wfc.dr))
+
+    indx = np.indices(npts).reshape(len(npts), -1).T
+
+    return rmin + indx * dr
+
+
+
+def compute_grid_Hamiltonian(wfc, _potential, model_params, cache_dir=None):
+    """
+    Computes the Hamiltonian for all the grid points by a single call of a vectorized model
+
+    Args:
+        wfc ( Wfcgrid2 ): the wavefunction object, defines the grid
+        _potential ( PyObject ): the vectorized model function, called as `_potential(q, model_params)`, 
+            where q is a numpy.array(Npts, ndof) of the coordinates of all the grid points 
+            (see :funct:`grid_coordinates`). It should return an object with the members:
+
+            * obj.ham_dia ( numpy.array(Npts, nstates, nstates) ): diabatic Hamiltonians [ required ]
+            * obj.ham_adi ( numpy.array(Npts, nstates, nstates) ): adiabatic Hamiltonians [ optional ]
+            * obj.dc1_adi ( numpy.array(Npts, ndof, nstates, nstates) ): derivative couplings in 
+                the adiabatic basis [ optional ]
+
+        model_params ( dictionary ): the parameters of the model
+        cache_dir ( string ): the directory in which the computed Hamiltonians are stored. The file
+            name is a hash of the model function name, model parameters, and the grid definition, so 
+            the Hamiltonian computed once is read from the disk in the subsequent calculations.
+            If None, nothing is cached [ default: None ]
+
+    Returns:
+        dictionary: { "ham_dia": ..., "ham_adi": ..., "dc1_adi": ... } with the numpy arrays for 
+            all the grid points; only the keys provided by the model are present
+
+    """
+
+    cache_file = None
+    if cache_dir != None:
+        key = repr( ( getattr(_potential, "__module__", ""), getattr(_potential, "__name__", repr(_potential)),
+                      sorted( [ (k, repr(v)) for k, v in model_params.items() ] ),
+                      list(wfc.rmin), list(wfc.dr), list(wfc.npts), wfc.nstates ) )
+        cache_file = os.path.join(cache_dir, F"ham_{hashlib.sha1(key.encode()).hexdigest()}.npz")
+
+        if os.path.isfile(cache_file):
+            with np.load(cache_file) as data:
+                return { name: data[name] for name in data.files }
+
+    q = grid_coordinates(wfc)
+    obj = _potential(q, model_params)
+
+    res = {}
+    for name in ["ham_dia", "ham_adi", "dc1_adi"]:
+        if hasattr(obj, name):
+            res[name] = np.asarray(getattr(obj, name), dtype=complex)
+
+    if cache_file != None:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        np.savez(cache_file, **res)
+
+    return res
+
+
+
+def set_grid_Hamiltonian(wfc, ham):
+    """
+    Sets the Hamiltonian members of the wavefunction object from the arrays 
+    computed by :funct:`compute_grid_Hamiltonian`. This is an alternative to 
+    calling `wfc.update_Hamiltonian` with the diabatic and adiabatic representations
+
+    Args:
+        wfc ( Wfcgrid2 ): the wavefunction object - updated by this function
+        ham ( dictionary ): { "ham_dia": ..., "ham_adi": ..., "dc1_adi": ... } the numpy arrays 
+            with the Hamiltonians for all the grid points
+
+    Returns:
+        None
+
+    """
+
+    for name, attr in [ ("ham_dia", "Hdia"), ("ham_adi", "Hadi") ]:
+        if name in ham.keys():
+            lst = CMATRIXList()
+            for h in ham[name]:
+                lst.append( data_conv.nparray2CMATRIX(h) )
+            setattr(wfc, attr, lst)
+
+    if "dc1_adi" in ham.keys():
+        nac1 = CMATRIXMap()
+        for dc1 in ham["dc1_adi"]:
+            lst = CMATRIXList()
+            for d in dc1:
+                lst.append( data_conv.nparray2CMATRIX(d) )
+            nac1.append(lst)
+        wfc.NAC1 = nac1
+
+
+
 def init_wfc(params, _potential, model_params ):
     """
     This is a generic and a bit excessive initialization procedure - some of the parameters
     may not be needed for some of the methods, but it allows us to have a simple structure of the program
     
     istate = [rep, index_of_the_state]
+
+    If params["vectorized_potential"] is 1, the `_potential` function is called only once with 
+    the coordinates of all the grid points (see :funct:`compute_grid_Hamiltonian`), 
+    and the computed Hamiltonians may be cached in the params["hamiltonian_cache_dir"] directory
     
     """
             
     critical_params = []
     default_params = { "nsteps":200, "dt":10.0, "progress_frequency":0.1,
                        "rmin":[-15.0], "rmax":[15.0], "dx":[0.1], "nstates":2,
-                       "x0":[0.0], "p0":[0.0], "istate":[1,0], "masses":[2000.0], "k":[0.001]
+                       "x0":[0.0], "p0":[0.0], "istate":[1,0], "masses":[2000.0], "k":[0.001],
+                       "vectorized_potential":0, "hamiltonian_cache_dir":None
                       }
     comn.check_input(params, default_params, critical_params)
     
@@ -106,9 +230,13 @@ def init_wfc(params, _potential, model_params ):
     wfc.direct_allocate_tmp_vars(1)    # last time-step wavefunction, adiabatic rep
 
     
-    wfc.update_Hamiltonian(_potential, model_params, 0)  # update Hamiltonian: diabatic -
-                                                        # need to compute diabatic-to-adiabatic transform
-    wfc.update_Hamiltonian(_potential, model_params, 1)  # update Hamiltonian: adiabatic, NACs
+    if params["vectorized_potential"]==1:
+        ham = compute_grid_Hamiltonian(wfc, _potential, model_params, params["hamiltonian_cache_dir"])
+        set_grid_Hamiltonian(wfc, ham)                   # diabatic and, if available, adiabatic Hamiltonian and NACs
+    else:
+        wfc.update_Hamiltonian(_potential, model_params, 0)  # update Hamiltonian: diabatic -
+                                                            # need to compute diabatic-to-adiabatic transform
+        wfc.update_Hamiltonian(_potential, model_params, 1)  # update Hamiltonian: adiabatic, NACs
         
     wfc.update_propagator_H(0.5*dt)                     # copute the dia-to-adi transform + exp(-i* V *dt/2)
     
@@ -143,6 +271,35 @@ def init_wfc(params, _potential, model_params ):
 
 
 def run_dynamics(wfc, params, model_params, savers):
+    """
+    Propagates the grid wavefunction and saves its properties
+
+    Only the representation in which the integrator works is kept up to date on every step. 
+    The other representation and the reciprocal-space wavefunctions are recomputed only on 
+    the steps when the data are saved and only if some of the requested properties need them.
+    At the end of the dynamics all the representations are brought up to date.
+
+    Args:
+        wfc ( Wfcgrid2 ): the wavefunction object, all its representations are assumed to be consistent
+        params ( dictionary ): parameters of the simulation, in particular:
+
+            * **params["integrator"]** ( string ): the propagation method [ required ]
+            * **params["nsteps"]** ( int ): the number of integration steps [ required ]
+            * **params["dt"]** ( double ): the integration time step [ units: a.u. of time, required ]
+            * **params["save_every"]** ( int ): save the data every this many steps [ default: 1 ]
+            * **params["wfc_snapshots"]**, **params["wfc_snap_every"]**, ...: the wavefunction snapshots 
+                settings, see :funct:`save.init_wfc_snapshots`
+            * **params["profiling"]** ( int ): whether to time the phases of the calculations: "saving", "snapshots", 
+                and "integration", see :funct:`profiling.make_timer` [ default: 0 ]
+            * **params["profiling_file"]** ( string ): the name of the HDF5 file where to write the per-step 
+                timings, if params["profiling"] is 2. If None, it is the "data.hdf" file in the `prefix` directory
+                if the `hdf5_output_level` > 0, or the "timings.hdf" file in that directory otherwise [ default: None ]
+
+        model_params ( dictionary ): parameters of the model Hamiltonian
+        savers ( dictionary ): { "hdf5_saver":..., "txt_saver":..., "mem_saver":... } the saver objects or None,
+            optionally "wfc_snapshots": the name of the wavefunction snapshots file or None
+
+    """
     
     integrators_map = {"SOFT": 0,
                        "direct_dia": 1,
@@ -157,7 +314,62 @@ def run_dynamics(wfc, params, model_params, savers):
     print_freq = int(params["progress_frequency"]*nsteps)    
     dt = params["dt"]    
     masses = Py2Cpp_double(params["masses"])    
+
+    save_every = 1
+    if "save_every" in params.keys():
+        save_every = params["save_every"]
+
+    # Profiling: when it is disabled, the timer does nothing
+    timer = profiling.make_timer(params)
     
+    
+    #================ Representations needed by the savers ===================
+    mem_prms = dict(params)
+    if savers["mem_saver"] != None:
+        mem_prms["hdf5_output_level"] = mem_prms["mem_output_level"]
+
+    needed = {"dia":False, "adi":False, "reci_dia":False, "reci_adi":False}
+    for saver, prms in [ (savers["hdf5_saver"], params), (savers["mem_saver"], mem_prms) ]:
+        for key, val in save.required_representations(saver, prms).items():
+            needed[key] = needed[key] or val
+
+    # The wavefunction snapshots
+    snap_file = None
+    if "wfc_snapshots" in savers.keys():
+        snap_file = savers["wfc_snapshots"]
+
+    snap_needed = {"dia":False, "adi":False, "reci_dia":False, "reci_adi":False}
+    if snap_file != None:
+        for name in params["wfc_snapshots"]:
+            snap_needed[ {"PSI_dia":"dia", "PSI_adi":"adi", "reciPSI_dia":"reci_dia", "reciPSI_adi":"reci_adi"}[name] ] = True
+        snap_needed["dia"] = snap_needed["dia"] or snap_needed["reci_dia"]
+        snap_needed["adi"] = snap_needed["adi"] or snap_needed["reci_adi"]
+
+    # The reciprocal-space functions are computed from the real-space ones
+    needed["dia"] = needed["dia"] or needed["reci_dia"]
+    needed["adi"] = needed["adi"] or needed["reci_adi"]
+
+    # Which representations are outdated - all are assumed consistent at the beginning
+    dirty = {"dia":False, "adi":False, "reci_dia":False, "reci_adi":False}
+
+
+    def _update_representations(which):
+        if which["adi"] and dirty["adi"]:
+            wfc.update_adiabatic()
+            dirty["adi"] = False
+
+        if which["dia"] and dirty["dia"]:
+            wfc.update_diabatic()
+            dirty["dia"] = False
+
+        if which["reci_dia"] and dirty["reci_dia"]:
+            wfc.update_reciprocal(0)  # update reci of diabatic function
+            dirty["reci_dia"] = False
+
+        if which["reci_adi"] and dirty["reci_adi"]:
+            wfc.update_reciprocal(1)  # update reci of adiabatic function
+            dirty["reci_adi"] = False
+
             
     
     #================ Special setups ===================
@@ -184,61 +396,85 @@ def run_dynamics(wfc, params, model_params, savers):
         if step%print_freq==0:
             print(F" step= {step}")
             
-        # Save properties
-        if savers["hdf5_saver"] != None:            
-            save.save_data_hdf5(step, wfc, savers["hdf5_saver"], params)
+        if step%save_every==0:
+            with timer.phase("saving"):
+                # Bring the needed representations up to date
+                _update_representations(needed)
+
+                # Save properties
+                if savers["hdf5_saver"] != None:            
+                    save.save_data_hdf5(step, wfc, savers["hdf5_saver"], params)
             
-        if savers["txt_saver"] != None:            
-            pass
-            #save_data_txt(step, wfc, savers["txt_saver"], params)
+                if savers["txt_saver"] != None:            
+                    pass
+                    #save_data_txt(step, wfc, savers["txt_saver"], params)
             
-        if savers["mem_saver"] != None:            
-            prms = dict(params)
-            prms["hdf5_output_level"] = prms["mem_output_level"]
-            save.save_data_hdf5(step, wfc, savers["mem_saver"], prms)
+                if savers["mem_saver"] != None:            
+                    save.save_data_hdf5(step, wfc, savers["mem_saver"], mem_prms)
+
+        if snap_file != None and step%params["wfc_snap_every"]==0:
+            with timer.phase("snapshots"):
+                _update_representations(snap_needed)
+                save.save_wfc_snapshot(step, wfc, snap_file, params)
     
         #================ Integration ==================
     
-        if integrator_id==0:  # SOFT            
-            wfc.SOFT_propagate()      # evolve the diabatic wfc 
+        with timer.phase("integration"):
+            if integrator_id==0:  # SOFT            
+                wfc.SOFT_propagate()      # evolve the diabatic wfc 
             
-        elif integrator_id == 1: # direct_dia
-            if step==0:            
-                wfc.direct_propagate_dia1(dt, masses)                           
-            else:
-                wfc.direct_propagate_dia2(dt, masses)                          
+            elif integrator_id == 1: # direct_dia
+                if step==0:            
+                    wfc.direct_propagate_dia1(dt, masses)                           
+                else:
+                    wfc.direct_propagate_dia2(dt, masses)                          
                 
-        elif integrator_id == 2: # direct_adi
-            if step==0:            
-                wfc.direct_propagate_adi1(dt, masses)                           
-            else:
-                wfc.direct_propagate_adi2(dt, masses)                                          
+            elif integrator_id == 2: # direct_adi
+                if step==0:            
+                    wfc.direct_propagate_adi1(dt, masses)                           
+                else:
+                    wfc.direct_propagate_adi2(dt, masses)                                          
                 
-        elif integrator_id == 3: # Colbert-Miller_dia        
-            if step==0:            
-                wfc.Colbert_Miller_propagate_dia1(dt, masses)                           
-            else:
-                wfc.Colbert_Miller_propagate_dia2(dt, masses)                          
-
-        elif integrator_id == 4: # Colbert-Miller_adi        
-            if step==0:            
-                wfc.Colbert_Miller_propagate_adi1(dt, masses)                           
-            else:
-                wfc.Colbert_Miller_propagate_adi2(dt, masses)                                          
-
-        elif integrator_id == 5: # Colbert-Miller_SOFT        
-            wfc.Colbert_Miller_SOFT(expT, expV, 0)    
+            elif integrator_id == 3: # Colbert-Miller_dia        
+                if step==0:            
+                    wfc.Colbert_Miller_propagate_dia1(dt, masses)                           
+                else:
+                    wfc.Colbert_Miller_propagate_dia2(dt, masses)                          
+
+            elif integrator_id == 4: # Colbert-Miller_adi        
+                if step==0:            
+                    wfc.Colbert_Miller_propagate_adi1(dt, masses)                           
+                else:
+                    wfc.Colbert_Miller_propagate_adi2(dt, masses)                                          
+
+            elif integrator_id == 5: # Colbert-Miller_SOFT        
+                wfc.Colbert_Miller_SOFT(expT, expV, 0)    
             
             
-        #============= Update other variables ================
+        #============= Mark other variables as outdated ================
         if integrator_id in [0, 1, 3, 5]:
-            wfc.update_adiabatic()  
+            dirty["adi"] = True
             
         if integrator_id in [2, 4]:
-            wfc.update_diabatic()              
+            dirty["dia"] = True
         
-        wfc.update_reciprocal(0)  # update reci of diabatic function
-        wfc.update_reciprocal(1)  # update reci of adiabatic function
+        dirty["reci_dia"] = True
+        dirty["reci_adi"] = True
+
+        timer.end_step()
+
+
+    #============= Leave the wavefunction in a consistent state ================
+    _update_representations({"dia":True, "adi":True, "reci_dia":True, "reci_adi":True})
+
+    profiling_file = None
+    if "profiling_file" in params.keys():
+        profiling_file = params["profiling_file"]
+    if profiling_file == None and "prefix" in params.keys():
+        profiling_file = F"{params['prefix']}/timings.hdf"
+        if savers["hdf5_saver"] != None:
+            profiling_file = F"{params['prefix']}/data.hdf"
+    timer.summarize(profiling_file, "Exact dynamics timings")
         
 
 
@@ -266,6 +502,11 @@ def run_relaxation(_params, _potential, model_params):
     print_freq = int(params["progress_frequency"]*nsteps)    
     params.update({"nstates":nstates})
 
+    # The number of the saved data points
+    if "save_every" not in params.keys():
+        params.update({"save_every":1})
+    nsaves = (nsteps + params["save_every"] - 1) // params["save_every"]
+
 
     ncustom_pops = 0
     if "custom_pops" not in params.keys():
@@ -310,9 +551,9 @@ def run_relaxation(_params, _potential, model_params):
     if hdf5_output_level > 0:                
         hdf5_saver = data_savers.hdf5_saver(F"{prefix}/data.hdf", properties_to_save) 
         hdf5_saver.set_compression_level(params["use_compression"], params["compression_level"])
-        save.exact_init_hdf5(hdf5_saver, hdf5_output_level, nsteps, ndof, nstates, ngrid)
+        save.exact_init_hdf5(hdf5_saver, hdf5_output_level, nsaves, ndof, nstates, ngrid)
         if ncustom_pops > 0:
-            save.exact_init_custom_hdf5(hdf5_saver, nsteps, ncustom_pops, nstates)  # boxed populations on adiabatic/diabatic states
+            save.exact_init_custom_hdf5(hdf5_saver, nsaves, ncustom_pops, nstates)  # boxed populations on adiabatic/diabatic states
 
     #====== TXT ========
     txt_saver = None
@@ -325,12 +566,20 @@ def run_relaxation(_params, _potential, model_params):
 
     if mem_output_level > 0:
         mem_saver =  data_savers.mem_saver(properties_to_save)
-        save.exact_init_hdf5(mem_saver, mem_output_level, nsteps, ndof, nstates, ngrid)
+        save.exact_init_hdf5(mem_saver, mem_output_level, nsaves, ndof, nstates, ngrid)
         if ncustom_pops > 0:
-            save.exact_init_custom_hdf5(mem_saver, nsteps, ncustom_pops, nstates)  # boxed populations on adiabatic/diabatic states
+            save.exact_init_custom_hdf5(mem_saver, nsaves, ncustom_pops, nstates)  # boxed populations on adiabatic/diabatic states
+
+                         
+    #====== Wavefunction snapshots =========
+    snap_file = None
+    if "wfc_snapshots" in params.keys():
+        if len(params["wfc_snapshots"]) > 0:
+            snap_file = F"{prefix}/wfc_snaps.hdf"
+            save.init_wfc_snapshots(snap_file, wfc, params)
 
                          
-    savers = {"hdf5_saver":hdf5_saver, "txt_saver":txt_saver, "mem_saver":mem_saver }
+    savers = {"hdf5_saver":hdf5_saver, "txt_saver":txt_saver, "mem_saver":mem_saver, "wfc_snapshots":snap_file }
     
 
     #==================== Dynamics ======================    
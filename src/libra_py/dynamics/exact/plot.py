@@ -40,7 +40,6 @@ import copy
 
 import h5py
 import numpy as np
-import matplotlib.pyplot as plt   # plots
 
 if sys.platform=="cygwin":
     from cyglibra_core import *
@@ -67,6 +66,8 @@ def plot_mem(res, _params, model_params, plot_params):
         
     """
 
+    import matplotlib.pyplot as plt
+
     colors = {}
 
     colors.update({"11": "#8b1a0e"})  # red       
@@ -241,7 +242,7 @@ def plot_mem(res, _params, model_params, plot_params):
 
 
 
-def plot_hdf5(plot_params, ax=plt, use_default_ax=True):
+def plot_hdf5(plot_params, ax=None, use_default_ax=True):
     """
     This function is meant to plot the results stored in the hdf files generated by the exact dynamics runs
 
@@ -259,6 +260,10 @@ def plot_hdf5(plot_params, ax=plt, use_default_ax=True):
 
     """
 
+    if ax is None:
+        import matplotlib.pyplot as plt
+        ax = plt
+
     if use_default_ax==True:    
         ax.rc('axes', titlesize=24)      # fontsize of the axes title
         ax.rc('axes', labelsize=20)      # fontsize of the x and y labels
@@ -615,6 +620,7 @@ def make_animation_1D(prefix, snaps, states, outname, plt_params,
     """
 
     import imageio
+    import matplotlib.pyplot as plt
     
     if data_type1 not in ["wfcr", "wfck"]:
         print(F"data_type1 should be one of the following: \"wfcr\", \"wfck\" ")
@@ -802,6 +808,7 @@ def make_animation_2D(prefix, snaps, state, outname, plt_params,
     """
 
     import imageio 
+    import matplotlib.pyplot as plt
     
     if data_type1 not in ["wfcr", "wfck"]:
         print(F"data_type1 should be one of the following: \"wfcr\", \"wfck\" ")
@@ -832,4 +839,152 @@ def make_animation_2D(prefix, snaps, state, outname, plt_params,
         for filename in set(filenames):
             os.remove(filename)
 
-        
\ No newline at end of file
+                
+
+
+def read_wfc_snapshot_steps(filename):
+    """
+    Reads the indices of the steps at which the wavefunction snapshots are stored 
+    by the `save.save_wfc_snapshot` function
+
+    Args: 
+        filename ( string ) : the name of the HDF5 file with the snapshots
+
+    Returns: 
+        numpy.array(nsnaps): the indices of the stored steps
+
+    """
+
+    with h5py.File(filename, 'r') as f:
+        return f["timestep"][:]
+
+
+
+def read_wfc_snapshot(filename, name, snap, data_type="dens"):
+    """
+    Reads a single wavefunction snapshot stored by the `save.save_wfc_snapshot` function.
+    Only the requested snapshot is read from the file
+
+    Args: 
+        filename ( string ) : the name of the HDF5 file with the snapshots
+        name ( string ): which wavefunction to read: "PSI_dia", "PSI_adi", "reciPSI_dia", or "reciPSI_adi"
+        snap ( int ) : index of the snapshot (the order in the file, not the step index)
+        data_type ( string ): selector of the data to return: "dens" for the probability density, 
+            "real" for the real component of the wavefunction, "imag" for the imaginary
+            part of the wavefunction, or "wfc" for the complex wavefunction [default: "dens"]
+
+    Returns: 
+        (list of numpy.array, numpy.array): (grids, data), where:
+
+            * grids[idof] ( numpy.array(nkept_idof) ): the real- or reciprocal-space (for "reciPSI_*") grid points along 
+                the dimension idof
+            * data ( numpy.array(nkept_0, ..., nstates) ): the requested data for all states 
+
+    """
+
+    if data_type not in ["real", "imag", "dens", "wfc"]:
+        print(F"data_type should be one of the following: \"real\", \"imag\" \"dens\" \"wfc\" ")
+        sys.exit(0)        
+
+    with h5py.File(filename, 'r') as f:
+
+        psi = f[name][snap]
+        
+        grid_type = "x"
+        if name in ["reciPSI_dia", "reciPSI_adi"]:
+            grid_type = "k"
+        grids = [ f[F"{grid_type}_{idof}"][:] for idof in range(psi.ndim - 1) ]
+
+    if data_type=="dens":
+        data = np.abs(psi)**2
+    elif data_type=="real":
+        data = psi.real
+    elif data_type=="imag":
+        data = psi.imag
+    else:
+        data = psi
+
+    return grids, data
+
+
+
+def plot_wfc_snapshot(ax, plt_params, filename, name, snap, states, data_type="dens"):
+    """
+    This function plots the wavefunctions/probability densities stored in the bulk snapshots file 
+    written during the exact dynamics (see `save.init_wfc_snapshots`). For 1D grids, the selected 
+    states are plotted as lines, for 2D grids - the map of the first of the selected states is plotted
+
+    Args: 
+        ax ( pyplot object ) : the plotting instance
+        plt_params ( dict ) : dictionary containing parameters controlling the plotting of the snapshots,
+            same as in `plot_1D_png` and `plot_2D_png`
+        filename ( string ) : the name of the HDF5 file with the snapshots
+        name ( string ): which wavefunction to plot: "PSI_dia", "PSI_adi", "reciPSI_dia", or "reciPSI_adi"
+        snap ( int ) : index of the snapshot
+        states ( list of ints ): indices of the states to plot
+        data_type ( string ): "dens", "real", or "imag" - see `read_wfc_snapshot` [default: "dens"]
+
+    Returns: 
+        string : the name of the png file produced
+
+    """
+
+    plot_params = dict(plt_params)
+
+    _colors = {}
+    _colors.update({"11": "#8b1a0e"})  # red       
+    _colors.update({"21": "#5e9c36"})  # green
+    _colors.update({"31": "#8A2BE2"})  # blueviolet
+    _colors.update({"41": "#2F4F4F"})  # darkslategray
+    _colors.update({"12": "#FF4500"})  # orangered 
+    _colors.update({"22": "#006400"})  # darkgreen  
+    _colors.update({"32": "#00008B"})  # darkblue  
+
+    _clrs_index = ["11", "21", "31", "41", "12", "22", "32"]
+
+    # Parameters and dimensions
+    critical_params = [  ] 
+    default_params = {  "colors":_colors, "clrs_index":_clrs_index, "colormap":"plasma", "resolution":30j,
+                        "x_size":24, "y_size":24, "title":"Dynamics", 
+                        "x_label":"Coordinate, a.u.", "y_label":"Probability density", 
+                        "labels":[ F"state {i}" for i in states ], "linewidth":[5]*len(states),
+                        "ylim":None, "xlim":None, "show":False, "prefix":"."
+                     }
+    comn.check_input(plot_params, default_params, critical_params)
+
+    grids, data = read_wfc_snapshot(filename, name, snap, data_type)
+    prefix = plot_params["prefix"]
+
+    ax.figure(1, figsize=(plot_params["x_size"], plot_params["y_size"]))
+    ax.subplot(1, 1, 1)
+    ax.title(F"{plot_params['title']}" )
+    ax.xlabel(F"{plot_params['x_label']}")
+    ax.ylabel(F"{plot_params['y_label']}")
+
+    if plot_params["xlim"] != None:
+        ax.xlim( plot_params["xlim"] )
+    if plot_params["ylim"] != None:
+        ax.ylim( plot_params["ylim"] )
+
+    if len(grids)==1:
+        for i, state in enumerate(states):
+            ax.plot(grids[0], data[:, state], label=F"{plot_params['labels'][i]}", 
+                    linewidth=plot_params["linewidth"][i], color = plot_params["colors"][plot_params["clrs_index"][i]])
+            ax.legend()
+
+    elif len(grids)==2:
+        data_visualize.plot_map(ax, grids[0], grids[1], data[:, :, states[0]], 
+                                plot_params["colormap"], plot_params["resolution"])
+
+    else:
+        print(F"plot_wfc_snapshot can only plot 1D and 2D wavefunctions, but the wavefunction has {len(grids)} dimensions")
+        sys.exit(0)
+
+    out_filename = F"{prefix}/{name}_{snap}.png"
+    ax.savefig(out_filename, dpi=300)
+    if plot_params["show"]:
+        ax.show()
+
+    ax.close()
+
+    return out_filename
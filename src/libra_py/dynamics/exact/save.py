@@ -17,8 +17,13 @@
        List of functions:
            * exact_init_hdf5(saver, hdf5_output_level, _nsteps, _ndof, _nstates, _ngrid)
            * exact_init_custom_hdf5(saver, _nsteps, _ncustom_pops, _nstates)
+           * required_representations(saver, params)
            * save_data_hdf5(step, wfc, saver, params)
            * save_data_mem(step, wfc, saver, params)
+           * wfc_snapshot_indices(wfc, spatial_stride)
+           * wfc2nparray(wfc, name, indx=None)
+           * init_wfc_snapshots(filename, wfc, params)
+           * save_wfc_snapshot(step, wfc, filename, params)
 
 
 .. moduleauthor:: Alexey V. Akimov
@@ -40,11 +45,16 @@ import sys
 import math
 import copy
 
+import numpy as np
+
 if sys.platform=="cygwin":
     from cyglibra_core import *
 elif sys.platform=="linux" or sys.platform=="linux2":
     from liblibra_core import *
 
+import util.libutil as comn
+import libra_py.data_conv as data_conv
+
 
 #===================== Exact calculations output ====================
 
@@ -151,70 +161,170 @@ def exact_init_custom_hdf5(saver, _nsteps, _ncustom_pops, _nstates):
 
 
 
+def required_representations(saver, params):
+    """
+    Determine which representations of the wavefunction are needed by a saver
+
+    Args:
+        saver ( hdf5_saver or mem_saver ): the saver object, only the properties listed in its 
+            `keywords` member are considered
+        params ( dictionary ): parameters of the simulation, only the "hdf5_output_level" and 
+            "custom_pops" keys are used here
+
+    Returns:
+        dictionary: { "dia":bool, "adi":bool, "reci_dia":bool, "reci_adi":bool } - the flags 
+            telling whether the real-space (dia, adi) and reciprocal-space (reci_dia, reci_adi) 
+            wavefunctions in the diabatic and adiabatic representations must be up to date 
+            in order to compute all the properties this saver stores
+
+    """
+
+    res = {"dia":False, "adi":False, "reci_dia":False, "reci_adi":False}
+
+    if saver == None:
+        return res
+
+    hdf5_output_level = params["hdf5_output_level"]
+    keywords = saver.keywords
+
+    # Properties that use the real-space wavefunction
+    real_space = []
+    # Properties that use the reciprocal-space wavefunction
+    reci_space = []
+
+    if hdf5_output_level>=1:
+        real_space += ["Epot", "Etot", "norm"]
+        reci_space += ["Ekin", "Etot"]
+
+    if hdf5_output_level>=2:
+        real_space += ["pop", "q", "q2"]
+        reci_space += ["p", "p2"]
+
+    if hdf5_output_level>=3:
+        real_space += ["denmat"]
+
+    if hdf5_output_level>=4:
+        real_space += ["PSI"]
+        reci_space += ["reciPSI"]
+
+    for rep in ["dia", "adi"]:
+        for prop in real_space:
+            if F"{prop}_{rep}" in keywords:
+                res[rep] = True
+        for prop in reci_space:
+            if F"{prop}_{rep}" in keywords:
+                res[F"reci_{rep}"] = True
+
+    if hdf5_output_level>=2 and "custom_pops" in keywords and "custom_pops" in params.keys():
+        if params["custom_pops"] != None:
+            for pop_prms in params["custom_pops"]:
+                res[ ["dia", "adi"][pop_prms[0]] ] = True
+
+    return res
+
+
+
 def save_data_hdf5(step, wfc, saver, params):
+    """
+    Saves the properties of the wavefunction at a given step
+
+    Only the properties listed in the `keywords` of the saver are computed, so 
+    the representations not needed by the saver may be outdated (see `required_representations`)
+
+    Args:
+        step ( int ): the index of the current simulation step
+        wfc ( Wfcgrid2 ): the wavefunction object
+        saver ( hdf5_saver or mem_saver ): the saver object
+        params ( dictionary ): parameters of the simulation, in addition to the "dt", "masses", 
+            "hdf5_output_level", and "custom_pops" keys this function uses:
+
+            * **params["save_every"]** ( int ): the data are stored at the record step // save_every  [ default: 1 ]
+
+    """
     
     dt = params["dt"]    
     masses = Py2Cpp_double(params["masses"])
     hdf5_output_level = params["hdf5_output_level"]
+    keywords = saver.keywords
+
+    save_every = 1
+    if "save_every" in params.keys():
+        save_every = params["save_every"]
+    istep = step // save_every
     
     if hdf5_output_level>=1:
-        saver.save_scalar(step, "timestep", step) 
-        saver.save_scalar(step, "time", step * dt)        
-        saver.save_scalar(step, "Ekin_dia", wfc.e_kin(masses, 0)) 
-        saver.save_scalar(step, "Ekin_adi", wfc.e_kin(masses, 1))         
-        saver.save_scalar(step, "Epot_dia", wfc.e_pot(0)) 
-        saver.save_scalar(step, "Epot_adi", wfc.e_pot(1))         
-        saver.save_scalar(step, "Etot_dia", wfc.e_tot(masses, 0)) 
-        saver.save_scalar(step, "Etot_adi", wfc.e_tot(masses, 1))                 
-        saver.save_scalar(step, "norm_dia", wfc.norm(0) )
-        saver.save_scalar(step, "norm_adi", wfc.norm(1) )
+        scalars = { "timestep": lambda: step,
+                    "time": lambda: step * dt,
+                    "Ekin_dia": lambda: wfc.e_kin(masses, 0),
+                    "Ekin_adi": lambda: wfc.e_kin(masses, 1),
+                    "Epot_dia": lambda: wfc.e_pot(0),
+                    "Epot_adi": lambda: wfc.e_pot(1),
+                    "Etot_dia": lambda: wfc.e_tot(masses, 0),
+                    "Etot_adi": lambda: wfc.e_tot(masses, 1),
+                    "norm_dia": lambda: wfc.norm(0),
+                    "norm_adi": lambda: wfc.norm(1)
+                  }
+        for name, func in scalars.items():
+            if name in keywords:
+                saver.save_scalar(istep, name, func() )
         
         
     if hdf5_output_level>=2:    
 
-        saver.save_matrix(step, "pop_dia", wfc.get_pops(0) ) 
-        saver.save_matrix(step, "pop_adi", wfc.get_pops(1) )     
-        saver.save_matrix(step, "q_dia", wfc.get_pow_q(0, 1) ) 
-        saver.save_matrix(step, "q_adi", wfc.get_pow_q(1, 1) )         
-        saver.save_matrix(step, "q2_dia", wfc.get_pow_q(0, 2) ) 
-        saver.save_matrix(step, "q2_adi", wfc.get_pow_q(1, 2) )         
-        saver.save_matrix(step, "p_dia", wfc.get_pow_p(0, 1) ) 
-        saver.save_matrix(step, "p_adi", wfc.get_pow_p(1, 1) )         
-        saver.save_matrix(step, "p2_dia", wfc.get_pow_p(0, 2) ) 
-        saver.save_matrix(step, "p2_adi", wfc.get_pow_p(1, 2) ) 
-
-        if "custom_pops" in params.keys():
+        matrices = { "pop_dia": lambda: wfc.get_pops(0),
+                     "pop_adi": lambda: wfc.get_pops(1),
+                     "q_dia": lambda: wfc.get_pow_q(0, 1),
+                     "q_adi": lambda: wfc.get_pow_q(1, 1),
+                     "q2_dia": lambda: wfc.get_pow_q(0, 2),
+                     "q2_adi": lambda: wfc.get_pow_q(1, 2),
+                     "p_dia": lambda: wfc.get_pow_p(0, 1),
+                     "p_adi": lambda: wfc.get_pow_p(1, 1),
+                     "p2_dia": lambda: wfc.get_pow_p(0, 2),
+                     "p2_adi": lambda: wfc.get_pow_p(1, 2)
+                   }
+        for name, func in matrices.items():
+            if name in keywords:
+                saver.save_matrix(istep, name, func() )
+
+        if "custom_pops" in params.keys() and "custom_pops" in keywords:
             ncustom_pops = len(params["custom_pops"])
             for pop_type in range(ncustom_pops):
 
                 pop_prms = params["custom_pops"][pop_type]            
                 pop_val = wfc.get_pops(pop_prms[0], Py2Cpp_double(pop_prms[1]), Py2Cpp_double(pop_prms[2])) 
 
-                saver.save_multi_matrix(step, pop_type, "custom_pops",  pop_val )
+                saver.save_multi_matrix(istep, pop_type, "custom_pops",  pop_val )
 
         
         
     if hdf5_output_level>=3:                
-        saver.save_matrix(step, "denmat_dia", wfc.get_den_mat(0) ) 
-        saver.save_matrix(step, "denmat_adi", wfc.get_den_mat(1) ) 
+        if "denmat_dia" in keywords:
+            saver.save_matrix(istep, "denmat_dia", wfc.get_den_mat(0) ) 
+        if "denmat_adi" in keywords:
+            saver.save_matrix(istep, "denmat_adi", wfc.get_den_mat(1) ) 
         
         
     if hdf5_output_level>=4:                
         """
         This is a REALLY-REALLY bad option to go since it is soo time-consuming
+        Consider using the bulk snapshots instead, see `init_wfc_snapshots`
         """
         
-        for ipt in range(wfc.Npts):
-            saver.save_multi_matrix(step, ipt, "PSI_dia", wfc.PSI_dia[ipt]) 
+        if "PSI_dia" in keywords:
+            for ipt in range(wfc.Npts):
+                saver.save_multi_matrix(istep, ipt, "PSI_dia", wfc.PSI_dia[ipt]) 
             
-        for ipt in range(wfc.Npts):            
-            saver.save_multi_matrix(step, ipt, "PSI_adi", wfc.PSI_adi[ipt]) 
+        if "PSI_adi" in keywords:
+            for ipt in range(wfc.Npts):            
+                saver.save_multi_matrix(istep, ipt, "PSI_adi", wfc.PSI_adi[ipt]) 
             
-        for ipt in range(wfc.Npts):
-            saver.save_multi_matrix(step, ipt, "reciPSI_dia", wfc.reciPSI_dia[ipt]) 
+        if "reciPSI_dia" in keywords:
+            for ipt in range(wfc.Npts):
+                saver.save_multi_matrix(istep, ipt, "reciPSI_dia", wfc.reciPSI_dia[ipt]) 
             
-        for ipt in range(wfc.Npts):            
-            saver.save_multi_matrix(step, ipt, "reciPSI_adi", wfc.reciPSI_adi[ipt])             
+        if "reciPSI_adi" in keywords:
+            for ipt in range(wfc.Npts):            
+                saver.save_multi_matrix(istep, ipt, "reciPSI_adi", wfc.reciPSI_adi[ipt])             
 
 
             
@@ -262,3 +372,158 @@ def save_data_mem(step, wfc, saver, params):
         
 
 
+
+
+
+
+#===================== Bulk wavefunction snapshots ====================
+
+def wfc_snapshot_indices(wfc, spatial_stride):
+    """
+    Computes the indices of the grid points kept in the down-sampled wavefunction snapshots
+
+    Args:
+        wfc ( Wfcgrid2 ): the wavefunction object
+        spatial_stride ( int or list of ints ): keep every `spatial_stride`-th point along 
+            each dimension (or along each given dimension, if a list)
+
+    Returns:
+        (list of numpy.array, numpy.array): (indx, flat), where:
+
+            * indx[idof] ( numpy.array(nkept_idof) ): the indices of the points kept along the dimension idof
+            * flat ( numpy.array(nkept) ): the global (as in `gmap`) indices of the kept points, ordered
+                such that the result can be reshaped into (nkept_0, nkept_1, ...) array
+
+    """
+
+    npts = list(wfc.npts)
+    ndof = len(npts)
+
+    if isinstance(spatial_stride, int):
+        spatial_stride = [spatial_stride] * ndof
+
+    indx = [ np.arange(0, npts[idof], spatial_stride[idof]) for idof in range(ndof) ]
+    flat = np.ravel_multi_index( np.meshgrid(*indx, indexing="ij"), npts ).ravel()
+
+    return indx, flat
+
+
+
+def wfc2nparray(wfc, name, indx=None):
+    """
+    Extracts the grid wavefunction into a numpy array
+
+    Args:
+        wfc ( Wfcgrid2 ): the wavefunction object
+        name ( string ): which wavefunction to extract: "PSI_dia", "PSI_adi", "reciPSI_dia", or "reciPSI_adi"
+        indx ( numpy.array of ints ): the global indices of the grid points to extract. If None, 
+            all the points are extracted [ default: None ]
+
+    Returns:
+        numpy.array(nkept, nstates): the wavefunction amplitudes at the selected grid points
+
+    """
+
+    psi = getattr(wfc, name)
+    nstates = wfc.nstates
+
+    if indx is None:
+        indx = range(wfc.Npts)
+
+    # Each point holds a CMATRIX(nstates, 1), copied in bulk
+    return data_conv.MATRIXList2nparray( [ psi[int(ipt)] for ipt in indx ] ).reshape(len(indx), nstates)
+
+
+
+def init_wfc_snapshots(filename, wfc, params):
+    """
+    Creates an HDF5 file for storing the wavefunction snapshots. Unlike the level 4 output 
+    of :funct:`save_data_hdf5`, the whole (down-sampled) grid wavefunction is written as one 
+    contiguous array per stored step
+
+    Args:
+        filename ( string ): the name of the file to create
+        wfc ( Wfcgrid2 ): the wavefunction object, defines the grid
+        params ( dictionary ): parameters of the simulation, in particular:
+
+            * **params["wfc_snapshots"]** ( list of strings ): which wavefunctions to store, any of 
+                "PSI_dia", "PSI_adi", "reciPSI_dia", "reciPSI_adi" [ default: [] ]
+            * **params["wfc_snap_every"]** ( int ): store the snapshots every this many steps [ default: 1 ]
+            * **params["wfc_snap_spatial_stride"]** ( int or list of ints ): keep every n-th grid point 
+                along each dimension [ default: 1 ]
+            * **params["wfc_snap_single_precision"]** ( Boolean ): store the data as complex64 instead
+                of complex128 [ default: False ]
+            * **params["dt"]** ( double ): the integration time step [ units: a.u. of time ]
+
+    Returns:
+        None
+
+    Note:
+        For each stored wavefunction the file has a dataset of dimensions (nsnaps, nkept_0, ..., nstates).
+        The dataset "timestep" contains the indices of the stored steps, the datasets "x_<idof>" 
+        and "k_<idof>" contain the real- and reciprocal-space grids along each dimension 
+
+    """
+
+    import h5py
+
+    default_params = { "wfc_snapshots":[], "wfc_snap_every":1, "wfc_snap_spatial_stride":1, 
+                       "wfc_snap_single_precision":False }
+    comn.check_input(params, default_params, [])
+
+    indx, flat = wfc_snapshot_indices(wfc, params["wfc_snap_spatial_stride"])
+    shape = tuple( [len(x) for x in indx] + [wfc.nstates] )
+
+    dtype = complex
+    if params["wfc_snap_single_precision"]:
+        dtype = np.complex64
+
+    rmin, dr = list(wfc.rmin), list(wfc.dr)
+    kmin, dk = list(wfc.kmin), list(wfc.dk)
+
+    with h5py.File(filename, "w") as f:
+        f.attrs["dt"] = params["dt"]
+        f.attrs["snap_every"] = params["wfc_snap_every"]
+        f.attrs["npts"] = list(wfc.npts)
+
+        for idof in range(len(indx)):
+            f.create_dataset(F"x_{idof}", data = rmin[idof] + indx[idof] * dr[idof])
+            f.create_dataset(F"k_{idof}", data = kmin[idof] + indx[idof] * dk[idof])
+
+        f.create_dataset("timestep", (0,), dtype=int, maxshape=(None,))
+
+        for name in params["wfc_snapshots"]:
+            f.create_dataset(name, (0,) + shape, dtype=dtype, maxshape=(None,) + shape, chunks=(1,) + shape)
+
+
+
+def save_wfc_snapshot(step, wfc, filename, params):
+    """
+    Appends the wavefunction snapshots to the file created by :funct:`init_wfc_snapshots`
+
+    Args:
+        step ( int ): the index of the current simulation step
+        wfc ( Wfcgrid2 ): the wavefunction object, the stored representations must be up to date
+        filename ( string ): the name of the snapshots file
+        params ( dictionary ): parameters of the simulation, see :funct:`init_wfc_snapshots`
+
+    Returns:
+        None
+
+    """
+
+    import h5py
+
+    indx, flat = wfc_snapshot_indices(wfc, params["wfc_snap_spatial_stride"])
+    shape = tuple( [len(x) for x in indx] + [wfc.nstates] )
+
+    with h5py.File(filename, "a") as f:
+        isnap = f["timestep"].shape[0]
+        f["timestep"].resize( (isnap+1,) )
+        f["timestep"][isnap] = step
+
+        for name in params["wfc_snapshots"]:
+            data = wfc2nparray(wfc, name, flat).reshape(shape)
+            f[name].resize( (isnap+1,) + shape )
+            f[name][isnap] = data
+
@@ -15,6 +15,10 @@
        https://github.com/subotnikgroup/HEOM_Amber
 
        List of functions:
+           * update_filters(rho_scaled, params, aux_memory)
+           * transform_adm(rho, rho_scaled, aux_memory, params, direction)
+           * dopri5_step(rho, h, k1, params)
+           * dopri5_interpolate(dense, theta)
            * run_dynamics(dyn_params, Ham, rho_init)
 
 .. moduleauthors:: Alexey V. Akimov
@@ -47,6 +51,7 @@ elif sys.platform=="linux" or sys.platform=="linux2":
 
 import util.libutil as comn
 import libra_py.units as units
+import libra_py.profiling as profiling
 from . import save
 
 def aux_print_matrices(step, x):
@@ -95,7 +100,9 @@ def update_filters(rho_scaled, params, aux_memory):
     # Filtering of the densities - defines the list of nonzero derivatives, params["nonzero"]
     params["nonzero"] = filter(aux_memory["rho_unpacked_scaled"], trash, params["adm_tolerance"], params["do_zeroing"])
 
-    pack_mtx(aux_memory["rho_unpacked_scaled"], rho_scaled)
+    # The ADMs are modified only if they are zeroed, otherwise there is nothing to pack back
+    if params["do_zeroing"]:
+        pack_mtx(aux_memory["rho_unpacked_scaled"], rho_scaled)
 
 
 
@@ -148,6 +155,97 @@ def transform_adm(rho, rho_scaled, aux_memory, params, direction):
         pack_mtx(aux_memory["rho_unpacked"], rho)
 
 
+
+# Dormand-Prince 5(4) tableau
+_dp_c = [0.0, 1.0/5.0, 3.0/10.0, 4.0/5.0, 8.0/9.0, 1.0, 1.0]
+_dp_a = [ [],
+          [1.0/5.0],
+          [3.0/40.0, 9.0/40.0],
+          [44.0/45.0, -56.0/15.0, 32.0/9.0],
+          [19372.0/6561.0, -25360.0/2187.0, 64448.0/6561.0, -212.0/729.0],
+          [9017.0/3168.0, -355.0/33.0, 46732.0/5247.0, 49.0/176.0, -5103.0/18656.0],
+          [35.0/384.0, 0.0, 500.0/1113.0, 125.0/192.0, -2187.0/6784.0, 11.0/84.0]
+        ]
+# Difference between the 5-th and 4-th order weights - for the error estimate
+_dp_e = [71.0/57600.0, 0.0, -71.0/16695.0, 71.0/1920.0, -17253.0/339200.0, 22.0/525.0, -1.0/40.0]
+# Dense output coefficients (Hairer, Norsett, Wanner)
+_dp_d = [-12715105075.0/11282082432.0, 0.0, 87487479700.0/32700410799.0, -10690763975.0/1880347072.0,
+         701980252875.0/199316789632.0, -1453857185.0/822651844.0, 69997945.0/29380423.0]
+
+
+def dopri5_step(rho, h, k1, params):
+    """
+    Makes one step of the Dormand-Prince 5(4) embedded Runge-Kutta integration of HEOM
+
+    Args:
+        rho ( CMATRIX(nn_tot*nquant, nquant) ): the stacked scaled ADMs at the beginning of the step
+        h ( double ): the integration step [ units: a.u. of time ]
+        k1 ( CMATRIX(nn_tot*nquant, nquant) ): the time-derivative of rho at the beginning of the step
+        params ( dictionary ): the HEOM parameters, as used by `compute_heom_derivatives`
+
+    Returns:
+        (CMATRIX, CMATRIX, double, list): (rho_new, k7, err, dense), where:
+
+            * rho_new ( CMATRIX ): the 5-th order solution at the end of the step
+            * k7 ( CMATRIX ): the time-derivative at the end of the step (to be reused for the next step)
+            * err ( double ): the scaled error estimate, the step is acceptable if err <= 1
+            * dense ( list of CMATRIX ): the coefficients for the dense output, see `dopri5_interpolate`
+
+    """
+
+    k = [k1]
+    for i in range(1, 7):
+        y = CMATRIX(rho)
+        for j in range(i):
+            if _dp_a[i][j] != 0.0:
+                y = y + (h * _dp_a[i][j]) * k[j]
+        k.append( compute_heom_derivatives(y, params) )
+
+    # The 7-th stage is evaluated exactly at the 5-th order solution
+    rho_new = y
+
+    err_mtx = CMATRIX(rho.num_of_rows, rho.num_of_cols)
+    for i in range(7):
+        if _dp_e[i] != 0.0:
+            err_mtx = err_mtx + (h * _dp_e[i]) * k[i]
+
+    scale = params["atol"] + params["rtol"] * max( abs(rho.max_elt()), abs(rho_new.max_elt()) )
+    err = abs(err_mtx.max_elt()) / scale
+
+    # Dense output
+    r1 = CMATRIX(rho)
+    r2 = rho_new - rho
+    r3 = h * k[0] - r2
+    r4 = r2 - h * k[6] - r3
+    r5 = CMATRIX(rho.num_of_rows, rho.num_of_cols)
+    for i in range(7):
+        if _dp_d[i] != 0.0:
+            r5 = r5 + (h * _dp_d[i]) * k[i]
+
+    return rho_new, k[6], err, [r1, r2, r3, r4, r5]
+
+
+
+def dopri5_interpolate(dense, theta):
+    """
+    Computes the 4-th order continuous extension of the Dormand-Prince step
+
+    Args:
+        dense ( list of CMATRIX ): the coefficients computed by `dopri5_step`
+        theta ( double ): the fraction of the step, between 0 and 1
+
+    Returns:
+        CMATRIX: the interpolated stacked ADMs at the time t + theta * h
+
+    """
+
+    r1, r2, r3, r4, r5 = dense
+    theta1 = 1.0 - theta
+
+    return r1 + theta * (r2 + theta1 * (r3 + theta * (r4 + theta1 * r5)))
+
+
+
 def run_dynamics(dyn_params, Ham, rho_init):
 
     """
@@ -232,6 +330,26 @@ def run_dynamics(dyn_params, Ham, rho_init):
             * **dyn_params["num_threads"]** ( int )
                 The number of OMP threads to use to parallelize the calculations [ default: 1 ]
 
+            * **dyn_params["integrator"]** ( string )
+                The method to integrate the HEOM. Options are:
+
+                - "RK4" : the fixed-step 4-th order Runge-Kutta with the time step `dt` [ default ]
+                - "DOPRI5" : the adaptive Dormand-Prince 5(4) method with the automatic step size control;
+                    in this case `dt` defines only the time interval between the saved data points, the results
+                    are interpolated on this grid of times
+
+            * **dyn_params["rtol"]** ( float )
+                Relative error tolerance of the adaptive integrator [ default: 1e-6 ]
+
+            * **dyn_params["atol"]** ( float )
+                Absolute error tolerance of the adaptive integrator [ default: 1e-9 ]
+
+            * **dyn_params["dt_min"]** ( float )
+                The smallest time step allowed for the adaptive integrator [ units: a.u. of time, default: 1e-6 * dt ]
+
+            * **dyn_params["dt_max"]** ( float )
+                The largest time step allowed for the adaptive integrator [ units: a.u. of time, default: 100 * dt ]
+
             =============== Parameters for saving data ================
 
             * **dyn_params["prefix"]** ( string )
@@ -279,6 +397,12 @@ def run_dynamics(dyn_params, Ham, rho_init):
                     The density matrix evolution
                     *_output_level >= 3
 
+                - **adm** ( CMATRIX(nn_tot*nstates, nstates) )
+                    All the (unscaled) auxiliary density matrices stacked on top of each other.
+                    Only if this property is requested, the whole hierarchy is unscaled and unpacked
+                    on every step, otherwise only the system's density matrix is extracted
+                    *_output_level >= 4
+
                 [ default: [ "timestep", "time", "denmat" ] ]
 
 
@@ -298,6 +422,23 @@ def run_dynamics(dyn_params, Ham, rho_init):
 
                 [ default: [0,0,0] ]
 
+            * **dyn_params["profiling"]** ( int )
+                Whether to time the phases of the calculations, see :funct:`profiling.make_timer`
+                Options:
+
+                - 0 : no profiling [ default ]
+                - 1 : print out the table of the times spent in each phase at the end of the calculations
+                - 2 : same as 1, plus the per-step timings are written into the `profiling_file`
+
+                The phases are: "integration" - the propagation of the ADMs (RK4 steps or adaptive steps), 
+                "saving" - the preparation and saving of the data, "filtering" - the update of the list of the
+                active equations
+
+            * **dyn_params["profiling_file"]** ( string )
+                The name of the HDF5 file where to write the per-step timings (in the "timings" group).
+                If None, the timings are written into the "data.hdf" file in the `prefix` directory if the
+                `hdf5_output_level` > 0, or into the "timings.hdf" file in that directory otherwise [ default: None ]
+
 
 
         Ham ( CMATRIX(nstates, nstates) )
@@ -331,11 +472,13 @@ def run_dynamics(dyn_params, Ham, rho_init):
                        "adm_tolerance":1e-6,  "adm_deriv_tolerance":1e-12,
                        "filter_after_steps":1, "do_zeroing":0,
                        "num_threads":1,
+                       "integrator":"RK4", "rtol":1e-6, "atol":1e-9, "dt_min":None, "dt_max":None,
 
                        "prefix":"out",
                        "hdf5_output_level":0, "txt_output_level":0, "mem_output_level":3,
                        "properties_to_save": [ "timestep", "time", "denmat"],
-                       "use_compression":0, "compression_level":[0,0,0]
+                       "use_compression":0, "compression_level":[0,0,0],
+                       "profiling":0, "profiling_file":None
                      }
 
     comn.check_input(params, default_params, critical_params)
@@ -439,20 +582,92 @@ def run_dynamics(dyn_params, Ham, rho_init):
 
 
     # Initialize savers
-    _savers = save.init_heom_savers(params, nquant)
+    _savers = save.init_heom_savers(params, nquant, nn_tot)
+
+    # Whether we need the whole unscaled hierarchy on every step or just the system's density matrix
+    need_all_adms = params["verbosity"]>=4
+    if "adm" in params["properties_to_save"]:
+        if params["hdf5_output_level"]>=4 or params["mem_output_level"]>=4:
+            need_all_adms = True
+
+    # The system's density matrix is the ADM 0, its scaling factor is always 1,
+    # so it is just the top block of the stacked (scaled) ADMs
+    denmat = CMATRIX(nquant, nquant)
 
     #============== Propagation =============
 
+    # Profiling: when it is disabled, the timer does nothing
+    timer = profiling.make_timer(params)
 
     start = time.time()
+
+    if params["integrator"] not in ["RK4", "DOPRI5"]:
+        print(F"Error in run_dynamics: integrator {params['integrator']} is not available\nExiting...")
+        sys.exit(0)
+
+    adaptive = params["integrator"] == "DOPRI5"
+    if adaptive:
+        dt_min = params["dt_min"]
+        if dt_min == None:
+            dt_min = 1e-6 * params["dt"]
+        dt_max = params["dt_max"]
+        if dt_max == None:
+            dt_max = 100.0 * params["dt"]
+
+        # The integrator state: the current time and ADMs, the derivatives at that point, 
+        # and the dense output of the last accepted step [t_prev, t_curr]
+        t_prev, t_curr, h = 0.0, 0.0, params["dt"]
+        rho_curr = CMATRIX(rho_scaled)
+        k_curr = compute_heom_derivatives(rho_curr, params)
+        dense = None
+        nfev, naccepted, nrejected = 1, 0, 0
+
     for step in range(params["nsteps"]):
 
+        #================ Adaptive propagation up to the current time ==================
+        if adaptive:
+            with timer.phase("integration"):
+                t_target = step * params["dt"]
+
+                while t_curr < t_target - 1e-10 * params["dt"]:
+                    rho_new, k_new, err, dense_new = dopri5_step(rho_curr, h, k_curr, params)
+                    nfev += 6
+
+                    if err <= 1.0 or h <= dt_min:
+                        t_prev, t_curr = t_curr, t_curr + h
+                        rho_curr, k_curr, dense = rho_new, k_new, dense_new
+                        naccepted += 1
+                        fac = 5.0
+                        if err > 0.0:
+                            fac = min(5.0, max(0.2, 0.9 * err**(-0.2)))
+                    else:
+                        nrejected += 1
+                        fac = max(0.2, 0.9 * err**(-0.2))
+
+                    h = min(dt_max, max(dt_min, h * fac))
+
+                if t_curr - t_target < 1e-10 * params["dt"]:
+                    rho_scaled = CMATRIX(rho_curr)
+                else:
+                    rho_scaled = dopri5_interpolate(dense, (t_target - t_prev) / (t_curr - t_prev) )
+
+                if params["verbosity"]>=2:
+                    print(F" step= {step} t= {t_target} accepted= {naccepted} rejected= {nrejected} h= {h}")
+
+
         #================ Saving and printout ===================
-        # scaled -> raw
-        transform_adm(rho, rho_scaled, aux_memory, params, -1)
+        with timer.phase("saving"):
+            if need_all_adms:
+                # scaled -> raw
+                transform_adm(rho, rho_scaled, aux_memory, params, -1)
 
-        # Save the variables
-        save.save_heom_data(_savers, step, print_freq, params, aux_memory["rho_unpacked"])
+                # Save the variables
+                save.save_heom_data(_savers, step, print_freq, params, aux_memory["rho_unpacked"], rho)
+            else:
+                pop_submatrix(rho_scaled, denmat, x_, y_)
+
+                # Save the variables
+                save.save_heom_data(_savers, step, print_freq, params, [denmat])
 
 
         if step%print_freq==0:
@@ -473,21 +688,42 @@ def run_dynamics(dyn_params, Ham, rho_init):
 
         #============== Update the list of active equations = Filtering  ============
         if step % params["filter_after_steps"] == 0:
+            with timer.phase("filtering"):
+                # To assess which equations to discard, lets estimate the time-derivatives of rho
+                # for all the matrices
+                params["adm_list"] = Py2Cpp_int( all_indices )
 
-            # To assess which equations to discard, lets estimate the time-derivatives of rho
-            # for all the matrices
-            params["adm_list"] = Py2Cpp_int( all_indices )
-
-            update_filters(rho_scaled, params, aux_memory)
+                if adaptive:
+                    # The filtering is applied to the current state of the integrator, the set of 
+                    # the equations changes, so the derivatives need to be recomputed
+                    update_filters(rho_curr, params, aux_memory)
+                    k_curr = compute_heom_derivatives(rho_curr, params)
+                    nfev += 2
+                else:
+                    update_filters(rho_scaled, params, aux_memory)
 
 
         #================= Propagation for one timestep ==================================
-        rho_scaled = RK4(rho_scaled, params["dt"], compute_heom_derivatives, params)
+        if not adaptive:
+            with timer.phase("integration"):
+                rho_scaled = RK4(rho_scaled, params["dt"], compute_heom_derivatives, params)
+
+        timer.end_step()
 
 
     end = time.time()
     print(F"Calculations took {end - start} seconds")
 
+    profiling_file = params["profiling_file"]
+    if profiling_file == None:
+        profiling_file = F"{params['prefix']}/timings.hdf"
+        if params["hdf5_output_level"] > 0:
+            profiling_file = F"{params['prefix']}/data.hdf"
+    timer.summarize(profiling_file, "HEOM dynamics timings")
+
+    if adaptive:
+        print(F"Adaptive integration: {naccepted} accepted steps, {nrejected} rejected steps, {nfev} derivative evaluations")
+
 
     # For the mem_saver - store all the results into HDF5 format only at the end of the simulation
     if _savers["mem_saver"] != None:
@@ -15,10 +15,10 @@
        data, you shall add the corresponding info in these modules
 
        List of functions:
-           * init_heom_data(saver, hdf5_output_level, _nsteps, _nquant)
-           * init_heom_savers(params, nquant)
-           * save_heom_hdf5(step, saver, params, denmat)
-           * save_heom_data(_savers, step, print_freq, params, rho_unpacked)
+           * init_heom_data(saver, hdf5_output_level, _nsteps, _nquant, _nadm=None)
+           * init_heom_savers(params, nquant, nadm=None)
+           * save_heom_hdf5(step, saver, params, denmat, adm=None)
+           * save_heom_data(_savers, step, print_freq, params, rho_unpacked, adm=None)
 
 .. moduleauthor:: Alexey V. Akimov
   
@@ -55,7 +55,7 @@ import libra_py.data_savers as data_savers
 
 #===================== HEOM output ====================
 
-def init_heom_data(saver, hdf5_output_level, _nsteps, _nquant):
+def init_heom_data(saver, hdf5_output_level, _nsteps, _nquant, _nadm=None):
 
     if hdf5_output_level>=1:
         # Time axis (integer steps)
@@ -69,12 +69,16 @@ def init_heom_data(saver, hdf5_output_level, _nsteps, _nquant):
         # System's density matrix
         saver.add_dataset("denmat", (_nsteps, _nquant, _nquant), "C") 
 
+    if hdf5_output_level>=4 and _nadm != None:
+        # All the (unscaled) auxiliary density matrices stacked on top of each other
+        saver.add_dataset("adm", (_nsteps, _nadm * _nquant, _nquant), "C") 
 
 
 
 
 
-def init_heom_savers(params, nquant):
+
+def init_heom_savers(params, nquant, nadm=None):
 
     #================ Create savers ==================    
     prefix = params["prefix"]
@@ -85,6 +89,10 @@ def init_heom_savers(params, nquant):
 
     properties_to_save = params["properties_to_save"]
 
+    # The hierarchy is much larger than the density matrix, allocate it only if requested
+    if "adm" not in properties_to_save:
+        nadm = None
+
 
     _savers = {"hdf5_saver":None, "txt_saver":None, "mem_saver":None }
 
@@ -94,7 +102,7 @@ def init_heom_savers(params, nquant):
     if hdf5_output_level > 0:                
         _savers["hdf5_saver"] = data_savers.hdf5_saver(F"{prefix}/data.hdf", properties_to_save) 
         _savers["hdf5_saver"].set_compression_level(params["use_compression"], params["compression_level"])
-        init_heom_data(_savers["hdf5_saver"], hdf5_output_level, params["nsteps"], nquant)
+        init_heom_data(_savers["hdf5_saver"], hdf5_output_level, params["nsteps"], nquant, nadm)
 
     #====== TXT ========
     if params["txt_output_level"] > 0:
@@ -105,7 +113,7 @@ def init_heom_savers(params, nquant):
 
     if mem_output_level > 0:
         _savers["mem_saver"] =  data_savers.mem_saver(properties_to_save)
-        init_heom_data(_savers["mem_saver"], mem_output_level, params["nsteps"], nquant)
+        init_heom_data(_savers["mem_saver"], mem_output_level, params["nsteps"], nquant, nadm)
 
     return _savers                         
     
@@ -114,7 +122,7 @@ def init_heom_savers(params, nquant):
 
 
 
-def save_heom_hdf5(step, saver, params, denmat):
+def save_heom_hdf5(step, saver, params, denmat, adm=None):
     
     dt = params["dt"]    
     hdf5_output_level = params["hdf5_output_level"]
@@ -131,9 +139,13 @@ def save_heom_hdf5(step, saver, params, denmat):
         # Average adiabatic density matrices
         saver.save_matrix(step, "denmat", denmat) 
 
+    if hdf5_output_level>=4 and adm != None:
+        # The whole hierarchy
+        saver.save_matrix(step, "adm", adm) 
+
 
 
-def save_heom_data(_savers, step, print_freq, params, rho_unpacked):
+def save_heom_data(_savers, step, print_freq, params, rho_unpacked, adm=None):
 
     #================ Saving the data ==================
 
@@ -142,7 +154,7 @@ def save_heom_data(_savers, step, print_freq, params, rho_unpacked):
         
     # Save properties
     if _savers["hdf5_saver"] != None:            
-        save_heom_hdf5(step, _savers["hdf5_saver"], params, rho_unpacked[0])
+        save_heom_hdf5(step, _savers["hdf5_saver"], params, rho_unpacked[0], adm)
         
     if _savers["txt_saver"] != None:            
         pass
@@ -150,6 +162,6 @@ def save_heom_data(_savers, step, print_freq, params, rho_unpacked):
     if _savers["mem_saver"] != None:            
         prms = dict(params)
         prms["hdf5_output_level"] = prms["mem_output_level"]
-        save_heom_hdf5(step, _savers["mem_saver"], prms, rho_unpacked[0])
+        save_heom_hdf5(step, _savers["mem_saver"], prms, rho_unpacked[0], adm)
 
     
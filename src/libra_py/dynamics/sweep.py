@@ -0,0 +1,400 @@
+#*********************************************************************************
+#* Copyright (C) 2020 Alexey V. Akimov
+#*
+#* This file is distributed under the terms of the GNU General Public License
+#* as published by the Free Software Foundation, either version 3 of
+#* the License, or (at your option) any later version.
+#* See the file LICENSE in the root directory of this distribution
+#* or <http://www.gnu.org/licenses/>.
+#***********************************************************************************
+"""
+.. module:: sweep
+   :platform: Unix, Windows
+   :synopsis: This module implements the drivers for running the series of independent
+       HEOM or exact dynamics calculations over a grid of parameters in parallel.
+       All the results are collected into a single HDF5 file, the already completed
+       grid points are skipped when the sweep is restarted
+
+       List of functions:
+           * make_param_grid(param_grid)
+           * point_key(point)
+           * completed_points(filename)
+           * run_heom_sweep(dyn_params, Ham, rho_init, param_grid, sweep_params)
+           * run_exact_sweep(dyn_params, _potential, model_params, param_grid, model_grid, sweep_params)
+           * read_sweep(filename, property_name)
+
+.. moduleauthors:: Alexey V. Akimov
+
+"""
+
+__author__ = "Alexey V. Akimov"
+__copyright__ = "Copyright 2020 Alexey V. Akimov"
+__credits__ = ["Alexey V. Akimov"]
+__license__ = "GNU-3"
+__version__ = "1.0"
+__maintainer__ = "Alexey V. Akimov"
+__email__ = "alexvakimov@gmail.com"
+__url__ = "https://quantum-dynamics-hub.github.io/libra/index.html"
+
+
+import os
+import sys
+import copy
+import json
+import itertools
+import multiprocessing as mp
+
+import numpy as np
+
+if sys.platform=="cygwin":
+    from cyglibra_core import *
+elif sys.platform=="linux" or sys.platform=="linux2":
+    from liblibra_core import *
+
+import util.libutil as comn
+import libra_py.data_conv as data_conv
+
+
+
+def make_param_grid(param_grid):
+    """
+    Generates all the combinations of the parameters
+
+    Args:
+        param_grid ( dictionary ): { name: list of values } - the values of each parameter to scan
+
+    Returns:
+        list of dictionaries: all the combinations { name: value }, the last parameter changes the fastest
+
+    Example:
+        make_param_grid( {"temperature":[100.0, 300.0], "LL":[5, 10]} ) gives:
+        [ {"temperature":100.0, "LL":5}, {"temperature":100.0, "LL":10},
+          {"temperature":300.0, "LL":5}, {"temperature":300.0, "LL":10} ]
+
+    """
+
+    names = list(param_grid.keys())
+    return [ dict(zip(names, values)) for values in itertools.product(*[ param_grid[name] for name in names ]) ]
+
+
+
+def point_key(point):
+    """
+    Converts a grid point into a string uniquely identifying it
+
+    Args:
+        point ( dictionary ): { name: value } - the parameters of the run
+
+    Returns:
+        string: the JSON representation of the parameters with the sorted keys
+
+    """
+
+    return json.dumps(point, sort_keys=True, default=str)
+
+
+
+def completed_points(filename):
+    """
+    Finds the grid points for which the results are already stored in the sweep file
+
+    Args:
+        filename ( string ): the name of the HDF5 file with the sweep results
+
+    Returns:
+        dictionary: { point_key: group_name } for all the completed runs
+
+    """
+
+    import h5py
+
+    res = {}
+
+    if not os.path.isfile(filename):
+        return res
+
+    with h5py.File(filename, "r") as f:
+        for name in f.keys():
+            if name.startswith("run_") and f[name].attrs.get("completed", 0)==1:
+                res[ f[name].attrs["params"] ] = name
+
+    return res
+
+
+
+def _collect_results(saver, properties_to_save):
+    """
+    Extracts the numpy arrays from the mem_saver returned by the dynamics drivers
+    """
+
+    res = {}
+    if saver != None:
+        for name in properties_to_save:
+            if name in saver.np_data.keys():
+                res[name] = np.array(saver.np_data[name])
+    return res
+
+
+
+def _run_heom_point(args):
+    """
+    Runs a single HEOM calculation - the worker for the process pool
+
+    Args:
+        args ( tuple ): (index, point, dyn_params, Ham, rho_init), the Hamiltonian and the initial density
+            matrix are given as 2D numpy arrays
+
+    Returns:
+        (int, dictionary, dictionary): the index of the point, its parameters, and the computed properties
+
+    """
+
+    from libra_py.dynamics.heom import compute as heom_compute
+
+    indx, point, dyn_params, Ham, rho_init = args
+
+    params = dict(dyn_params)
+    params.update(point)
+    params["prefix"] = os.path.join(params["prefix"], F"run_{indx}")
+
+    if "el_phon_couplings" in params.keys():
+        couplings = CMATRIXList()
+        for c in params["el_phon_couplings"]:
+            couplings.append( data_conv.nparray2CMATRIX( np.asarray(c, dtype=complex) ) )
+        params["el_phon_couplings"] = couplings
+
+    saver = heom_compute.run_dynamics(params, data_conv.nparray2CMATRIX(Ham), data_conv.nparray2CMATRIX(rho_init) )
+
+    return indx, point, _collect_results(saver, params["properties_to_save"])
+
+
+
+def _run_exact_point(args):
+    """
+    Runs a single exact dynamics calculation - the worker for the process pool
+
+    Args:
+        args ( tuple ): (index, point, dyn_params, _potential, model_params), the point is a
+            dictionary { "dyn": {...}, "model": {...} } with the parameters to update
+
+    Returns:
+        (int, dictionary, dictionary): the index of the point, its parameters, and the computed properties
+
+    """
+
+    from libra_py.dynamics.exact import compute as exact_compute
+
+    indx, point, dyn_params, _potential, model_params = args
+
+    params = dict(dyn_params)
+    params.update(point["dyn"])
+    params["prefix"] = os.path.join(params["prefix"], F"run_{indx}")
+
+    mparams = dict(model_params)
+    mparams.update(point["model"])
+
+    saver = exact_compute.run_relaxation(params, _potential, mparams)
+
+    return indx, point, _collect_results(saver, params["properties_to_save"])
+
+
+
+def _run_sweep(worker, tasks, sweep_params):
+    """
+    Runs the tasks over the process pool and stores the results into a single HDF5 file as they arrive
+
+    Args:
+        worker ( function ): the function to run each task
+        tasks ( list of tuples ): (index, point, ...) - the arguments for each task
+        sweep_params ( dictionary ): see `run_heom_sweep`
+
+    Returns:
+        list of strings: the names of the groups in the HDF5 file for all the grid points
+
+    """
+
+    import h5py
+
+    filename = sweep_params["filename"]
+    nprocs = sweep_params["nprocs"]
+
+    done = {}
+    if sweep_params["resume"]:
+        done = completed_points(filename)
+    elif os.path.isfile(filename):
+        os.remove(filename)
+
+    groups = [ F"run_{task[0]}" for task in tasks ]
+    todo = []
+    for task in tasks:
+        key = point_key(task[1])
+        if key in done.keys():
+            groups[task[0]] = done[key]
+        else:
+            todo.append(task)
+
+    print(F"Sweep: {len(tasks)} grid points, {len(tasks) - len(todo)} are already completed, {len(todo)} to run")
+
+    # The group names already used by the completed runs of the other grid points
+    used = set(done.values())
+    nused = max( [ int(name[4:]) for name in used ] + [ len(tasks) - 1 ] ) + 1
+
+    def _store(indx, point, results):
+        nonlocal nused
+        with h5py.File(filename, "a") as f:
+            name = F"run_{indx}"
+            if name in used:
+                # The grid has changed since the previous run, do not overwrite the old results
+                name = F"run_{nused}"
+                nused += 1
+            if name in f.keys():
+                del f[name]
+            groups[indx] = name
+            g = f.create_group(name)
+            g.attrs["params"] = point_key(point)
+            for prop, data in results.items():
+                g.create_dataset(prop, data=data)
+            g.attrs["completed"] = 1
+        print(F"Sweep: finished the grid point {indx} with parameters {point_key(point)}")
+
+    if nprocs > 1 and len(todo) > 1:
+        pool = mp.Pool( processes = nprocs )
+        for indx, point, results in pool.imap_unordered(worker, todo):
+            _store(indx, point, results)
+        pool.close()
+        pool.join()
+    else:
+        for task in todo:
+            _store( *worker(task) )
+
+    return groups
+
+
+
+def run_heom_sweep(dyn_params, Ham, rho_init, param_grid, sweep_params):
+    """
+    Runs the HEOM calculations (`heom.compute.run_dynamics`) for all the combinations of the parameters
+
+    Args:
+        dyn_params ( dictionary ): the common parameters of the HEOM calculations, see `heom.compute.run_dynamics`.
+            The "el_phon_couplings", if present, should be a list of 2D numpy arrays. The data are collected
+            from the mem_saver, so "mem_output_level" should be > 0 [ default "properties_to_save": 
+            ["timestep", "time", "denmat"] ]
+        Ham ( 2D numpy array or CMATRIX(nstates, nstates) ): the system's Hamiltonian [ units: Ha ]
+        rho_init ( 2D numpy array or CMATRIX(nstates, nstates) ): the initial density matrix
+        param_grid ( dictionary ): { name: list of values } - the values of the HEOM parameters to scan,
+            e.g. {"temperature":[100.0, 300.0], "eta":[...], "KK":[0, 1, 2], "LL":[5, 10] }
+        sweep_params ( dictionary ): the parameters of the sweep:
+
+            * **sweep_params["filename"]** ( string ): the name of the HDF5 file to collect all the results
+                [ default: "sweep.hdf" ]
+            * **sweep_params["nprocs"]** ( int ): the number of the calculations run concurrently [ default: 1 ]
+            * **sweep_params["threads_per_run"]** ( int ): the number of the OpenMP threads used by each
+                calculation, overrides the "num_threads" of dyn_params [ default: 1 ]
+            * **sweep_params["resume"]** ( Boolean ): whether to skip the grid points already stored in
+                the file; if False, the file is overwritten [ default: True ]
+
+    Returns:
+        list of strings: the names of the groups in the HDF5 file for all the grid points, ordered as
+            in `make_param_grid(param_grid)`. Each group contains the datasets for all the properties saved
+            and the "params" attribute with the JSON representation of the parameters of this point
+
+    """
+
+    critical_params = [ ]
+    default_params = { "filename":"sweep.hdf", "nprocs":1, "threads_per_run":1, "resume":True }
+    comn.check_input(sweep_params, default_params, critical_params)
+
+    params = dict(dyn_params)
+    params["num_threads"] = sweep_params["threads_per_run"]
+    if "prefix" not in params.keys():
+        params["prefix"] = "out"
+    if "properties_to_save" not in params.keys():
+        params["properties_to_save"] = [ "timestep", "time", "denmat"]
+
+    # The drivers only create the last level of the prefix of each run
+    os.makedirs(params["prefix"], exist_ok=True)
+
+    # Make the data picklable
+    if not isinstance(Ham, np.ndarray):
+        Ham = np.array(data_conv.MATRIX2nparray(Ham), dtype=complex)
+    if not isinstance(rho_init, np.ndarray):
+        rho_init = np.array(data_conv.MATRIX2nparray(rho_init), dtype=complex)
+
+    tasks = [ (indx, point, params, Ham, rho_init) for indx, point in enumerate(make_param_grid(param_grid)) ]
+
+    return _run_sweep(_run_heom_point, tasks, sweep_params)
+
+
+
+def run_exact_sweep(dyn_params, _potential, model_params, param_grid, model_grid, sweep_params):
+    """
+    Runs the exact dynamics calculations (`exact.compute.run_relaxation`) for all the combinations
+    of the parameters
+
+    Args:
+        dyn_params ( dictionary ): the common parameters of the dynamics, see `exact.compute.run_relaxation`.
+            The data are collected from the mem_saver, so "mem_output_level" should be > 0 [ default "properties_to_save":
+            ["timestep", "time", "Etot_dia", "Etot_adi", "pop_dia", "pop_adi"] ]
+        _potential ( function ): the model Hamiltonian function; it should be defined at the module level
+            so that it can be sent to the worker processes
+        model_params ( dictionary ): the common parameters of the model
+        param_grid ( dictionary ): { name: list of values } - the values of the dynamical parameters to scan,
+            e.g. {"p0":[ [10.0], [20.0], [30.0] ] }
+        model_grid ( dictionary ): { name: list of values } - the values of the model parameters to scan
+        sweep_params ( dictionary ): the parameters of the sweep, see `run_heom_sweep`; the
+            "threads_per_run" is not used
+
+    Returns:
+        list of strings: the names of the groups in the HDF5 file for all the grid points, see `run_heom_sweep`
+
+    """
+
+    critical_params = [ ]
+    default_params = { "filename":"sweep.hdf", "nprocs":1, "threads_per_run":1, "resume":True }
+    comn.check_input(sweep_params, default_params, critical_params)
+
+    params = dict(dyn_params)
+    if "prefix" not in params.keys():
+        params["prefix"] = "out"
+    if "properties_to_save" not in params.keys():
+        params["properties_to_save"] = [ "timestep", "time", "Etot_dia", "Etot_adi", "pop_dia", "pop_adi" ]
+
+    # The drivers only create the last level of the prefix of each run
+    os.makedirs(params["prefix"], exist_ok=True)
+
+    points = [ {"dyn":dyn_point, "model":model_point} for dyn_point in make_param_grid(param_grid)
+                                                      for model_point in make_param_grid(model_grid) ]
+
+    tasks = [ (indx, point, params, _potential, model_params) for indx, point in enumerate(points) ]
+
+    return _run_sweep(_run_exact_point, tasks, sweep_params)
+
+
+
+def read_sweep(filename, property_name):
+    """
+    Reads a given property for all the completed grid points of the sweep
+
+    Args:
+        filename ( string ): the name of the HDF5 file with the sweep results
+        property_name ( string ): the name of the property, e.g. "denmat"
+
+    Returns:
+        (list of dictionaries, list of numpy arrays): the parameters of all the completed grid points
+            and the corresponding values of the property
+
+    """
+
+    import h5py
+
+    points, data = [], []
+
+    with h5py.File(filename, "r") as f:
+        names = sorted( [ name for name in f.keys() if name.startswith("run_") ], key=lambda x: int(x[4:]) )
+        for name in names:
+            if f[name].attrs.get("completed", 0)==1 and property_name in f[name].keys():
+                points.append( json.loads(f[name].attrs["params"]) )
+                data.append( f[name][property_name][()] )
+
+    return points, data
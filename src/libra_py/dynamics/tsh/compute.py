@@ -49,6 +49,7 @@ import libra_py.data_outs as data_outs
 import libra_py.data_savers as data_savers
 import libra_py.tsh as tsh
 import libra_py.tsh_stat as tsh_stat
+import libra_py.profiling as profiling
 #import libra_py.dynamics as dynamics_io
 
 from . import save
@@ -755,8 +756,39 @@ def run_dynamics(_q, _p, _iM, _Cdia, _Cadi, _projectors, _states, _dyn_params, c
             * **dyn_params["progress_frequency"]** ( double ):  at what intervals print out some "progress" messages. For
                 instance, if you have `nsteps = 100` and `progress_frequency = 0.1`, the code will notify you every 10 steps. [ default : 0.1 ]
 
-                Note: this doesn't affect the frequency of the data saving to the file - at this point, we save the information for every
-                timestep
+                Note: this doesn't affect the frequency of the data saving to the file - use `save_every` and
+                `save_every_property` for that
+
+
+            * **dyn_params["save_every"]** ( int ): how often to save the properties: the data are saved every `save_every` 
+                steps, so the datasets contain `ceil(nsteps/save_every)` records [ default: 1 ]
+
+
+            * **dyn_params["save_every_property"]** ( dictionary ): { property: stride } - the saving intervals for selected properties,
+                to override the `save_every` value. For instance, `{"hvib_adi":10, "St":10}` saves the (expensive) 4-D properties only 
+                every 10 steps, while all other properties are saved every `save_every` steps. The record `n` of a property with 
+                the stride `m` corresponds to the step `n*m` [ default: {} ]
+
+                Note: the properties are computed only at the steps when at least one of the savers needs them, 
+                so large strides also reduce the cost of the properties evaluation
+
+
+            * **dyn_params["profiling"]** ( int ): whether to time the phases of the calculations, see :funct:`profiling.make_timer`
+
+                - 0: no profiling [ default ]
+                - 1: print out the table of the times spent in each phase at the end of the calculations
+                - 2: same as 1, plus the per-step timings are written into the `profiling_file`
+
+                The phases are: "model" - the calls of the `compute_model` function, "dynamics" - the `compute_dynamics` 
+                call (including the Hamiltonian updates, the electronic propagation, hopping, and decoherence, as well as 
+                the "model" calls), "statistics" - the amplitudes transformations, density matrices, populations, and 
+                energies, "transforms" - the time-overlaps, basis transforms, and vibronic Hamiltonians, "saving" - the 
+                saving of the data
+
+
+            * **dyn_params["profiling_file"]** ( string ): the name of the HDF5 file where to write the per-step timings
+                (in the "timings" group). If None, the timings are written into the "data.hdf" file in the `prefix` 
+                directory if the `hdf5_output_level` > 0, or into the "timings.hdf" file in that directory otherwise [ default: None ]
 
                                                                                                                           
             * **dyn_params["properties_to_save"]** ( list of string ): describes what properties to save to the HDF5 files. Note that
@@ -871,7 +903,8 @@ def run_dynamics(_q, _p, _iM, _Cdia, _Cadi, _projectors, _states, _dyn_params, c
     default_params.update( { "nsteps":1, "prefix":"out",
                              "hdf5_output_level":-1, "mem_output_level":-1, "txt_output_level":-1,
                              "use_compression":0, "compression_level":[0,0,0], 
-                             "progress_frequency":0.1,
+                             "progress_frequency":0.1, "save_every":1, "save_every_property":{},
+                             "profiling":0, "profiling_file":None,
                              "properties_to_save":[ "timestep", "time", "Ekin_ave", "Epot_ave", "Etot_ave", 
                                    "dEkin_ave", "dEpot_ave", "dEtot_ave", "states", "SH_pop", "SH_pop_raw",
                                    "D_adi", "D_adi_raw", "D_dia", "D_dia_raw", "q", "p", "Cadi", "Cdia", 
@@ -906,7 +939,13 @@ def run_dynamics(_q, _p, _iM, _Cdia, _Cadi, _projectors, _states, _dyn_params, c
 
 
     # Initialize savers
-    _savers = save.init_tsh_savers(dyn_params, model_params, nsteps, ntraj, nnucl, nadi, ndia)
+    strides = save.property_strides(dyn_params)
+    _savers = save.init_tsh_savers(dyn_params, model_params, nsteps, ntraj, nnucl, nadi, ndia, strides)
+    print_freq = max(1, int(dyn_params["progress_frequency"]*nsteps))
+
+    # Profiling: when it is disabled, the timer does nothing
+    timer = profiling.make_timer(dyn_params)
+    compute_model = timer.wrap("model", compute_model)
 
 
     # ======= Hierarchy of Hamiltonians =======
@@ -919,9 +958,9 @@ def run_dynamics(_q, _p, _iM, _Cdia, _Cadi, _projectors, _states, _dyn_params, c
     update_Hamiltonian_p(dyn_params, ham, p, iM)  
 
 
-    U = []
-    for tr in range(ntraj):
-        U.append(ham.get_basis_transform(Py2Cpp_int([0, tr]) ))
+    # Diabatic-to-adiabatic transforms of all trajectories, as of the last step they were tracked. 
+    # The list is replaced by the one returned by the batched accessor (the buffers are swapped, not copied)
+    U = ham.get_basis_transform_children()
 
 
     therm = ThermostatList();
@@ -934,72 +973,119 @@ def run_dynamics(_q, _p, _iM, _Cdia, _Cadi, _projectors, _states, _dyn_params, c
                 
     # Do the propagation
     for i in range(nsteps):
+
+        if i%print_freq==0:
+            print(F" step= {i}")
     
         #============ Compute and output properties ===========        
-        # Amplitudes, Density matrix, and Populations
-        if rep_tdse==0:
-            # Diabatic to raw adiabatic
-            ham.ampl_dia2adi(Cdia, Cadi, 0, 1) 
-            # Raw adiabatic to dynamically-consistent adiabatic
-            Cadi = dynconsyst_to_raw(Cadi, projectors)
+        # Only the properties needed by at least one of the savers at this step are computed
+        due = save.due_properties(_savers, dyn_params, i, strides)
+        needed = set()
+        for names in due.values():
+            needed.update(names)
 
-        elif rep_tdse==1:
-            ham.ampl_adi2dia(Cdia, Cadi, 0, 1)
+        need_dm = len( needed.intersection( ["D_adi", "D_adi_raw", "D_dia", "D_dia_raw"] ) ) > 0
+        need_pops = len( needed.intersection( ["SH_pop", "SH_pop_raw"] ) ) > 0
+        need_etot = len( needed.intersection( ["Ekin_ave", "Epot_ave", "Etot_ave", "dEkin_ave", 
+                                               "dEpot_ave", "dEtot_ave", "E_NHC"] ) ) > 0
+        need_etherm = len( needed.intersection( ["Etherm", "E_NHC"] ) ) > 0
+        need_ampl = need_dm or need_etot or len( needed.intersection( ["Cadi", "Cdia"] ) ) > 0
 
-        dm_dia, dm_adi, dm_dia_raw, dm_adi_raw, = tsh_stat.compute_dm(ham, Cdia, Cadi, projectors, rep_tdse, 1)        
-        pops, pops_raw = tsh_stat.compute_sh_statistics(nadi, states, projectors)
+        values = {"timestep":i, "time":dt*i, "states":states, "q":q, "p":p, "projector":projectors}
 
+        with timer.phase("statistics"):
+            # Amplitudes, Density matrix, and Populations
+            if need_ampl:
+                if rep_tdse==0:
+                    # Diabatic to raw adiabatic
+                    ham.ampl_dia2adi(Cdia, Cadi, 0, 1) 
+                    # Raw adiabatic to dynamically-consistent adiabatic
+                    Cadi = dynconsyst_to_raw(Cadi, projectors)
 
-        # Energies 
-        Ekin, Epot, Etot, dEkin, dEpot, dEtot = 0.0, 0.0, 0.0,  0.0, 0.0, 0.0
-        Etherm, E_NHC = 0.0, 0.0
-        if force_method in [0, 1]:
-            Ekin, Epot, Etot, dEkin, dEpot, dEtot = tsh_stat.compute_etot_tsh(ham, p, Cdia, Cadi, projectors, states, iM, rep_tdse)
-        elif force_method in [2]:
-            Ekin, Epot, Etot, dEkin, dEpot, dEtot = tsh_stat.compute_etot(ham, p, Cdia, Cadi, projectors, iM, rep_tdse)
+                elif rep_tdse==1:
+                    ham.ampl_adi2dia(Cdia, Cadi, 0, 1)
 
-        for bath in therm:
-            Etherm += bath.energy()
-        Etherm = Etherm / float(ntraj)
-        E_NHC = Etot + Etherm
+                values.update( {"Cadi":Cadi, "Cdia":Cdia} )
 
-        
+            if need_dm:
+                dm_dia, dm_adi, dm_dia_raw, dm_adi_raw, = tsh_stat.compute_dm(ham, Cdia, Cadi, projectors, rep_tdse, 1)        
+                values.update( {"D_adi":dm_adi, "D_adi_raw":dm_adi_raw, "D_dia":dm_dia, "D_dia_raw":dm_dia_raw} )
 
-        save.save_tsh_data_123(_savers, dyn_params, 
-                       i, dt, Ekin, Epot, Etot, dEkin, dEpot, dEtot, Etherm, E_NHC, states,
-                       pops, pops_raw, dm_adi, dm_adi_raw, dm_dia, dm_dia_raw, q, p, Cadi, Cdia  )
+            if need_pops:
+                pops, pops_raw = tsh_stat.compute_sh_statistics(nadi, states, projectors)
+                values.update( {"SH_pop":pops, "SH_pop_raw":pops_raw} )
 
-    
-        for tr in range(ntraj):
-            if time_overlap_method==0:
-                x = ham.get_basis_transform(Py2Cpp_int([0, tr]) )            
-                St = U[tr].H() * x
-                U[tr] = CMATRIX(x)
 
-            elif time_overlap_method==1:                
-                St = ham.get_time_overlap_adi(Py2Cpp_int([0, tr]) ) 
+            # Energies 
+            Ekin, Epot, Etot, dEkin, dEpot, dEtot = 0.0, 0.0, 0.0,  0.0, 0.0, 0.0
+            Etherm, E_NHC = 0.0, 0.0
+            if need_etot:
+                if force_method in [0, 1]:
+                    Ekin, Epot, Etot, dEkin, dEpot, dEtot = tsh_stat.compute_etot_tsh(ham, p, Cdia, Cadi, projectors, states, iM, rep_tdse)
+                elif force_method in [2]:
+                    Ekin, Epot, Etot, dEkin, dEpot, dEtot = tsh_stat.compute_etot(ham, p, Cdia, Cadi, projectors, iM, rep_tdse)
+
+            if need_etherm:
+                for bath in therm:
+                    Etherm += bath.energy()
+                Etherm = Etherm / float(ntraj)
+            E_NHC = Etot + Etherm
 
+            values.update( {"Ekin_ave":Ekin, "Epot_ave":Epot, "Etot_ave":Etot, "dEkin_ave":dEkin, "dEpot_ave":dEpot,
+                            "dEtot_ave":dEtot, "Etherm":Etherm, "E_NHC":E_NHC } )
 
-            if hdf5_output_level>=4: 
-                hvib_adi = ham.get_hvib_adi(Py2Cpp_int([0, tr])) 
-                hvib_dia = ham.get_hvib_dia(Py2Cpp_int([0, tr])) 
-                save.save_hdf5_4D(_savers["hdf5_saver"], i, tr, hvib_adi, hvib_dia, St, U[tr], projectors[tr])
 
-            if mem_output_level>=4: 
-                hvib_adi = ham.get_hvib_adi(Py2Cpp_int([0, tr])) 
-                hvib_dia = ham.get_hvib_dia(Py2Cpp_int([0, tr])) 
-                save.save_hdf5_4D(_savers["mem_saver"], i, tr, hvib_adi, hvib_dia, St, U[tr], projectors[tr])
+        # Trajectory-resolved properties
+        # With time_overlap_method == 0, the basis transforms are also tracked at the steps preceding the ones 
+        # at which the time-overlaps are saved
+        need_St = "St" in needed
+        track_U = need_St or "basis_transform" in needed
+        if time_overlap_method==0 and not track_U and i+1 < nsteps:
+            track_U = "St" in set().union( *save.due_properties(_savers, dyn_params, i+1, strides).values() )
+
+        with timer.phase("transforms"):
+            if need_St or track_U:
+                if time_overlap_method==0:
+                    St = ham.get_time_overlap_adi_children(U)
+                elif time_overlap_method==1:                
+                    St = ham.get_time_overlap_adi_children()
+
+                if track_U:
+                    U = ham.get_basis_transform_children()
+
+                values.update( {"St":St, "basis_transform":U} )
+
+            if "hvib_adi" in needed:
+                values["hvib_adi"] = ham.get_hvib_adi_children()
+
+            if "hvib_dia" in needed:
+                values["hvib_dia"] = ham.get_hvib_dia_children()
+
+
+        with timer.phase("saving"):
+            for saver_name in due.keys():
+                save.save_tsh_properties(_savers[saver_name], i, strides, due[saver_name], values)
 
 
 
         #============ Propagate ===========        
         model_params.update({"timestep":i})        
         
-        if rep_tdse==0:
-            compute_dynamics(q, p, iM, Cdia, projectors, states, ham, compute_model, model_params, dyn_params, rnd, therm)
-        elif rep_tdse==1:
-            compute_dynamics(q, p, iM, Cadi, projectors, states, ham, compute_model, model_params, dyn_params, rnd, therm)
+        with timer.phase("dynamics"):
+            if rep_tdse==0:
+                compute_dynamics(q, p, iM, Cdia, projectors, states, ham, compute_model, model_params, dyn_params, rnd, therm)
+            elif rep_tdse==1:
+                compute_dynamics(q, p, iM, Cadi, projectors, states, ham, compute_model, model_params, dyn_params, rnd, therm)
+
+        timer.end_step()
+
 
+    profiling_file = dyn_params["profiling_file"]
+    if profiling_file == None:
+        profiling_file = F"{prefix}/timings.hdf"
+        if hdf5_output_level > 0:
+            profiling_file = F"{prefix}/data.hdf"
+    timer.summarize(profiling_file, "TSH dynamics timings")
 
     if _savers["mem_saver"]!=None:
         _savers["mem_saver"].save_data( F"{prefix}/mem_data.hdf", properties_to_save, "w")
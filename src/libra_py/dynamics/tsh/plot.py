@@ -36,7 +36,6 @@ import copy
 
 import h5py
 import numpy as np
-import matplotlib.pyplot as plt 
 #from matplotlib.mlab import griddata
 
 if sys.platform=="cygwin":
@@ -116,6 +115,14 @@ def common_defaults(plot_params_):
             * **ylim** ( tuple of 2 doubles or None): 
                 None: y boundaries of the plot are determined automatically [ default: None ]
                 tuple of 2 doubles: use them to determine the range of the y axis 
+
+            * **time_window** ( tuple of 2 doubles or None): 
+                None: plot all the time steps stored in the file [ default: None ]
+                tuple of 2 doubles: plot only the time steps within this time interval [ units: fs ]
+
+            * **time_stride** ( int ): plot only every `time_stride`-th time step [ default: 1 ]
+
+            Only the selected time steps, trajectories, and states are read from the HDF5 file
     
     """
     
@@ -135,6 +142,7 @@ def common_defaults(plot_params_):
                         "linewidth":2,
                         "frameon":True,
                         "xlim":None, "ylim":None,
+                        "time_window":None, "time_stride":1,
                         "what_to_plot":["energies", "energy_fluctuations", 
                                         "traj_resolved_adiabatic_ham", "traj_resolved_diabatic_ham",
                                         "coordinates", "phase_space",
@@ -150,6 +158,72 @@ def common_defaults(plot_params_):
     return plot_params
 
 
+def time_steps(hdf_file, plot_params):
+    """
+    Determines which time steps to read from the HDF5 file
+
+    Args:
+        hdf_file ( h5py.File ): the file with the data
+        plot_params ( dict ): the plotting parameters, see `common_defaults`; the "time_window" and
+            "time_stride" parameters are used
+
+    Returns:
+        slice: the selection of the time steps, to be used as the first index of the datasets
+
+    """
+
+    time_window = plot_params["time_window"]
+    time_stride = plot_params["time_stride"]
+
+    start, stop = 0, hdf_file["time/data"].shape[0]
+
+    if time_window!=None:
+        t = hdf_file["time/data"][:]/units.fs2au
+        start = int(np.searchsorted(t, time_window[0], side="left"))
+        stop = int(np.searchsorted(t, time_window[1], side="right"))
+
+    return slice(start, stop, time_stride)
+
+
+def property_vs_t(hdf_file, name, steps, index=(), time_units=units.fs2au):
+    """
+    Reads the selected time steps of a property, along with the times at which it was saved
+
+    The properties saved with a stride (see `save.property_strides`) have fewer rows than the
+    time axis, their row k being the step k * stride. The stride is read from the "stride" 
+    attribute of the property's group [ default: 1 ]
+
+    Args:
+        hdf_file ( h5py.File ): the file with the data
+        name ( string ): the name of the property, e.g. "q"
+        steps ( slice ): the selection of the rows of the time axis, see `time_steps`
+        index ( tuple ): the indices of the property's dataset other than the time one
+        time_units ( double ): the time is divided by this factor [ default: units.fs2au - in fs ]
+
+    Returns:
+        tuple: (t, data) - the times of the selected rows of the property and their values
+
+    """
+
+    stride = int(hdf_file[name].attrs.get("stride", 1))
+    time_stride = int(hdf_file["time"].attrs.get("stride", 1))
+
+    if stride % time_stride != 0:
+        print(F"Error in property_vs_t - the stride of {name} = {stride} is not a multiple of the stride of time = {time_stride}\n")
+        print("Can not match the property to its time axis\nExiting")
+        sys.exit(0)
+
+    # Rows of the time axis are steps k * time_stride, map their selection to the rows of the property
+    ratio = stride // time_stride
+    start, stop, step = steps.indices(hdf_file["time/data"].shape[0])
+    start, stop = -(-start // ratio), min(-(-stop // ratio), hdf_file[F"{name}/data"].shape[0])
+    rows = np.arange(start, stop, step)
+
+    t = hdf_file["time/data"][:][rows * ratio] / time_units
+
+    return t, hdf_file[F"{name}/data"][(slice(start, stop, step),) + tuple(index)]
+
+
 def add_energies(plt, hdf_file, plot_params_, property_type):
     """
     Adds the plotting of the ensemble-averaged kinetic, potential, and total energies
@@ -180,6 +254,8 @@ def add_energies(plt, hdf_file, plot_params_, property_type):
     colors = plot_params["colors"]
     clrs_index = plot_params["clrs_index"]   
     which_energies = plot_params["which_energies"]
+
+    steps = time_steps(hdf_file, plot_params)
             
     if xlim!=None:
         plt.xlim( xlim[0], xlim[1])
@@ -199,31 +275,31 @@ def add_energies(plt, hdf_file, plot_params_, property_type):
         
     if property_type == "energies":        
         if "potential" in which_energies:
-            plt.plot(hdf_file["time/data"][:]/units.fs2au, hdf_file["Epot_ave/data"][:],
+            plt.plot(*property_vs_t(hdf_file, "Epot_ave", steps),
                      label="Potential energy", linewidth=Lw, color = colors[ clrs_index[0] ])
         if "kinetic" in which_energies:
-            plt.plot(hdf_file["time/data"][:]/units.fs2au, hdf_file["Ekin_ave/data"][:],
+            plt.plot(*property_vs_t(hdf_file, "Ekin_ave", steps),
                      label="Kinetic energy", linewidth=Lw, color = colors[ clrs_index[1] ])
         if "total" in which_energies:
-            plt.plot(hdf_file["time/data"][:]/units.fs2au, hdf_file["Etot_ave/data"][:], 
+            plt.plot(*property_vs_t(hdf_file, "Etot_ave", steps), 
                      label="Total energy", linewidth=Lw, color = colors[ clrs_index[2] ])        
         if "extended" in which_energies:
-            plt.plot(hdf_file["time/data"][:]/units.fs2au, hdf_file["E_NHC/data"][:],
+            plt.plot(*property_vs_t(hdf_file, "E_NHC", steps),
                      label="Extended energy", linewidth=Lw, color = colors[ clrs_index[3] ])
                         
     elif property_type == "energy_fluctuations":
         if "potential" in which_energies:
-            plt.plot(hdf_file["time/data"][:]/units.fs2au, hdf_file["dEpot_ave/data"][:],
+            plt.plot(*property_vs_t(hdf_file, "dEpot_ave", steps),
                      label="Potential energy", linewidth=Lw, color = colors[ clrs_index[0] ])
         if "kinetic" in which_energies:
-            plt.plot(hdf_file["time/data"][:]/units.fs2au, hdf_file["dEkin_ave/data"][:],
+            plt.plot(*property_vs_t(hdf_file, "dEkin_ave", steps),
                      label="Kinetic energy", linewidth=Lw, color = colors[ clrs_index[1] ])
         if "total" in which_energies:
-            plt.plot(hdf_file["time/data"][:]/units.fs2au, hdf_file["dEtot_ave/data"][:],
+            plt.plot(*property_vs_t(hdf_file, "dEtot_ave", steps),
                      label="Total energy", linewidth=Lw, color = colors[ clrs_index[2] ])
         # This one is not yet present
         #if "extended" in which_energies:
-        #    plt.plot(hdf_file["time/data"][:]/units.fs2au, hdf_file["dE_NHC/data"][:],
+        #    plt.plot(t, hdf_file["dE_NHC/data"][steps],
         #             label="Extended energy", linewidth=Lw, color = colors[ clrs_index[3] ])                    
     plt.legend(fontsize=legend_fontsize)
     plt.tight_layout()
@@ -276,7 +352,8 @@ def add_trajectory_resolved_ham_property(plt, hdf_file, plot_params_, ham_proper
         which_states = plot_params["which_dia_states"]
         ntraj = hdf_file["hvib_dia/data"].shape[1] 
         nstates = hdf_file["hvib_dia/data"].shape[2]
-    
+
+    steps = time_steps(hdf_file, plot_params)
         
     if xlim!=None:
         plt.xlim( xlim[0], xlim[1])
@@ -299,8 +376,7 @@ def add_trajectory_resolved_ham_property(plt, hdf_file, plot_params_, ham_proper
             indx = indx + 1
             for tr in range(ntraj):
                 if tr in which_trajectories:
-                    plt.plot(hdf_file["time/data"][:]/units.fs2au, 
-                             hdf_file[F"{ham_property_type}/data"][:, tr, istate, istate],
+                    plt.plot(*property_vs_t(hdf_file, ham_property_type, steps, (tr, istate, istate)),
                              label=F"traj={tr}, state={istate}",
                              linewidth=Lw, color = colors[ clrs_index[indx] ])                        
     plt.legend(fontsize=legend_fontsize)
@@ -338,6 +414,8 @@ def add_cooordinates_vs_t(plt, hdf_file, plot_params_):
     
     ntraj = hdf_file["q/data"].shape[1]
     ndofs = hdf_file["q/data"].shape[2]
+
+    steps = time_steps(hdf_file, plot_params)
     
     plt.title('Time-dependent Coordinates, a.u.', fontsize=title_fontsize)
     plt.xticks(fontsize=axes_fontsize[0])
@@ -349,7 +427,7 @@ def add_cooordinates_vs_t(plt, hdf_file, plot_params_):
         if tr in which_trajectories:
             for dof in range(ndofs):
                 if dof in which_dofs:
-                    plt.plot(hdf_file["time/data"][:]/units.fs2au, hdf_file["q/data"][:, tr, dof],
+                    plt.plot(*property_vs_t(hdf_file, "q", steps, (tr, dof)),
                              label=F"traj={tr} dof={dof}", linewidth=Lw, 
                              color = colors[ clrs_index[dof] ]) 
     plt.legend(fontsize=legend_fontsize)
@@ -387,6 +465,8 @@ def add_momenta_vs_t(plt, hdf_file, plot_params_):
     
     ntraj = hdf_file["p/data"].shape[1]
     ndofs = hdf_file["p/data"].shape[2]
+
+    steps = time_steps(hdf_file, plot_params)
     
     plt.title('Time-dependent Momenta, a.u.', fontsize=title_fontsize)
     plt.xticks(fontsize=axes_fontsize[0])
@@ -398,7 +478,7 @@ def add_momenta_vs_t(plt, hdf_file, plot_params_):
         if tr in which_trajectories:
             for dof in range(ndofs):
                 if dof in which_dofs:
-                    plt.plot(hdf_file["time/data"][:]/units.fs2au, hdf_file["p/data"][:, tr, dof],
+                    plt.plot(*property_vs_t(hdf_file, "p", steps, (tr, dof)),
                              label=F"traj={tr} dof={dof}", linewidth=Lw, 
                              color = colors[ clrs_index[dof] ]) 
     plt.legend(fontsize=legend_fontsize)
@@ -436,6 +516,12 @@ def add_phase_space(plt, hdf_file, plot_params_):
     
     ntraj = hdf_file["p/data"].shape[1]
     ndofs = hdf_file["p/data"].shape[2]
+
+    steps = time_steps(hdf_file, plot_params)
+
+    if hdf_file["q"].attrs.get("stride", 1) != hdf_file["p"].attrs.get("stride", 1):
+        print("Error in add_phase_space - the coordinates and momenta are saved with different strides\nExiting")
+        sys.exit(0)
     
     plt.title('Phase Space Portrait', fontsize=title_fontsize)
     plt.xticks(fontsize=axes_fontsize[0])
@@ -447,7 +533,7 @@ def add_phase_space(plt, hdf_file, plot_params_):
         if tr in which_trajectories:
             for dof in range(ndofs):
                 if dof in which_dofs:
-                    plt.plot(hdf_file["q/data"][:, tr, dof], hdf_file["p/data"][:, tr, dof],
+                    plt.plot(property_vs_t(hdf_file, "q", steps, (tr, dof))[1], property_vs_t(hdf_file, "p", steps, (tr, dof))[1],
                              label=F"traj={tr} dof={dof}", linewidth=Lw, 
                              color = colors[ clrs_index[dof] ]) 
     plt.legend(fontsize=legend_fontsize)
@@ -507,6 +593,8 @@ def add_populations(plt, hdf_file, plot_params_, pop_type ):
     elif pop_type in ["SH_pop", "SH_pop_raw"]: # adiabatic SH properties
         nstates = hdf_file["SH_pop/data"].shape[1]
         which_states = plot_params["which_adi_states"]
+
+    steps = time_steps(hdf_file, plot_params)
         
         
     titles = { "D_dia": "Diabatic SE populations",
@@ -534,7 +622,7 @@ def add_populations(plt, hdf_file, plot_params_, pop_type ):
         for istate in range(nstates):
             if istate in which_states:
                 indx = indx + 1            
-                plt.plot(hdf_file["time/data"][:]/units.fs2au, hdf_file[F"{pop_type}/data"][:, istate, istate], 
+                plt.plot(*property_vs_t(hdf_file, pop_type, steps, (istate, istate)), 
                          label=F"state {istate}", linewidth=Lw, color = colors[clrs_index[indx] ])
                 
     elif pop_type in ["SH_pop_raw", "SH_pop"]:
@@ -542,7 +630,7 @@ def add_populations(plt, hdf_file, plot_params_, pop_type ):
         for istate in range(nstates):
             if istate in which_states:
                 indx = indx + 1            
-                plt.plot(hdf_file["time/data"][:]/units.fs2au, hdf_file[F"{pop_type}/data"][:, istate, 0], 
+                plt.plot(*property_vs_t(hdf_file, pop_type, steps, (istate, 0)), 
                          label=F"state {istate}", linewidth=Lw, color = colors[clrs_index[indx] ]) 
         
     plt.legend(fontsize=legend_fontsize)
@@ -588,6 +676,8 @@ def add_time_overlaps_projectors(plt, hdf_file, plot_params_, prop_type):
     
     ntraj = hdf_file[F"{prop_type}/data"].shape[1] 
     nstates = hdf_file[F"{prop_type}/data"].shape[2] 
+
+    steps = time_steps(hdf_file, plot_params)
                     
     titles = { "St": "Time-overlaps of adiabatic states",
                "projector": "Projectors of raw to dyn-consistent states",               
@@ -612,8 +702,7 @@ def add_time_overlaps_projectors(plt, hdf_file, plot_params_, prop_type):
             indx = indx + 1
             for tr in range(ntraj):
                 if tr in which_trajectories:
-                    plt.plot(hdf_file["time/data"][:]/units.fs2au, 
-                             hdf_file[F"{prop_type}/data"][:, tr, istate, istate], 
+                    plt.plot(*property_vs_t(hdf_file, prop_type, steps, (tr, istate, istate)), 
                          label=F"state {istate}", linewidth=Lw, color = colors[clrs_index[indx] ])
                     
     plt.legend(fontsize=legend_fontsize)
@@ -647,6 +736,8 @@ def add_basis_transform(plt, hdf_file, plot_params_):
     ntraj = hdf_file["basis_transform/data"].shape[1]
     ndia  = hdf_file["basis_transform/data"].shape[2]
     nadi  = hdf_file["basis_transform/data"].shape[3]
+
+    steps = time_steps(hdf_file, plot_params)
                     
         
     if xlim!=None:
@@ -674,8 +765,7 @@ def add_basis_transform(plt, hdf_file, plot_params_):
                     
                     for tr in range(ntraj):
                         if tr in which_trajectories:                                     
-                            plt.plot(hdf_file["time/data"][:]/units.fs2au,
-                                     hdf_file["basis_transform/data"][:, tr, istate2, istate], 
+                            plt.plot(*property_vs_t(hdf_file, "basis_transform", steps, (tr, istate2, istate)), 
                                      label=lbl, linewidth=Lw, 
                                      color = colors[ clrs_index[indx] ])     
                             
@@ -695,6 +785,8 @@ def plot_dynamics(plot_params_):
     subplot 2: the adiabatic potential energies for selected trajectories
         
     """
+
+    import matplotlib.pyplot as plt
     
     plot_params = common_defaults(plot_params_)
         
@@ -846,11 +938,14 @@ def plot_dyn(plot_params):
         which_dia_states ( list of ints ) : indices of the diabatic states to print [ default: [0] ]
         colors ( dictionary ): the definition of the colors to use
         clrs_index ( list of strings ) : defines the mapping of the colors on integers and vice versa 
+        time_stride ( int ): plot only every `time_stride`-th time step [ default: 1 ]
 
     See in the ```dynamics_hdf5.py``` file for the data sets available                    
 
     """
 
+    import matplotlib.pyplot as plt
+
     colors = {}
 
     colors.update({"11": "#8b1a0e"})  # red       
@@ -877,7 +972,8 @@ def plot_dyn(plot_params):
     default_params = {  "prefix":"out", "filename":"data.hdf", "output_level":3,
                         "which_trajectories":[0], "which_dofs":[0],
                         "which_adi_states":[0], "which_dia_states":[0],
-                        "colors":colors, "clrs_index":clrs_index
+                        "colors":colors, "clrs_index":clrs_index,
+                        "time_stride":1
                      }
     comn.check_input(plot_params, default_params, critical_params)
         
@@ -893,10 +989,12 @@ def plot_dyn(plot_params):
     clrs_index = plot_params["clrs_index"]
 
     out_prefix = prefix
+    steps = slice(None, None, plot_params["time_stride"])
 
  
     with h5py.File(F"{prefix}/{filename}", 'r') as f:
 
+
         _figsize = (24,24)
 
         if output_level>=1:
@@ -910,9 +1008,9 @@ def plot_dyn(plot_params):
             plt.xlabel('Time, a.u.')
             plt.ylabel('Energy, a.u.')        
             
-            plt.plot(f["time/data"][:], f["Ekin_ave/data"][:], label="Kinetic energy", linewidth=2, color = colors["11"])                 
-            plt.plot(f["time/data"][:], f["Epot_ave/data"][:], label="Potential energy", linewidth=2, color = colors["21"])                 
-            plt.plot(f["time/data"][:], f["Etot_ave/data"][:], label="Total energy", linewidth=2, color = colors["31"])                 
+            plt.plot(*property_vs_t(f, "Ekin_ave", steps, time_units=1.0), label="Kinetic energy", linewidth=2, color = colors["11"])                 
+            plt.plot(*property_vs_t(f, "Epot_ave", steps, time_units=1.0), label="Potential energy", linewidth=2, color = colors["21"])                 
+            plt.plot(*property_vs_t(f, "Etot_ave", steps, time_units=1.0), label="Total energy", linewidth=2, color = colors["31"])                 
             
             
             plt.subplot(1,2,2)            
@@ -920,9 +1018,9 @@ def plot_dyn(plot_params):
             plt.xlabel('Time, a.u.')
             plt.ylabel('Energy fluctuation, a.u.')        
             
-            plt.plot(f["time/data"][:], f["dEkin_ave/data"][:], label="Kinetic energy", linewidth=2, color = colors["11"])                 
-            plt.plot(f["time/data"][:], f["dEpot_ave/data"][:], label="Potential energy", linewidth=2, color = colors["21"])                 
-            plt.plot(f["time/data"][:], f["dEtot_ave/data"][:], label="Total energy", linewidth=2, color = colors["31"])                             
+            plt.plot(*property_vs_t(f, "dEkin_ave", steps, time_units=1.0), label="Kinetic energy", linewidth=2, color = colors["11"])                 
+            plt.plot(*property_vs_t(f, "dEpot_ave", steps, time_units=1.0), label="Potential energy", linewidth=2, color = colors["21"])                 
+            plt.plot(*property_vs_t(f, "dEtot_ave", steps, time_units=1.0), label="Total energy", linewidth=2, color = colors["31"])                             
                 
                 
             plt.savefig(F"{out_prefix}/t-en.png", dpi=300)
@@ -944,7 +1042,7 @@ def plot_dyn(plot_params):
             
             for tr in range(ntraj):
                 if tr in which_trajectories:
-                    plt.plot(f["time/data"][:], f["states/data"][:, tr], label="", linewidth=2, color = colors["11"])                             
+                    plt.plot(*property_vs_t(f, "states", steps, (tr,), time_units=1.0), label="", linewidth=2, color = colors["11"])                             
                             
             plt.savefig(F"{out_prefix}/t-state_indices.png", dpi=300)
             plt.show()
@@ -969,7 +1067,7 @@ def plot_dyn(plot_params):
             for istate in range(nadi):
                 if istate in which_adi_states:
                     indx = indx + 1
-                    plt.plot(f["time/data"][:], f["SH_pop/data"][:, istate, 0], label=F"state {istate}", linewidth=2, color = colors[clrs_index[indx] ])                 
+                    plt.plot(*property_vs_t(f, "SH_pop", steps, (istate, 0), time_units=1.0), label=F"state {istate}", linewidth=2, color = colors[clrs_index[indx] ])                 
 
             #================ adi SE populations =============
             plt.subplot(1,3,2)            
@@ -981,7 +1079,7 @@ def plot_dyn(plot_params):
             for istate in range(nadi):
                 if istate in which_adi_states:
                     indx = indx + 1
-                    plt.plot(f["time/data"][:], f["D_adi/data"][:, istate, istate], label=F"state {istate}", linewidth=2, color = colors[clrs_index[indx] ])                 
+                    plt.plot(*property_vs_t(f, "D_adi", steps, (istate, istate), time_units=1.0), label=F"state {istate}", linewidth=2, color = colors[clrs_index[indx] ])                 
                     
                     
             #================ dia SE populations =============
@@ -994,7 +1092,7 @@ def plot_dyn(plot_params):
             for istate in range(ndia):
                 if istate in which_dia_states:
                     indx = indx + 1
-                    plt.plot(f["time/data"][:], f["D_dia/data"][:, istate, istate], label=F"state {istate}", linewidth=2, color = colors[clrs_index[indx] ])                 
+                    plt.plot(*property_vs_t(f, "D_dia", steps, (istate, istate), time_units=1.0), label=F"state {istate}", linewidth=2, color = colors[clrs_index[indx] ])                 
                     
                     
             plt.savefig(F"{out_prefix}/t-pops.png", dpi=300)
@@ -1019,7 +1117,7 @@ def plot_dyn(plot_params):
             for istate in range(nadi):
                 if istate in which_adi_states:
                     indx = indx + 1
-                    plt.plot(f["time/data"][:], f["SH_pop_raw/data"][:, istate, 0], label=F"state {istate}", linewidth=2, color = colors[clrs_index[indx] ])                 
+                    plt.plot(*property_vs_t(f, "SH_pop_raw", steps, (istate, 0), time_units=1.0), label=F"state {istate}", linewidth=2, color = colors[clrs_index[indx] ])                 
 
             #================ adi SE populations =============
             plt.subplot(1,3,2)            
@@ -1031,7 +1129,7 @@ def plot_dyn(plot_params):
             for istate in range(nadi):
                 if istate in which_adi_states:
                     indx = indx + 1
-                    plt.plot(f["time/data"][:], f["D_adi_raw/data"][:, istate, istate], label=F"state {istate}", linewidth=2, color = colors[clrs_index[indx] ])                 
+                    plt.plot(*property_vs_t(f, "D_adi_raw", steps, (istate, istate), time_units=1.0), label=F"state {istate}", linewidth=2, color = colors[clrs_index[indx] ])                 
                     
                     
             #================ dia SE populations =============
@@ -1044,7 +1142,7 @@ def plot_dyn(plot_params):
             for istate in range(ndia):
                 if istate in which_dia_states:
                     indx = indx + 1
-                    plt.plot(f["time/data"][:], f["D_dia_raw/data"][:, istate, istate], label=F"state {istate}", linewidth=2, color = colors[clrs_index[indx] ])                 
+                    plt.plot(*property_vs_t(f, "D_dia_raw", steps, (istate, istate), time_units=1.0), label=F"state {istate}", linewidth=2, color = colors[clrs_index[indx] ])                 
                     
                     
             plt.savefig(F"{out_prefix}/t-pops_raw.png", dpi=300)
@@ -1072,10 +1170,14 @@ def plot_dyn(plot_params):
                     indx = indx + 1
                     for tr in range(ntraj):
                         if tr in which_trajectories:
-                            plt.plot(f["time/data"][:], f["q/data"][:, tr, idof], label="", linewidth=2, color = colors[ clrs_index[indx] ])                 
+                            plt.plot(*property_vs_t(f, "q", steps, (tr, idof), time_units=1.0), label="", linewidth=2, color = colors[ clrs_index[indx] ])                 
                             
                         
             #========= Phase-space =========            
+            if f["q"].attrs.get("stride", 1) != f["p"].attrs.get("stride", 1):
+                print("Error in plot_dyn - the coordinates and momenta are saved with different strides\nExiting")
+                sys.exit(0)
+
             plt.subplot(1,2,2)            
             plt.title('q-p')        
             plt.xlabel('Coordiante, a.u.')        
@@ -1087,7 +1189,7 @@ def plot_dyn(plot_params):
                     indx = indx + 1
                     for tr in range(ntraj):
                         if tr in which_trajectories:                                    
-                            plt.plot(f["q/data"][:, tr, idof], f["p/data"][:, tr, idof], label="", linewidth=2, color = colors[ clrs_index[indx] ])                 
+                            plt.plot(property_vs_t(f, "q", steps, (tr, idof))[1], property_vs_t(f, "p", steps, (tr, idof))[1], label="", linewidth=2, color = colors[ clrs_index[indx] ])                 
                 
             plt.savefig(F"{out_prefix}/t-q-p.png", dpi=300)
             plt.show()
@@ -1112,7 +1214,7 @@ def plot_dyn(plot_params):
                     indx = indx + 1
                     for tr in range(ntraj):
                         if tr in which_trajectories:                                    
-                            plt.plot(f["time/data"][:], f["hvib_adi/data"][:, tr, istate, istate], label="", linewidth=2, color = colors[ clrs_index[indx] ])                 
+                            plt.plot(*property_vs_t(f, "hvib_adi", steps, (tr, istate, istate), time_units=1.0), label="", linewidth=2, color = colors[ clrs_index[indx] ])                 
 
             #============== Diabatic energies =============                            
             plt.subplot(1,2,2)            
@@ -1126,7 +1228,7 @@ def plot_dyn(plot_params):
                     indx = indx + 1
                     for tr in range(ntraj):
                         if tr in which_trajectories:                                    
-                            plt.plot(f["time/data"][:], f["hvib_dia/data"][:, tr, istate, istate], label="", linewidth=2, color = colors[ clrs_index[indx] ])
+                            plt.plot(*property_vs_t(f, "hvib_dia", steps, (tr, istate, istate), time_units=1.0), label="", linewidth=2, color = colors[ clrs_index[indx] ])
                             
             plt.savefig(F"{out_prefix}/t-hvib.png", dpi=300)
             plt.show()
@@ -1150,7 +1252,7 @@ def plot_dyn(plot_params):
                     indx = indx + 1
                     for tr in range(ntraj):
                         if tr in which_trajectories:                                    
-                            plt.plot(f["time/data"][:], f["St/data"][:, tr, istate, istate], label="", linewidth=2, color = colors[ clrs_index[indx] ])                 
+                            plt.plot(*property_vs_t(f, "St", steps, (tr, istate, istate), time_units=1.0), label="", linewidth=2, color = colors[ clrs_index[indx] ])                 
 
             #============== Projectors =============                            
             plt.subplot(1,2,2)            
@@ -1164,7 +1266,7 @@ def plot_dyn(plot_params):
                     indx = indx + 1
                     for tr in range(ntraj):
                         if tr in which_trajectories:                                    
-                            plt.plot(f["time/data"][:], f["projector/data"][:, tr, istate, istate], label="", linewidth=2, color = colors[ clrs_index[indx] ])
+                            plt.plot(*property_vs_t(f, "projector", steps, (tr, istate, istate), time_units=1.0), label="", linewidth=2, color = colors[ clrs_index[indx] ])
                             
             plt.savefig(F"{out_prefix}/St-projector.png", dpi=300)
             plt.show()
@@ -1192,7 +1294,7 @@ def plot_dyn(plot_params):
                             indx = indx + 1
                             for tr in range(ntraj):
                                 if tr in which_trajectories:                                    
-                                    plt.plot(f["time/data"][:], f["basis_transform/data"][:, tr, istate2, istate], label="", linewidth=2, color = colors[ clrs_index[indx] ])                 
+                                    plt.plot(*property_vs_t(f, "basis_transform", steps, (tr, istate2, istate), time_units=1.0), label="", linewidth=2, color = colors[ clrs_index[indx] ])                 
             
             plt.savefig(F"{out_prefix}/basis_transform.png", dpi=300)
             plt.show()
@@ -1213,6 +1315,8 @@ def plot_dyn_old(res):
     #obs_T, obs_q, obs_p, obs_Ekin, obs_Epot, obs_Etot, obs_dEkin, obs_dEpot, obs_dEtot, obs_Cadi, obs_Cdia, obs_dm_adi, obs_dm_dia, obs_pop  obs_states obs_hvib_adi obs_hvib_dia  obs_St
     """
 
+    import matplotlib.pyplot as plt
+
     colors = {}
 
     colors.update({"11": "#8b1a0e"})  # red       
@@ -1317,7 +1421,51 @@ def plot_dyn_old(res):
 
 
 
-def hdf2xyz(labels, filename, snaps, trajectories, atoms, unit_conversion_factor=1.0):
+def hdf2xyz_frames(labels, filename, snaps, trajectories, atoms, unit_conversion_factor=1.0):
+    """
+    This function yields the xyz-formatted frames one by one, reading from the HDF5 file only the
+    coordinates of the requested time step and trajectories, so the whole dataset is never loaded
+
+    Args: see `hdf2xyz`
+
+    Yields:
+        string: the xyz-formatted frame (header + coordinates) for the next time step in `snaps`
+
+    """
+
+    natoms = len(atoms)  # the actual number of atoms to show 
+    ntraj = len(trajectories)
+
+    with h5py.File(filename, 'r') as f:
+        q = f["q/data"]
+
+        # Row k of the coordinates saved with a stride is the step k * stride
+        stride = int(f["q"].attrs.get("stride", 1))
+        for isnap in snaps:
+            if isnap % stride != 0 or isnap // stride >= q.shape[0]:
+                print(F"Error in hdf2xyz_frames - the coordinates of the time step {isnap} are not saved in the file {filename}")
+                print(F"They are saved every {stride} steps, up to the step {(q.shape[0] - 1) * stride}\nExiting")
+                sys.exit(0)
+
+        for isnap in snaps:
+
+            frame = [ F"{natoms*ntraj}\nsnapshot {isnap}\n" ]
+
+            for itraj in trajectories:
+                coords = q[isnap // stride, itraj, :]
+
+                for iatom in atoms:
+                    x = coords[3*iatom+0] * unit_conversion_factor
+                    y = coords[3*iatom+1] * unit_conversion_factor
+                    z = coords[3*iatom+2] * unit_conversion_factor
+
+                    frame.append( F"{labels[iatom] }  {x} {y} {z}\n" )
+
+            yield "".join(frame)
+
+
+
+def hdf2xyz(labels, filename, snaps, trajectories, atoms, unit_conversion_factor=1.0, out_filename=None):
     """
     This function creates a string containing an xyz-formatted trajectory (multiple geometries)
     from an HDF5 file produced by the `compute.run_dynamics` function
@@ -1329,7 +1477,8 @@ def hdf2xyz(labels, filename, snaps, trajectories, atoms, unit_conversion_factor
             them are listed in the input parameter `atoms`
         filename ( string ): the name of the HDF5 file that contains the geometry 
         snaps ( list of ints ): indices of the timesteps to be included in the xyz file being generated.
-            This allows printing only simesteps of interest. 
+            This allows printing only simesteps of interest. If the coordinates are saved with a stride 
+            (see `save.property_strides`), only the saved steps - multiples of the stride - can be used
         trajectories ( list of ints ): indices of the trajectories that we want to include in the xyz file. 
             This allows plotting many trajectories at once (in every frame).
         atoms ( list of ints ): indices of the atomic species to be printed out to the xyz files (e.g. to 
@@ -1340,31 +1489,22 @@ def hdf2xyz(labels, filename, snaps, trajectories, atoms, unit_conversion_factor
             in the atomic units (Bohrs for the coordinates) and since the xyz files visualization works
             best in the Angstrom units, it is common situation to use the 
             `unit_conversion_factor = 1.0/units.Angst` conversion factor.
+        out_filename ( string or None ): if given, the frames are written to this file as they are
+            read, without keeping the whole trajectory in memory [ default: None ]
  
     Returns:
         string: the string representation of the xyz trajectory file that is made of the 
-            provided input geomtries/trajectories/atomic labels 
+            provided input geomtries/trajectories/atomic labels; if `out_filename` is given,
+            the name of the written file is returned instead
     
     """
-    
-    natoms = len(atoms)  # the actual number of atoms to show 
-    ntraj = len(trajectories)
-    
-    md_xyz = ""
-    
-    with h5py.File(filename, 'r') as f:
-    
-        for isnap in snaps:
-            
-            md_xyz = md_xyz + F"{natoms*ntraj}\nsnapshot {isnap}\n"
-            
-            for itraj in trajectories:
-                for iatom in atoms:
-                
-                    x = f["q/data"][isnap, itraj, 3*iatom+0] * unit_conversion_factor
-                    y = f["q/data"][isnap, itraj, 3*iatom+1] * unit_conversion_factor
-                    z = f["q/data"][isnap, itraj, 3*iatom+2] * unit_conversion_factor
-    
-                    md_xyz = md_xyz + F"{labels[iatom] }  {x} {y} {z}\n"                    
-    
-    return md_xyz
+
+    frames = hdf2xyz_frames(labels, filename, snaps, trajectories, atoms, unit_conversion_factor)
+
+    if out_filename != None:
+        with open(out_filename, "w") as f:
+            for frame in frames:
+                f.write(frame)
+        return out_filename
+
+    return "".join(frames)
@@ -15,6 +15,11 @@
        data, you shall add the corresponding info in these modules
 
        List of functions:
+           * init_tsh_data(saver, hdf5_output_level, _nsteps, _ntraj, _ndof, _nadi, _ndia, strides=None)
+           * init_tsh_savers(params, model_params, nsteps, ntraj, nnucl, nadi, ndia, strides=None)
+           * property_strides(params)
+           * due_properties(_savers, params, i, strides)
+           * save_tsh_properties(saver, i, strides, names, values)
 
 .. moduleauthor:: Alexey V. Akimov
   
@@ -50,43 +55,52 @@ import libra_py.data_savers as data_savers
 
 #===================== TSH calculations output ====================
 
-def init_tsh_data(saver, hdf5_output_level, _nsteps, _ntraj, _ndof, _nadi, _ndia):
+def init_tsh_data(saver, hdf5_output_level, _nsteps, _ntraj, _ndof, _nadi, _ndia, strides=None):
     """
     saver - can be either hdf5_saver or mem_saver
 
+    strides - { property: stride } - if given, the dataset for each property has only the 
+              rows for the steps at which this property is saved, see `property_strides`;
+              the stride is then stored as the "stride" attribute of the property's group
+
     """
 
+    def _nsave(name):
+        if strides == None:
+            return _nsteps
+        return (_nsteps + strides[name] - 1) // strides[name]
+
     if hdf5_output_level>=1:
 
         # Time axis (integer steps)
-        saver.add_dataset("timestep", (_nsteps,) , "I")  
+        saver.add_dataset("timestep", (_nsave("timestep"),) , "I")  
 
         # Time axis
-        saver.add_dataset("time", (_nsteps,) , "R")  
+        saver.add_dataset("time", (_nsave("time"),) , "R")  
         
         # Average kinetic energy
-        saver.add_dataset("Ekin_ave", (_nsteps,) , "R")  
+        saver.add_dataset("Ekin_ave", (_nsave("Ekin_ave"),) , "R")  
         
         # Average potential energy
-        saver.add_dataset("Epot_ave", (_nsteps,) , "R")  
+        saver.add_dataset("Epot_ave", (_nsave("Epot_ave"),) , "R")  
         
         # Average total energy
-        saver.add_dataset("Etot_ave", (_nsteps,) , "R")  
+        saver.add_dataset("Etot_ave", (_nsave("Etot_ave"),) , "R")  
         
         # Fluctuation of average kinetic energy
-        saver.add_dataset("dEkin_ave", (_nsteps,) , "R")  
+        saver.add_dataset("dEkin_ave", (_nsave("dEkin_ave"),) , "R")  
         
         # Fluctuation of average potential energy
-        saver.add_dataset("dEpot_ave", (_nsteps,) , "R")  
+        saver.add_dataset("dEpot_ave", (_nsave("dEpot_ave"),) , "R")  
         
         # Fluctuation of average total energy
-        saver.add_dataset("dEtot_ave", (_nsteps,) , "R")  
+        saver.add_dataset("dEtot_ave", (_nsave("dEtot_ave"),) , "R")  
 
         # Thermostat energy 
-        saver.add_dataset("Etherm", (_nsteps,) , "R")  
+        saver.add_dataset("Etherm", (_nsave("Etherm"),) , "R")  
 
         # System + thermostat energy
-        saver.add_dataset("E_NHC", (_nsteps,) , "R")  
+        saver.add_dataset("E_NHC", (_nsave("E_NHC"),) , "R")  
 
 
 
@@ -94,68 +108,75 @@ def init_tsh_data(saver, hdf5_output_level, _nsteps, _ntraj, _ndof, _nadi, _ndia
     if hdf5_output_level>=2:
 
         # Trajectory-resolved instantaneous adiabatic states
-        saver.add_dataset("states", (_nsteps, _ntraj), "I") 
+        saver.add_dataset("states", (_nsave("states"), _ntraj), "I") 
 
 
     if hdf5_output_level>=3:
 
         # Average adiabatic SH populations (dynamically-consistent)
-        saver.add_dataset("SH_pop", (_nsteps, _nadi, 1), "R") 
+        saver.add_dataset("SH_pop", (_nsave("SH_pop"), _nadi, 1), "R") 
 
         # Average adiabatic SH populations (raw)
-        saver.add_dataset("SH_pop_raw", (_nsteps, _nadi, 1), "R") 
+        saver.add_dataset("SH_pop_raw", (_nsave("SH_pop_raw"), _nadi, 1), "R") 
 
 
         # Average adiabatic density matrices (dynamically-consistent)
-        saver.add_dataset("D_adi", (_nsteps, _nadi, _nadi), "C") 
+        saver.add_dataset("D_adi", (_nsave("D_adi"), _nadi, _nadi), "C") 
 
         # Average adiabatic density matrices (raw)
-        saver.add_dataset("D_adi_raw", (_nsteps, _nadi, _nadi), "C") 
+        saver.add_dataset("D_adi_raw", (_nsave("D_adi_raw"), _nadi, _nadi), "C") 
 
 
         # Average diabatic density matrices (dynamically-consistent)
-        saver.add_dataset("D_dia", (_nsteps, _ndia, _ndia), "C") 
+        saver.add_dataset("D_dia", (_nsave("D_dia"), _ndia, _ndia), "C") 
 
         # Average diabatic density matrices (raw)
-        saver.add_dataset("D_dia_raw", (_nsteps, _ndia, _ndia), "C") 
+        saver.add_dataset("D_dia_raw", (_nsave("D_dia_raw"), _ndia, _ndia), "C") 
 
 
 
         # Trajectory-resolved coordinates
-        saver.add_dataset("q", (_nsteps, _ntraj, _ndof), "R") 
+        saver.add_dataset("q", (_nsave("q"), _ntraj, _ndof), "R") 
 
         # Trajectory-resolved momenta
-        saver.add_dataset("p", (_nsteps, _ntraj, _ndof), "R") 
+        saver.add_dataset("p", (_nsave("p"), _ntraj, _ndof), "R") 
 
         # Trajectory-resolved adiabatic TD-SE amplitudes
-        saver.add_dataset("Cadi", (_nsteps, _ntraj, _nadi), "C") 
+        saver.add_dataset("Cadi", (_nsave("Cadi"), _ntraj, _nadi), "C") 
 
         # Trajectory-resolved diabatic TD-SE amplitudes
-        saver.add_dataset("Cdia", (_nsteps, _ntraj, _ndia), "C") 
+        saver.add_dataset("Cdia", (_nsave("Cdia"), _ntraj, _ndia), "C") 
 
 
     if hdf5_output_level>=4:
 
         # Trajectory-resolved vibronic Hamiltoninans in the adiabatic representation
-        saver.add_dataset("hvib_adi", (_nsteps, _ntraj, _nadi, _nadi), "C") 
+        saver.add_dataset("hvib_adi", (_nsave("hvib_adi"), _ntraj, _nadi, _nadi), "C") 
 
         # Trajectory-resolved vibronic Hamiltoninans in the diabatic representation
-        saver.add_dataset("hvib_dia", (_nsteps, _ntraj, _ndia, _ndia), "C") 
+        saver.add_dataset("hvib_dia", (_nsave("hvib_dia"), _ntraj, _ndia, _ndia), "C") 
 
         # Trajectory-resolved time-overlaps of the adiabatic states
-        saver.add_dataset("St", (_nsteps, _ntraj, _nadi, _nadi), "C") 
+        saver.add_dataset("St", (_nsave("St"), _ntraj, _nadi, _nadi), "C") 
 
         # Trajectory-resolved diabatic-to-adiabatic transformation matrices 
-        saver.add_dataset("basis_transform", (_nsteps, _ntraj, _ndia, _nadi), "C") 
+        saver.add_dataset("basis_transform", (_nsave("basis_transform"), _ntraj, _ndia, _nadi), "C") 
 
         # Trajectory-resolved projector matrices (from the raw adiabatic to consistent adiabatic)
-        saver.add_dataset("projector", (_nsteps, _ntraj, _nadi, _nadi), "C") 
+        saver.add_dataset("projector", (_nsave("projector"), _ntraj, _nadi, _nadi), "C") 
+
+
+    # Row k of a strided property is the step k * stride
+    if strides != None:
+        for name, stride in strides.items():
+            if name in tsh_property_levels.keys() and tsh_property_levels[name] <= hdf5_output_level and stride > 1:
+                saver.add_attrs(name, {"stride": stride})
 
 
 
 
 
-def init_tsh_savers(params, model_params, nsteps, ntraj, nnucl, nadi, ndia):
+def init_tsh_savers(params, model_params, nsteps, ntraj, nnucl, nadi, ndia, strides=None):
 
     #================ Create savers ==================    
     prefix = params["prefix"]
@@ -183,7 +204,7 @@ def init_tsh_savers(params, model_params, nsteps, ntraj, nnucl, nadi, ndia):
     if hdf5_output_level > 0:                
         _savers["hdf5_saver"] = data_savers.hdf5_saver(F"{prefix}/data.hdf", properties_to_save) 
         _savers["hdf5_saver"].set_compression_level(params["use_compression"], params["compression_level"])
-        init_tsh_data(_savers["hdf5_saver"], hdf5_output_level, nsteps, ntraj, nnucl, nadi, ndia)
+        init_tsh_data(_savers["hdf5_saver"], hdf5_output_level, nsteps, ntraj, nnucl, nadi, ndia, strides)
 
 
     #====== TXT ========
@@ -195,7 +216,7 @@ def init_tsh_savers(params, model_params, nsteps, ntraj, nnucl, nadi, ndia):
 
     if mem_output_level > 0:
         _savers["mem_saver"] =  data_savers.mem_saver(properties_to_save)
-        init_tsh_data(_savers["mem_saver"], mem_output_level, nsteps, ntraj, nnucl, nadi, ndia)
+        init_tsh_data(_savers["mem_saver"], mem_output_level, nsteps, ntraj, nnucl, nadi, ndia, strides)
 
 
     return _savers                         
@@ -204,6 +225,126 @@ def init_tsh_savers(params, model_params, nsteps, ntraj, nnucl, nadi, ndia):
 
 
 
+# The output level at which each property becomes available
+tsh_property_levels = { "timestep":1, "time":1, "Ekin_ave":1, "Epot_ave":1, "Etot_ave":1, 
+                        "dEkin_ave":1, "dEpot_ave":1, "dEtot_ave":1, "Etherm":1, "E_NHC":1,
+                        "states":2,
+                        "SH_pop":3, "SH_pop_raw":3, "D_adi":3, "D_adi_raw":3, "D_dia":3, "D_dia_raw":3,
+                        "q":3, "p":3, "Cadi":3, "Cdia":3,
+                        "hvib_adi":4, "hvib_dia":4, "St":4, "basis_transform":4, "projector":4
+                      }
+
+
+def property_strides(params):
+    """
+    Defines how often each property is saved
+
+    Args:
+        params ( dictionary ): the parameters of the dynamics, the following keys are used:
+
+            * **params["save_every"]** ( int ): the default stride for all properties [ default: 1 ]
+            * **params["save_every_property"]** ( dictionary ): { property: stride } - the strides
+                for the selected properties, to override the default one [ default: {} ]
+
+    Returns:
+        dictionary: { property: stride } for all the properties in `tsh_property_levels`
+
+    """
+
+    save_every = 1
+    if "save_every" in params.keys():
+        save_every = params["save_every"]
+
+    strides = { name: save_every for name in tsh_property_levels.keys() }
+
+    if "save_every_property" in params.keys():
+        strides.update( params["save_every_property"] )
+
+    return strides
+
+
+
+def due_properties(_savers, params, i, strides):
+    """
+    Determines which properties are to be saved at a given step by each of the savers
+
+    A property is saved by a saver, if it is listed in `properties_to_save` and in the saver's keywords, 
+    the output level of the saver is high enough, and the step is a multiple of the property's stride
+
+    Args:
+        _savers ( dictionary ): the savers, as returned by `init_tsh_savers`
+        params ( dictionary ): the parameters of the dynamics ("hdf5_output_level", "mem_output_level",
+            "properties_to_save")
+        i ( int ): the index of the step
+        strides ( dictionary ): { property: stride }, see `property_strides`
+
+    Returns:
+        dictionary: { saver_name: set of property names }, only for the savers with something to save
+
+    """
+
+    res = {}
+
+    for saver_name, level_name in [ ("hdf5_saver", "hdf5_output_level"), ("mem_saver", "mem_output_level") ]:
+        saver = _savers[saver_name]
+        if saver == None:
+            continue
+
+        level = params[level_name]
+        names = set()
+        for name in params["properties_to_save"]:
+            if name in saver.keywords and name in tsh_property_levels.keys():
+                if tsh_property_levels[name] <= level and i % strides[name] == 0:
+                    names.add(name)
+
+        if len(names) > 0:
+            res[saver_name] = names
+
+    return res
+
+
+
+def save_tsh_properties(saver, i, strides, names, values):
+    """
+    Saves the selected properties computed at a given step
+
+    saver - can be either hdf5_saver or mem_saver
+
+    Args:
+        saver ( hdf5_saver or mem_saver ): the saver object
+        i ( int ): the index of the step
+        strides ( dictionary ): { property: stride }, see `property_strides`
+        names ( set of strings ): the names of the properties to save
+        values ( dictionary ): { property: value } - the values of the properties; for the 
+            trajectory-resolved matrices (level 4 properties), the values are lists of `ntraj` matrices 
+
+    """
+
+    for name in names:
+        row = i // strides[name]
+        level = tsh_property_levels[name]
+        data = values[name]
+
+        if level == 1:
+            saver.save_scalar(row, name, data)
+
+        elif name == "states":
+            for itraj in range(len(data)):
+                saver.save_multi_scalar(row, itraj, name, data[itraj])
+
+        elif name in ["q", "p", "Cadi", "Cdia"]:
+            saver.save_matrix(row, name, data.T())
+
+        elif level == 3:
+            saver.save_matrix(row, name, data)
+
+        elif level == 4:
+            for tr in range(len(data)):
+                saver.save_multi_matrix(row, tr, name, data[tr])
+
+
+
+
 def save_hdf5_1D(saver, i, dt, Ekin, Epot, Etot, dEkin, dEpot, dEtot, Etherm, E_NHC):
     """
     saver - can be either hdf5_saver or mem_saver
@@ -12,6 +12,8 @@
    :platform: Unix, Windows
    :synopsis: This module implements the functions to read the HDF5 files with the results of the dynamical calculations
        List of functions:
+           * scan_pes(comp_model, model_params, coords, pes_params_)
+           * plot_pes_properties(comp_model, model_params, pes_params_, plot_params_)
            * plot_surfaces(_compute_model, _param_sets, states_of_interest, xmin, xmax, dx, plot_params)
            * plot_dyn(plot_params)
            * plot_dyn_old(res)
@@ -30,13 +32,13 @@ __email__ = "alexvakimov@gmail.com"
 __url__ = "https://quantum-dynamics-hub.github.io/libra/index.html"
 
 
-import h5py
 import numpy as np
 
 import os
 import sys
 import math
 import copy
+import multiprocessing as mp
 
 if sys.platform=="cygwin":
     from cyglibra_core import *
@@ -44,11 +46,154 @@ elif sys.platform=="linux" or sys.platform=="linux2":
     from liblibra_core import *
 
 import util.libutil as comn
+import libra_py.data_conv as data_conv
 
-import matplotlib.pyplot as plt   # plots
 #from matplotlib.mlab import griddata
 
 
+pes_scan_properties = ["ham_dia", "ham_adi", "basis_transform", "d1ham_dia", "d1ham_adi", "dc1_dia", "dc1_adi"]
+
+
+def _scan_pes_chunk(args):
+    """
+    Computes the properties for one chunk of the geometries, see `scan_pes`
+
+    Args:
+        args ( tuple ): (comp_model, model_params, coords, ndia, nadi, rep_tdse, rep_ham, properties),
+            where coords is a numpy array (ndof, npoints)
+
+    Returns:
+        dictionary: property name -> numpy array (npoints, ...) of the property values
+
+    """
+
+    comp_model, model_params, coords, ndia, nadi, rep_tdse, rep_ham, properties = args
+
+    ndof, npts = coords.shape
+
+    # Every geometry is a child of the same Hamiltonian, as the trajectories in the ensemble dynamics
+    ham = nHamiltonian(ndia, nadi, ndof)
+    ham.add_new_children(ndia, nadi, ndof, npts)
+    ham.init_all(2,1)
+
+    projectors = CMATRIXList()
+    for tr in range(npts):
+        projectors.append(CMATRIX(nadi, nadi))
+        projectors[tr].identity()
+
+    update_Hamiltonian_q( {"rep_tdse":rep_tdse, "rep_ham":rep_ham}, 
+                          data_conv.nparray2MATRIX(coords), projectors, ham, comp_model, model_params)
+
+    ids = [ Py2Cpp_int([0, tr]) for tr in range(npts) ]
+
+    res = {}
+    for prop in properties:
+        if prop == "basis_transform":
+            res[prop] = data_conv.MATRIXList2nparray( ham.get_basis_transform_children() )
+
+        elif prop in ["ham_dia", "ham_adi"]:
+            get_prop = getattr(ham, F"get_{prop}")
+            res[prop] = data_conv.MATRIXList2nparray( [ get_prop(ids[tr]) for tr in range(npts) ] )
+
+        else:
+            get_prop = getattr(ham, F"get_{prop}")
+            res[prop] = np.array( [ data_conv.MATRIXList2nparray( [ get_prop(idof, ids[tr]) for idof in range(ndof) ] )
+                                    for tr in range(npts) ] )
+
+    return res
+
+
+def scan_pes(comp_model, model_params, coords, pes_params_):
+    """
+    Computes the Hamiltonian properties for many geometries at once. The geometries are split into
+    chunks and all the geometries of a chunk are treated as the children of one nHamiltonian (like the
+    trajectories of an ensemble), so the model is evaluated for the whole chunk in one `update_Hamiltonian_q` call
+
+    Args:
+        comp_model ( PyObject ): the function that returns the class with Hamiltonian properties.
+            To compute more than one geometry at once (chunk_size > 1), it should select the geometry
+            by the last index of the `full_id` argument, like in the ensemble dynamics, 
+            e.g. `q.col( Cpp2Py(full_id)[-1] )`
+
+        model_params ( dictionary ): parameters of the model Hamiltonian, the same for all geometries;
+            with chunk_size = 1, the model gets a copy of them with model_params["timestep"] set to 
+            the index of the geometry
+
+        coords ( MATRIX(ndof, npoints) or numpy array (ndof, npoints) ): the geometries to compute
+
+        pes_params_ ( dictionary ): controls the way the calculations are done
+
+            Can contain the following parameters
+
+            * **pes_params["ndia"]** ( int ): dinemsionality of the diabatic Hamiltonian [ default: 2 ]
+            * **pes_params["nadi"]** ( int ): dinemsionality of the adiabatic Hamiltonian [ default: 2 ]
+            * **pes_params["rep_tdse"]** ( 0 or 1 ): representation we are interested in
+                ( 0 - diabatic, 1 - adiabatic) [ required ]
+            * **pes_params["rep_ham"]** ( 0 or 1 ): representation of the Hamiltonian returned 
+                by the `comp_model` function ( 0 - diabatic, 1 - adiabatic) [ required ]
+            * **pes_params["properties"]** ( list of strings ): the properties to compute, any of:
+                "ham_dia", "ham_adi", "basis_transform", "d1ham_dia", "d1ham_adi", "dc1_dia", "dc1_adi"
+                [ default: ["ham_dia", "ham_adi"] ]
+            * **pes_params["chunk_size"]** ( int ): how many geometries to compute at once; the values
+                larger than 1 are only valid for the models that use the `full_id` argument [ default: 1 ]
+            * **pes_params["nprocs"]** ( int ): the number of processes to distribute the chunks over; for
+                nprocs > 1, `comp_model` and `model_params` should be picklable [ default: 1 ]
+
+    Returns:
+        dictionary: for every requested property, the numpy array of complex numbers of shape
+            (npoints, n, n) for "ham_dia", "ham_adi", and "basis_transform", or
+            (npoints, ndof, n, n) for the derivatives and derivative couplings
+
+    """
+
+    pes_params = dict(pes_params_)
+    pes_params_critical = [ "rep_tdse", "rep_ham" ] 
+    pes_params_default = { "ndia":2, "nadi":2,
+                           "properties":["ham_dia", "ham_adi"],
+                           "chunk_size":1, "nprocs":1
+                         }
+    comn.check_input(pes_params, pes_params_default, pes_params_critical)
+
+    ndia = pes_params["ndia"]
+    nadi = pes_params["nadi"]
+    rep_tdse = pes_params["rep_tdse"]
+    rep_ham = pes_params["rep_ham"]
+    properties = pes_params["properties"]
+    chunk_size = pes_params["chunk_size"]
+    nprocs = pes_params["nprocs"]
+
+    for prop in properties:
+        if prop not in pes_scan_properties:
+            print(F"Error in scan_pes - the property {prop} is not available\n")
+            print(F"Must be one of the following options: {pes_scan_properties}\nExiting")
+            sys.exit(0)
+
+    if isinstance(coords, MATRIX):
+        coords = data_conv.MATRIX2nparray(coords)
+    coords = np.asarray(coords, dtype=float)
+    npts = coords.shape[1]
+
+    tasks = []
+    for start in range(0, npts, chunk_size):
+        _model_params = model_params
+        if chunk_size == 1:
+            # Point by point, the model may use the index of the point as the timestep
+            _model_params = dict(model_params)
+            _model_params["timestep"] = start
+        tasks.append( (comp_model, _model_params, coords[:, start : start + chunk_size], 
+                       ndia, nadi, rep_tdse, rep_ham, properties) )
+
+    if nprocs > 1 and len(tasks) > 1:
+        pool = mp.Pool( processes = nprocs )
+        results = pool.map(_scan_pes_chunk, tasks)
+        pool.close()
+        pool.join()
+    else:
+        results = [ _scan_pes_chunk(task) for task in tasks ]
+
+    return { prop: np.concatenate( [ x[prop] for x in results ] ) for prop in properties }
+
+
 def plot_pes_properties(comp_model, model_params, pes_params_, plot_params_):    
     """
         Args:
@@ -81,6 +226,9 @@ def plot_pes_properties(comp_model, model_params, pes_params_, plot_params_):
                     ( 0 - diabatic, 1 - adiabatic) [ required ]
                 * **pes_params["rep_ham"]** ( 0 or 1 ): representation of the Hamiltonian returned 
                     by the `comp_model` function ( 0 - diabatic, 1 - adiabatic) [ required ]                    
+                * **pes_params["chunk_size"]** ( int ): how many grid points to compute at once, matters only if
+                    coord_type = 0, see `scan_pes` [ default: 1 ]
+                * **pes_params["nprocs"]** ( int ): the number of processes for the scan, see `scan_pes` [ default: 1 ]
                     
             plot_params_ ( dictionary ): determines what to print and how to do it, can contain the following keys:
             
@@ -112,6 +260,8 @@ def plot_pes_properties(comp_model, model_params, pes_params_, plot_params_):
 
                     
     """
+
+    import matplotlib.pyplot as plt
     
     pes_params = dict(pes_params_)
     pes_params_critical = [ "rep_tdse", "rep_ham" ] 
@@ -121,7 +271,8 @@ def plot_pes_properties(comp_model, model_params, pes_params_, plot_params_):
                            "reference_coord":MATRIX(1, 0),
                            "coord_mapping":None,
                            "xmin":-10.0, "xmax":10.0, "dx":1.0,
-                           "tmin":0, "tmax":10, "dt":1
+                           "tmin":0, "tmax":10, "dt":1,
+                           "chunk_size":1, "nprocs":1
                          }
     comn.check_input(pes_params, pes_params_default, pes_params_critical)
 
@@ -195,57 +346,13 @@ def plot_pes_properties(comp_model, model_params, pes_params_, plot_params_):
 
         
             
-    # ======= Hierarchy of Hamiltonians =======
-    tol = 0.01
-    ham = nHamiltonian(ndia, nadi, ndof)
-    ham.init_all(2)
-    ham.phase_corr_ovlp_tol = tol
-
-    ham1 = [] 
-    for tr in range(1):
-        ham1.append( nHamiltonian(ndia, nadi, ndof) )        
-        ham1[tr].init_all(2)
-        ham1[tr].phase_corr_ovlp_tol = tol
-        ham.add_child(ham1[tr])
-        
-    projectors = CMATRIXList()
-    for tr in range(1):
-        projectors.append(CMATRIX(nadi, nadi))
-        projectors[tr].identity()   
-
-        
-    # Energies, forces, and couplings    
-    ham_dia = []
-    ham_adi = []
-    d1ham_dia = []
-    d1ham_adi = []
-    dc1_dia = []
-    dc1_adi = []
-    
-    for i in which_ham_dia:
-        ham_dia.append([])
-        
-    for i in which_ham_adi:
-        ham_adi.append([])
-        
-    for i in which_d1ham_dia:
-        d1ham_dia.append([])
-        
-    for i in which_d1ham_adi:
-        d1ham_adi.append([])
-        
-    for i in which_dc1_dia:
-        dc1_dia.append([])
-        
-    for i in which_dc1_adi:
-        dc1_adi.append([])
-        
-                    
+    # ======= Geometries =======
     nsteps = len(grid)
     scan_path = []
-    
-    tid = Py2Cpp_int([0, 0])
-    
+
+    if reference_coord.num_of_cols==0:
+        reference_coord = MATRIX(ndof, 1)
+
     for step in range(nsteps):
         q = None
         if coord_mapping == None:
@@ -255,35 +362,30 @@ def plot_pes_properties(comp_model, model_params, pes_params_, plot_params_):
             q = coord_mapping(grid[step])
         scan_path.append( MATRIX(q) )
 
-        model_params["timestep"] = step
-            
-        update_Hamiltonian_q( {"rep_tdse":rep_tdse, "rep_ham":rep_ham}, 
-                              q, projectors, ham, comp_model, model_params)
-        
-        #if rep_tdse==0: 
-            
-        for it_indx, it in enumerate(which_ham_dia):                
-            ham_dia[it_indx].append( ham.get_ham_dia(tid).get(it[0], it[1]).real )
-                
-        for it_indx, it in enumerate(which_d1ham_dia):                
-            d1ham_dia[it_indx].append( ham.get_d1ham_dia(it[0],tid).get(it[1], it[2]).real )
+    coords = np.concatenate( [ data_conv.MATRIX2nparray(q) for q in scan_path ], axis=1 )
 
-        for it_indx, it in enumerate(which_dc1_dia):                
-            dc1_dia[it_indx].append( ham.get_dc1_dia(it[0],tid).get(it[1], it[2]).real )
-                
-            
-        #elif rep_tdse==1:   
-            
-        for it_indx, it in enumerate(which_ham_adi):                
-            ham_adi[it_indx].append( ham.get_ham_adi(tid).get(it[0], it[1]).real )
 
-        for it_indx, it in enumerate(which_d1ham_adi):                
-            d1ham_adi[it_indx].append( ham.get_d1ham_adi(it[0],tid).get(it[1], it[2]).real )
+    # ======= Energies, forces, and couplings =======
+    which = { "ham_dia":which_ham_dia, "ham_adi":which_ham_adi,
+              "d1ham_dia":which_d1ham_dia, "d1ham_adi":which_d1ham_adi,
+              "dc1_dia":which_dc1_dia, "dc1_adi":which_dc1_adi }
+    properties = [ prop for prop in which.keys() if len(which[prop]) > 0 ]
 
-        for it_indx, it in enumerate(which_dc1_adi):                
-            dc1_adi[it_indx].append( ham.get_dc1_adi(it[0],tid).get(it[1], it[2]).real )
+    scan_params = { "ndia":ndia, "nadi":nadi, "rep_tdse":rep_tdse, "rep_ham":rep_ham, "properties":properties,
+                    "chunk_size":pes_params["chunk_size"], "nprocs":pes_params["nprocs"] }
 
-        
+    if coord_type==1:
+        # The model depends on the timestep, so the points are computed one by one
+        scan_params["chunk_size"] = 1
+
+    res = scan_pes(comp_model, model_params, coords, scan_params)
+
+    ham_dia = [ res["ham_dia"][:, it[0], it[1]].real for it in which_ham_dia ]
+    ham_adi = [ res["ham_adi"][:, it[0], it[1]].real for it in which_ham_adi ]
+    d1ham_dia = [ res["d1ham_dia"][:, it[0], it[1], it[2]].real for it in which_d1ham_dia ]
+    d1ham_adi = [ res["d1ham_adi"][:, it[0], it[1], it[2]].real for it in which_d1ham_adi ]
+    dc1_dia = [ res["dc1_dia"][:, it[0], it[1], it[2]].real for it in which_dc1_dia ]
+    dc1_adi = [ res["dc1_adi"][:, it[0], it[1], it[2]].real for it in which_dc1_adi ]
 
        
     plt.rc('axes', titlesize=38)      # fontsize of the axes title
@@ -388,9 +490,15 @@ def plot_surfaces(_compute_model, _param_sets, states_of_interest, xmin, xmax, d
         _active_dof ( int ): the index of the DOF used to construct the PES [ default: 0 ]
         _all_coodinates ( list of doubles ): values of all coordinates, the one at the position of `_active_dof` will be disregarded, while all
             other will be fixed at the values provided
+
+        The scan is done by `scan_pes`; the number of points computed at once is set by plot_params["chunk_size"],
+        the values larger than 1 need `_compute_model` to select the geometry by the last index of its 
+        `full_id` argument [ default: 1 ]
         
     """
 
+    import matplotlib.pyplot as plt
+
 
     colors_ = {}
 
@@ -416,7 +524,8 @@ def plot_surfaces(_compute_model, _param_sets, states_of_interest, xmin, xmax, d
     # Parameters and dimensions
     critical_params = [  ] 
     default_params = {  "colors":colors_, "clrs_index":clrs_index_,
-                        "xlim":[-7.5, 15], "ylim":[-0.005, 0.025]
+                        "xlim":[-7.5, 15], "ylim":[-0.005, 0.025],
+                        "chunk_size":1
                      }
     comn.check_input(plot_params, default_params, critical_params)
         
@@ -453,47 +562,25 @@ def plot_surfaces(_compute_model, _param_sets, states_of_interest, xmin, xmax, d
         n = _param_sets[iset]["nstates"]
         nstates = n
         
-        ham = nHamiltonian(nstates, nstates, _ndof) # ndia, nadi, nnucl
-        ham.init_all(2)
-
-        
-        hdia, hadi  = [], []  
-        uij = []              # projecitions of the MOs onto elementary basis
-    
-        for k1 in range(nstates):
-            hadi.append([])
-            hdia.append([])
-            uij_k1 = []
-            for k2 in range(nstates):
-                uij_k1.append([])
-            uij.append(uij_k1)
-                
-    
-        for i in range(nsteps):
-
-            scan_coord = MATRIX(_ndof, 1);
-            for j in range(_ndof):
-                scan_coord.set(j, 0, _all_coordinates[j])                 
-            scan_coord.set(_active_dof, 0, X[i])  
-        
-            # Diabatic properties
-            ham.compute_diabatic(_compute_model, scan_coord, _param_sets[iset])
-            
-            # Adiabatic properties
-            ham.compute_adiabatic(1);       
-        
-            U = ham.get_basis_transform()
-            #P = U * U.H()  # population matrix
-        
-            for k1 in range(nstates):
-                hadi[k1].append(ham.get_ham_adi().get(k1, k1).real)
-                hdia[k1].append(ham.get_ham_dia().get(k1, k1).real)
-            
-                for k2 in range(nstates):
-                    uij[k1][k2].append(U.get(k1,k2).real**2 + U.get(k1,k2).imag**2)
+        coords = np.zeros((_ndof, nsteps))
+        for j in range(_ndof):
+            coords[j, :] = _all_coordinates[j]
+        coords[_active_dof, :] = X
+
+        # Diabatic and adiabatic properties
+        res = scan_pes(_compute_model, _param_sets[iset], coords,
+                       { "ndia":nstates, "nadi":nstates, "rep_tdse":1, "rep_ham":0,
+                         "properties":["ham_dia", "ham_adi", "basis_transform"],
+                         "chunk_size":plot_params["chunk_size"] } )
+
+        hdia = [ res["ham_dia"][:, k1, k1].real for k1 in range(nstates) ]
+        hadi = [ res["ham_adi"][:, k1, k1].real for k1 in range(nstates) ]
+
+        # projecitions of the MOs onto elementary basis
+        U = res["basis_transform"]
+        uij = [ [ U[:, k1, k2].real**2 + U[:, k1, k2].imag**2 for k2 in range(nstates) ] for k1 in range(nstates) ]
                     
 
-                    
         plt.figure(2*iset, figsize=(36, 18)) # dpi=300, frameon=False)
                 
         plt.subplot(1, 2, 1)    
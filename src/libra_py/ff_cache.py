@@ -0,0 +1,236 @@
+#*********************************************************************************
+#* Copyright (C) 2021 Alexey V. Akimov
+#*
+#* This file is distributed under the terms of the GNU General Public License
+#* as published by the Free Software Foundation, either version 3 of
+#* the License, or (at your option) any later version.
+#* See the file LICENSE in the root directory of this distribution
+#* or <http://www.gnu.org/licenses/>.
+#***********************************************************************************
+"""
+.. module:: ff_cache
+   :platform: Unix, Windows
+   :synopsis: This module implements the cache of the parsed force field parameter files
+       used by the LoadUFF, LoadGAFF, LoadTRIPOS and LoadMMFF94 modules. The text files
+       are parsed only once: the parsed records are kept in memory for the rest of the
+       process and are pickled into the user cache directory for the other processes.
+
+       List of functions:
+           * cache_dir()
+           * code_digest(code, h)
+           * pack(records)
+           * load(parser, files, use_cache=True)
+           * apply(force_field, blocks)
+
+.. moduleauthors:: Alexey V. Akimov
+
+"""
+
+__author__ = "Alexey V. Akimov"
+__copyright__ = "Copyright 2021 Alexey V. Akimov"
+__credits__ = ["Alexey V. Akimov"]
+__license__ = "GNU-3"
+__version__ = "1.0"
+__maintainer__ = "Alexey V. Akimov"
+__email__ = "alexvakimov@gmail.com"
+__url__ = "https://quantum-dynamics-hub.github.io/libra/index.html"
+
+
+import os
+import sys
+import hashlib
+import pickle
+
+if sys.platform=="cygwin":
+    from cyglibra_core import *
+elif sys.platform=="linux" or sys.platform=="linux2":
+    from liblibra_core import *
+
+
+# Change this when the format of the records produced by the parsers changes; the changes
+# of the parsers themselves are detected by `code_digest`
+CACHE_VERSION = 1
+
+# The blocks parsed in this process: { (parser, ((path, mtime, size), ...)): blocks }
+_memo = {}
+
+
+
+def cache_dir():
+    """
+    Returns:
+        string: the directory where the parsed force field parameters are stored:
+            $LIBRA_CACHE_DIR/force_fields if the variable is set, otherwise
+            $XDG_CACHE_HOME/libra/force_fields [ default: ~/.cache/libra/force_fields ]
+
+    """
+
+    root = os.environ.get("LIBRA_CACHE_DIR")
+    if root is None:
+        root = os.path.join( os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "libra")
+
+    return os.path.join(root, "force_fields")
+
+
+
+def code_digest(code, h):
+    """
+    Adds the compiled code of a function to a hash, so that any change of the function invalidates
+    the records it has produced
+
+    Args:
+        code ( code object ): the code of the function, e.g. parser.__code__
+        h ( hashlib object ): the hash to update
+
+    Returns:
+        None: but the `h` object is updated with the bytecode, the names used, and the constants,
+            including those of the nested functions
+
+    """
+
+    h.update( code.co_code )
+    h.update( repr( (code.co_names, code.co_varnames) ).encode() )
+    for const in code.co_consts:
+        if hasattr(const, "co_code"):
+            code_digest(const, h)
+        elif isinstance(const, frozenset):
+            # The order of the elements depends on the hash seed, which changes from process to process
+            h.update( repr(sorted( repr(x) for x in const )).encode() )
+        else:
+            h.update( repr(const).encode() )
+
+
+
+def pack(records):
+    """
+    Groups the consecutive records of the same kind into compact blocks
+
+    Args:
+        records ( list of tuples ): (kind, attributes, args), where:
+
+            * kind = "Atom", "Bond", "Angle", "Dihedral" or "Improper": the attributes ( dictionary )
+                are to be set into the corresponding *_Record object, which is then added with
+                force_field.Add_<kind>_Record(record, *args)
+            * kind = "set": the attributes ( dictionary ) are the global parameters of the force
+                field, to be passed to force_field.set(attributes)
+
+    Returns:
+        list of tuples: (kind, keys, args, rows) - the records with the same kind, args and the names
+            of the attributes ( keys ) share one block, rows[i] is the tuple of the attribute values
+
+    """
+
+    blocks = []
+    for kind, attributes, args in records:
+        keys = tuple(attributes.keys())
+        # Interning the repeated strings (atom types) lets pickle store each of them only once
+        row = tuple( sys.intern(v) if isinstance(v, str) else v for v in attributes.values() )
+        if len(blocks)>0 and blocks[-1][0]==kind and blocks[-1][1]==keys and blocks[-1][2]==args:
+            blocks[-1][3].append(row)
+        else:
+            blocks.append( (kind, keys, args, [row]) )
+
+    return blocks
+
+
+
+def load(parser, files, use_cache=True):
+    """
+    Returns the records parsed from the force field parameter files, parsing them only if needed
+
+    The records are first looked up in memory (by the parser and the paths, modification times
+    and sizes of the files), then in the cache directory (by the parser and its code, paths, 
+    modification times and the contents of the files). Only if both fail, `parser` is called and 
+    its result is stored. So, editing any of the files or the parser makes the old records stale.
+
+    Args:
+        parser ( function ): parser(*files) returns the list of records, see `pack`
+        files ( list of strings ): the names of the parameter files
+        use_cache ( Boolean ): whether to use the cache at all [ default: True ]
+
+    Returns:
+        list of tuples: the records packed into blocks, see `pack`
+
+    """
+
+    if not use_cache:
+        return pack( parser(*files) )
+
+    paths = [ os.path.abspath(filename) for filename in files ]
+    stats = [ os.stat(path) for path in paths ]
+
+    name = F"{parser.__module__}.{parser.__name__}"
+    memo_key = ( name, tuple( (path, st.st_mtime_ns, st.st_size) for path, st in zip(paths, stats) ) )
+    if memo_key in _memo:
+        return _memo[memo_key]
+
+    h = hashlib.sha256()
+    h.update( F"{CACHE_VERSION} {name}".encode() )
+    code_digest(parser.__code__, h)
+    for path, st in zip(paths, stats):
+        h.update( F"\n{path} {st.st_mtime_ns}\n".encode() )
+        with open(path, "rb") as f:
+            h.update( f.read() )
+    cache_file = os.path.join( cache_dir(), h.hexdigest() + ".pkl" )
+
+    blocks = None
+    if os.path.isfile(cache_file):
+        try:
+            with open(cache_file, "rb") as f:
+                blocks = pickle.load(f)
+        except Exception:
+            # A truncated or incompatible file - the cache is only an optimization, so just parse again
+            blocks = None
+
+    if blocks is None:
+        blocks = pack( parser(*files) )
+
+        # Write to a temporary file first, so the concurrent jobs never see a partial file.
+        # The cache is only an optimization, so the failures to write it are ignored
+        try:
+            os.makedirs( cache_dir(), exist_ok=True )
+            tmp_file = F"{cache_file}.{os.getpid()}"
+            with open(tmp_file, "wb") as f:
+                pickle.dump(blocks, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            pass
+
+    _memo[memo_key] = blocks
+
+    return blocks
+
+
+
+class _record:
+    pass
+
+_record_types = { "Atom":Atom_Record, "Bond":Bond_Record, "Angle":Angle_Record,
+                  "Dihedral":Dihedral_Record, "Improper":Dihedral_Record }
+
+
+def apply(force_field, blocks):
+    """
+    Sets up the force field object with the parsed records, in the order they were parsed
+
+    Args:
+        force_field ( ForceField ): the object to set up
+        blocks ( list of tuples ): the records packed into blocks, see `pack`
+
+    Returns:
+        None: but the `force_field` object is updated
+
+    """
+
+    for kind, keys, args, rows in blocks:
+        for row in rows:
+            if kind=="set":
+                force_field.set( dict(zip(keys, row)) )
+            else:
+                ff = _record()
+                ff.__dict__.update( zip(keys, row) )
+
+                record = _record_types[kind]()
+                record.set(ff)
+                getattr(force_field, "Add_"+kind+"_Record")(record, *args)
+
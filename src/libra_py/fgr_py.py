@@ -25,6 +25,7 @@ import sys
 import cmath
 import math
 import os
+import numpy as np
 
 if sys.platform=="cygwin":
     from cyglibra_core import *
@@ -34,6 +35,167 @@ elif sys.platform=="linux" or sys.platform=="linux2":
 import util.libutil as comn
 from . import units
 
+
+
+#========= NumPy versions of the Integrand_NE_* and Linear_NE_* functions (see fgr.cpp) ===========
+# Each function computes the sums over all the normal modes of the integrand (in the exponent) and of
+# the linear term for all the values in `tau` (a 1D numpy array). The mode parameters `omega`, `gamma`,
+# `req`, and `shift` are the numpy arrays. Only sin(wt/2) and cos(wt/2) are evaluated on the (tau x modes)
+# grid, all the other trigonometric functions of wt and (wtp - wt) are obtained from them by the angle
+# addition formulas, and the sums over modes are done as the matrix-vector products
+
+def _NE_half_angles(tp, tau, omega):
+    """
+    The trigonometric functions needed by the NE integrands:
+    sh, ch, s, c = sin(wt/2), cos(wt/2), sin(wt), cos(wt) on the (tau x modes) grid,
+    swtp, cwtp = sin(wtp), cos(wtp) for all modes
+    """
+
+    wt_half = 0.5 * np.outer(tau, omega)
+    sh, ch = np.sin(wt_half), np.cos(wt_half)
+    s, c = 2.0*sh*ch, 1.0 - 2.0*sh*sh
+
+    wtp = omega*tp
+    return sh, ch, s, c, np.sin(wtp), np.cos(wtp)
+
+
+def _NE_exact_integrand(sh, s, c, swtp, cwtp, omega, req, shift, beta):
+    sin_d = swtp*c - cwtp*s    # sin(wtp - wt)
+
+    Coth = 1.0 / np.tanh(0.5*omega*beta)
+    pref = omega*req*req*0.5
+
+    argg_re = np.dot(2.0*sh*sh, -pref*Coth)
+    argg_im = np.dot(s, -pref) + np.dot(sin_d - swtp, omega*req*shift)
+
+    return argg_re + 1.0j*argg_im
+
+
+def _NE_exact(tp, tau, omega, gamma, req, shift, beta):
+    sh, ch, s, c, swtp, cwtp = _NE_half_angles(tp, tau, omega)
+    cos_d = cwtp*c + swtp*s    # cos(wtp - wt)
+    one_c = 2.0*sh*sh          # 1 - cos(wt)
+
+    argg = _NE_exact_integrand(sh, s, c, swtp, cwtp, omega, req, shift, beta)
+
+    Coth = 1.0 / np.tanh(0.5*omega*beta)
+    u2_re = one_c * req
+    u2_im = s * (req*Coth)
+    a1 = u2_re - 2.0*shift*cwtp
+    a2 = u2_re - 2.0*shift*cos_d
+    g2 = gamma*gamma
+
+    lin_re = np.dot(c, g2*0.5/omega*Coth) + np.dot(0.25*a1*a2 - 0.25*u2_im*u2_im, g2)
+    lin_im = np.dot(s, -g2*0.5/omega) + np.dot(0.25*(a1 + a2)*u2_im, g2)
+
+    return argg, lin_re + 1.0j*lin_im
+
+
+def _NE_LSC_bracket(sh, ch, s, c, tp, omega):
+    """
+    The common terms of the LSC and CAV linear terms:
+    x1 = cos(4wtp - 2wt) + cos(wt)
+    x2 = (1-2cos(wt))*sin(wtp) + sin(wtp-2wt) - 4cos(3wtp - 1.5wt)*sin(0.5wt)
+    """
+
+    wtp = omega*tp
+    c2, s2 = c*c - s*s, 2.0*s*c          # cos(2wt), sin(2wt)
+    c15, s15 = c*ch - s*sh, s*ch + c*sh  # cos(1.5wt), sin(1.5wt)
+
+    x1 = np.cos(4.0*wtp)*c2 + np.sin(4.0*wtp)*s2 + c
+    x2 = (1.0-2.0*c)*np.sin(wtp) + (np.sin(wtp)*c2 - np.cos(wtp)*s2) \
+         - 4.0*(np.cos(3.0*wtp)*c15 + np.sin(3.0*wtp)*s15)*sh
+
+    return x1, x2
+
+
+def _NE_LSC(tp, tau, omega, gamma, req, shift, beta):
+    sh, ch, s, c, swtp, cwtp = _NE_half_angles(tp, tau, omega)
+
+    # the integrand is the same as in the exact case
+    argg = _NE_exact_integrand(sh, s, c, swtp, cwtp, omega, req, shift, beta)
+
+    cos_d = cwtp*c + swtp*s
+    x1, x2 = _NE_LSC_bracket(sh, ch, s, c, tp, omega)
+
+    Coth = 1.0 / np.tanh(0.5*omega*beta)
+    g2 = gamma*gamma
+
+    lin_re = np.dot(cos_d, g2*shift*shift*cwtp) + np.dot(c, g2*(Coth/omega)*0.5) - np.dot(sh*sh*x1, g2*req*req*0.5*Coth*Coth)
+    lin_im = np.dot(x2, g2*0.25*req*shift*Coth)
+
+    return argg, lin_re + 1.0j*lin_im
+
+
+def _NE_CAV(tp, tau, omega, gamma, req, shift, beta):
+    sh, ch, s, c, swtp, cwtp = _NE_half_angles(tp, tau, omega)
+    sin_d = swtp*c - cwtp*s
+    cos_d = cwtp*c + swtp*s
+    x1, x2 = _NE_LSC_bracket(sh, ch, s, c, tp, omega)
+
+    wb = omega*beta
+    g2 = gamma*gamma
+
+    argg_re = np.dot(2.0*sh*sh, -req*req/beta)
+    argg_im = np.dot(s, -omega*req*req*0.5) + np.dot(sin_d - swtp, omega*req*shift)
+
+    lin_re = np.dot(cos_d, g2*shift*shift*cwtp) + np.dot(c, g2/(wb*omega)) - np.dot(sh*sh*x1, g2*req*req*0.5/(wb*0.5)**2)
+    lin_im = np.dot(x2, g2*0.5*req*shift/wb)
+
+    return argg_re + 1.0j*argg_im, lin_re + 1.0j*lin_im
+
+
+def _NE_CD(tp, tau, omega, gamma, req, shift, beta):
+    sh, ch, s, c, swtp, cwtp = _NE_half_angles(tp, tau, omega)
+    sin_d = swtp*c - cwtp*s
+    cos_d = cwtp*c + swtp*s
+
+    wb = omega*beta
+    g2 = gamma*gamma
+
+    argg_re = np.dot(2.0*sh*sh, -req*req/beta)
+    argg_im = -tau * np.sum(0.5*omega*omega*req*req) + np.dot(sin_d - swtp, omega*req*shift)
+
+    lin_re = np.dot(cos_d, g2*shift*shift*cwtp) + np.dot(c, g2/(wb*omega)) - np.dot(s*s, g2*(req/wb)**2)
+    lin_im = np.dot((cwtp*ch + swtp*sh)*ch*ch*sh, -4.0*g2*shift*req/wb)
+
+    return argg_re + 1.0j*argg_im, lin_re + 1.0j*lin_im
+
+
+def _NE_W0(tp, tau, omega, gamma, req, shift, beta):
+    # All the terms are polynomials in tau
+    wtp = omega*tp
+    Coth = 1.0 / np.tanh(0.5*beta*omega)
+    g2 = gamma*gamma
+
+    argg_re = -tau**3 * np.sum(0.25*omega**4*req*req*Coth)
+    argg_im = -tau * np.sum(0.5*omega*omega*req*req + omega*omega*req*shift*np.cos(wtp))
+
+    lin_re = np.sum(g2*(Coth*0.5/omega + 0.5*shift*shift*(1.0+np.cos(2.0*wtp)))) - tau**2 * np.sum(g2*0.25*(req*omega*Coth)**2)
+    lin_im = -tau * np.sum(g2*Coth*req*omega*shift*np.cos(wtp))
+
+    return argg_re + 1.0j*argg_im, lin_re + 1.0j*lin_im
+
+
+def _NE_C0(tp, tau, omega, gamma, req, shift, beta):
+    # All the terms are polynomials in tau
+    wtp = omega*tp
+    g2 = gamma*gamma
+
+    argg_re = -tau**2 * np.sum(0.5*omega*omega*req*req/beta)
+    argg_im = -tau * np.sum(0.5*omega*omega*req*req + omega*omega*req*shift*np.cos(wtp))
+
+    lin_re = np.sum(g2*(1.0/(beta*omega*omega) + 0.5*shift*shift*(1.0 + np.cos(2.0*wtp)))) - tau**2 * np.sum(g2*(req/beta)**2)
+    lin_im = -tau * np.sum(g2*2.0*req*shift*np.cos(wtp)/beta)
+
+    return argg_re + 1.0j*argg_im, lin_re + 1.0j*lin_im
+
+
+# method -> the function computing the sums over modes of the integrand and of the linear term
+NE_integrands = { 0: _NE_exact, 1: _NE_LSC, 2: _NE_CAV, 3: _NE_CD, 4: _NE_W0, 5: _NE_C0 }
+
+
+
 def run_NEFGRL_populations(omega_DA, V, omega_nm, gamma_nm, req_nm, shift_NE, params):
     """
 
@@ -110,34 +272,21 @@ def run_NEFGRL_populations(omega_DA, V, omega_nm, gamma_nm, req_nm, shift_NE, pa
     filename = params["filename"]
 
 
-    beta = 1.0 / (units.kB * T)    
+    beta = 1.0 / (units.kB * T)
     nsteps = int(tmax/dt)+1
 
-    summ, P, k = 0.0, 1.0, 0.0  # probability of donor state
-    time, pop, rate = [], [], []
-
-
-    if do_output:
-        f = open(filename, "w"); f.close()
-
-
-    for step in range(0,nsteps):
-        t = step*dt
-
-        # k = k(t')
-        k = NEFGRL_rate(t, omega_DA, V, omega_nm, gamma_nm, req_nm, shift_NE, method, beta, dyn_type, dtau)
+    # The whole time loop is done in C++: k(t') for all t' and P = exp(- int dt' k(t'))
+    res = NEFGRL_population(omega_DA, V, omega_nm, gamma_nm, req_nm, shift_NE, method, beta, dyn_type, dtau, tmax, dt)
 
-        summ += k * dt;
-        P = math.exp(-summ)  # exp(- int dt' k(t'))
+    time = [ res.get(step, 0) for step in range(0,nsteps) ]
+    rate = [ res.get(step, 1) for step in range(0,nsteps) ]
+    pop  = [ res.get(step, 2) for step in range(0,nsteps) ]
 
-        if do_output:
-            f = open(filename, "a")
-            f.write("%8.5f  %8.5f  %8.5f \n" % (t, k, P))
-            f.close()
 
-        time.append(t)
-        rate.append(k)
-        pop.append(P)
+    if do_output:
+        f = open(filename, "w")
+        f.write( "".join( [ "%8.5f  %8.5f  %8.5f \n" % (time[step], rate[step], pop[step]) for step in range(0,nsteps) ] ) )
+        f.close()
 
 
     return time, rate, pop
@@ -195,70 +344,52 @@ def run_NEFRG_acf(t, omega_DA, V, omega_nm, gamma_nm, req_nm, shift_NE, params):
 
 
 
-    _tau = []
-    _argg_re, _argg_im = [], []
-    _lin_re, _lin_im = [], []
-    _C_re, _C_im = [], []
-    _int_re, _int_im = [], []
+    # Select the integrands once
+    if method not in NE_integrands.keys():
+        print(F"Method {method} is not available. Please choose from the following options:")
+        print("0 - Exact\n1 - LSC\n2 - CAV\n3 - CD\n4 - W0\n5 - C0\nExiting now...")
+        sys.exit(0)
+    integrands = NE_integrands[method]
 
-    if do_output==True:
-        f = open(filename, "w"); f.close()
-
-    integ = 0.0+0.0j
-
-    for step in range(0,nsteps):
-        tau = step*dtau
-        argg, lin = 0.0+0.0j, 0.0+0.0j 
-
-        for w in range(nomega):
-            if method==0:
-                argg = argg + Integrand_NE_exact(t, tau, omega_DA, omega_nm[w], req_nm[w], shift_NE[w], beta)
-                lin = lin + Linear_NE_exact(t, tau, gamma_nm[w], omega_nm[w], req_nm[w], shift_NE[w], beta)
-            elif method==1:
-                argg = argg + Integrand_NE_LSC(t, tau, omega_DA, omega_nm[w], req_nm[w], shift_NE[w], beta)
-                lin = lin + Linear_NE_LSC(t, tau, gamma_nm[w], omega_nm[w], req_nm[w], shift_NE[w], beta)
-            elif method==2:
-                argg = argg + Integrand_NE_CAV(t, tau, omega_DA, omega_nm[w], req_nm[w], shift_NE[w], beta)
-                lin = lin + Linear_NE_CAV(t, tau, gamma_nm[w], omega_nm[w], req_nm[w], shift_NE[w], beta)
-            elif method==3:
-                argg = argg + Integrand_NE_CD(t, tau, omega_DA, omega_nm[w], req_nm[w], shift_NE[w], beta)
-                lin = lin + Linear_NE_CD(t, tau, gamma_nm[w], omega_nm[w], req_nm[w], shift_NE[w], beta)
-            elif method==4:
-                argg = argg + Integrand_NE_W0(t, tau, omega_DA, omega_nm[w], req_nm[w], shift_NE[w], beta)
-                lin = lin + Linear_NE_W0(t, tau, gamma_nm[w], omega_nm[w], req_nm[w], shift_NE[w], beta)
-            elif method==5:
-                argg = argg + Integrand_NE_C0(t, tau, omega_DA, omega_nm[w], req_nm[w], shift_NE[w], beta)
-                lin = lin + Linear_NE_C0(t, tau, gamma_nm[w], omega_nm[w], req_nm[w], shift_NE[w], beta)
-
-
-        C = 0.0+0.0j
-        if dyn_type==0:
-            C = cmath.exp(argg) * V * V
-        elif dyn_type==1:
-            C = cmath.exp(argg) * lin
-
-        integ = integ + C*dtau
-
-        if do_output==True:
-            f = open(filename, "a")
-            f.write("%8.5f  %8.5f  %8.5f %8.5f  %8.5f %8.5f  %8.5f %8.5f  %8.5f\n" 
-                    % (tau, argg.real, argg.imag, lin.real, lin.imag, C.real, C.imag, integ.real, integ.imag))
-            f.close()
-
-
-        _tau.append(tau)
-        _argg_re.append(argg.real)
-        _argg_im.append(argg.imag)
-        
-        _lin_re.append(lin.real)
-        _lin_im.append(lin.imag)
-        
-        _C_re.append(C.real)
-        _C_im.append(C.imag)
-        
-        _int_re.append(integ.real)
-        _int_im.append(integ.imag)
+    omega = np.array(omega_nm, dtype=float)
+    gamma = np.array(gamma_nm, dtype=float)
+    req = np.array(req_nm, dtype=float)
+    shift = np.array(shift_NE, dtype=float)
+
+
+    # Sum over the modes, on the (tau x modes) grid - in blocks of tau to limit the memory
+    tau = np.array([ step*dtau for step in range(0,nsteps) ])
+    argg = np.zeros(nsteps, dtype=complex)
+    lin = np.zeros(nsteps, dtype=complex)
+
+    block = max(1, 1048576 // max(1, nomega))
+    for start in range(0, nsteps, block):
+        argg_blk, lin_blk = integrands(t, tau[start : start + block], omega, gamma, req, shift, beta)
+        argg[start : start + block] += argg_blk
+        lin[start : start + block] += lin_blk
 
+    C = np.zeros(nsteps, dtype=complex)
+    if dyn_type==0:
+        C = np.exp(argg) * V * V
+    elif dyn_type==1:
+        C = np.exp(argg) * lin
+
+    integ = np.cumsum(C*dtau)
+
+
+    if do_output==True:
+        f = open(filename, "w")
+        f.write( "".join( [ "%8.5f  %8.5f  %8.5f %8.5f  %8.5f %8.5f  %8.5f %8.5f  %8.5f\n"
+                            % (tau[n], argg[n].real, argg[n].imag, lin[n].real, lin[n].imag,
+                               C[n].real, C[n].imag, integ[n].real, integ[n].imag) for n in range(0,nsteps) ] ) )
+        f.close()
+
+
+    _tau = tau.tolist()
+    _argg_re, _argg_im = argg.real.tolist(), argg.imag.tolist()
+    _lin_re, _lin_im = lin.real.tolist(), lin.imag.tolist()
+    _C_re, _C_im = C.real.tolist(), C.imag.tolist()
+    _int_re, _int_im = integ.real.tolist(), integ.imag.tolist()
 
 
     return _tau, _argg_re, _argg_im, _lin_re, _lin_im, _C_re, _C_im, _int_re, _int_im
@@ -21,6 +21,7 @@ import os
 import sys
 import math
 import copy
+import numpy as np
 
 if sys.platform=="cygwin":
     from cyglibra_core import *
@@ -34,6 +35,7 @@ from . import normal_modes
 from . import LoadPT
 from . import LoadMolecule
 from . import nve_md
+from . import data_conv
 
 
 def permutation1(case):
@@ -502,7 +504,75 @@ def remove_rotation(S0, S1, verbose=0):
             print("Q1(updated) = ", Q1.Lt, Q1.Lx, Q1.Ly, Q1.Lz)
 
 
-def process_xyz(filename, PT, itime, ftime, verbose=0):
+def align_frames(R, masses, ref=0):
+    """
+    Removes the translation of the center of mass and the rotation around it for all frames
+    of a trajectory at once. Each frame is superimposed onto the reference frame with the 
+    mass-weighted Kabsch algorithm; the 3x3 correlation matrices and their SVDs are 
+    computed for all frames in a single batched call, so no System objects are needed
+
+    Args:
+        R ( np.array( (nframes, nat, 3) ) ): coordinates of all atoms in all frames [ Bohr ]
+        masses ( list of nat doubles ): atomic masses [ any units ]
+        ref ( int ): the index of the reference frame [ default: 0 ]
+
+    Returns:
+        np.array( (nframes, nat, 3) ): the aligned coordinates, such that the center of mass of each 
+            frame coincides with that of the reference frame and the mass-weighted RMSD between 
+            each frame and the reference is minimal [ Bohr ]
+
+    """
+
+    R = np.asarray(R, dtype=float)
+    m = np.asarray(masses, dtype=float)
+    m = m / np.sum(m)
+
+    # Remove the translations
+    com = np.einsum("i,fix->fx", m, R)
+    X = R - com[:, np.newaxis, :]
+    Y = X[ref]
+
+    # Correlation matrices H[f] = sum_i m_i * X[f,i]^T Y[i] and their SVDs, for all frames
+    H = np.einsum("i,fix,iy->fxy", m, X, Y)
+    u, s, vt = np.linalg.svd(H)
+
+    # Make sure we have proper rotations, not reflections
+    d = np.sign(np.linalg.det( np.matmul(u, vt) ))
+    d[d==0.0] = 1.0
+    u[:, :, 2] = u[:, :, 2] * d[:, np.newaxis]
+
+    # Optimal rotations: the rotated frame is X[f] * rot[f]
+    rot = np.matmul(u, vt)
+
+    return np.matmul(X, rot) + com[ref]
+
+
+
+def frames2xyz(E, R):
+    """
+    Converts a set of frames into the xyz string in the same format as produced by 
+    the `nve_md.syst2xyz` function applied to each frame
+
+    Args:
+        E ( list of nat strings ): atom names (elements) of all atoms
+        R ( np.array( (nframes, nat, 3) ) ): coordinates of all atoms in all frames [ Bohr ]
+
+    Returns:
+        string: the concatenated xyz representations of all frames
+
+    """
+
+    nat = len(E)
+    res = []
+    for frame in np.asarray(R).tolist():
+        res.append(" %i \n\n" % (nat))
+        res.extend( [ "%s  %5.3f %5.3f %5.3f\n" % (E[i], r[0], r[1], r[2]) for i, r in enumerate(frame) ] )
+
+    return "".join(res)
+
+
+
+def process_xyz(filename, PT, itime, ftime, verbose=0, method=0):
     """
     This function will read xyz file to create the coordinates for a range of 
     configurations and it will remove the translation of COM and rotation of 
@@ -514,12 +584,38 @@ def process_xyz(filename, PT, itime, ftime, verbose=0):
             for all elements that one meets in the xyz file
         itime ( int ): the initial timeframe to process
         ftime ( int ): the final timefram to process
+        verbose ( int ): the level of debug info printout [ default: 0 - no printout ]
+        method ( int ): how to remove the rotations:
+
+            * 0 - build a System for each frame and align the principal axes ( default )
+            * 1 - the batched Kabsch alignment of all frames onto the first frame in the range,
+                  see `align_frames`; much faster for long trajectories
 
     Returns:
-        None
+        tuple: (R, xyz0, xyz), where:
+
+            * R ( MATRIX(ndof, nframes) ): the processed coordinates [ Bohr ]
+            * xyz0 ( string ): the original frames in the xyz format
+            * xyz ( string ): the processed frames in the xyz format
 
     """
 
+    if method==1:
+        E, R = build.read_xyz_frames(filename, 1, 0)
+        R = R[itime:ftime+1]
+        nframes, nat = R.shape[0], R.shape[1]
+
+        if verbose>0:
+            print("nframes = ", nframes)
+            print("ndof = ", 3*nat)
+
+        Rnew = align_frames(R, [ PT[e] for e in E ], 0)
+
+        xyz0 = frames2xyz(E, R)
+        xyz = frames2xyz(E, Rnew)
+
+        return data_conv.nparray2MATRIX( Rnew.reshape(nframes, 3*nat).T ), xyz0, xyz
+
     # Read in the xyz file 
     R, E = QE_methods.read_md_data_xyz2(filename, PT) # R  in a.u. 
 
@@ -25,6 +25,7 @@ import sys
 import math
 import cmath
 import re
+import numpy as np
 
 if sys.platform=="cygwin":
     from cyglibra_core import *
@@ -57,7 +58,7 @@ def compute_apriory_prob_densities_1D(q):
     proj = []        
     for pt in range(npts):
         proj.append( [pt, q[pt] ] )            
-        sorted_proj = merge_sort(proj)
+    sorted_proj = merge_sort(proj)
     
         
     prob_dens = []             # along the original input
@@ -185,19 +186,190 @@ def compute_widths_1D(q, niter=5, guess_h_val = 1.0):
     References:
         arXiv:1712.01918 [physics, physics:quant-ph], Eq. 32        
     """
-    npts = len(q)
-               
-    target_dens = compute_apriory_prob_densities_1D(q)
+    return compute_widths(q, niter, guess_h_val).tolist()
+
+
+
+def compute_apriory_prob_densities(q, knn=10):
+    """
+    This is a vectorized function to compute the probability density of a set of points.
+    For 1D points, the density is computed via the Voronoi tesselation, exactly as in 
+    `compute_apriory_prob_densities_1D`, but using the NumPy sorting. For multidimensional
+    points, the density is estimated from the distance to the `knn`-th nearest neighbor:
+    rho_i = knn / ( npts * V(r_knn) ), where V(r) is the volume of the ndim-dimensional ball
     
-    h = []
-    for i in range(npts):
-        h.append(guess_h_val)
+    Args:
+        q ( np.array( npts ) or np.array( (npts, ndim) ) ): coordinates of the points
+        knn ( int ): the number of the nearest neighbors used in the multidimensional estimate [ default: 10 ]
         
-    # Iterations
-    for i in range(niter):
-        gaussian_kernel_algorithm_iteration_1D(q, h, target_dens)
+    Returns:    
+        np.array( npts ): the probability densities corresponding to each input point,
+            in the same order as the original data
+             
+    References:
+        arXiv:1712.01918 [physics, physics:quant-ph], alternative to Eq. 31
         
-    return h
+    """
+
+    q = np.asarray(q, dtype=float)
+    npts = q.shape[0]
+
+    if q.ndim==1 or q.shape[1]==1:
+        x = q.reshape(npts)
+        order = np.argsort(x, kind="stable")
+        xs = x[order]
+
+        dx = np.empty(npts)
+        dx[0] = xs[1] - xs[0]
+        dx[-1] = xs[-1] - xs[-2]
+        dx[1:-1] = 0.5 * (xs[2:] - xs[:-2])
+
+        prob_dens = np.empty(npts)
+        prob_dens[order] = 1.0/((npts+1)*dx)
+
+        return prob_dens
+
+    ndim = q.shape[1]
+    k = min(knn, npts-1)
+    rk = np.empty(npts)
+    block_size = max(1, int(1e7 / (npts*ndim)))
+    for start in range(0, npts, block_size):
+        d2 = np.sum( (q[start:start+block_size, np.newaxis, :] - q[np.newaxis, :, :])**2, axis=2)
+        rk[start:start+block_size] = np.sqrt( np.partition(d2, k, axis=1)[:, k] )
+
+    vol = math.pi**(0.5*ndim) / math.gamma(0.5*ndim + 1.0) * rk**ndim
+
+    return k / (npts * vol)
+
+
+
+def gaussian_density_estimator(x, q, h, cutoff=None, block_size=1000):
+    """
+    This is a vectorized version of `gaussian_density_estimator_1D`, generalized to 
+    multiple dimensions and to many points of interest. The density is:
+
+    rho(x) = (1/npts) * sum_i (2 * pi * h_i^2)^(-ndim/2) * exp( -|x - q_i|^2 / (2 * h_i^2) )
+
+    The points of interest are processed in blocks of `block_size`, so the memory needed is 
+    bounded by block_size x npts. If the `cutoff` is given, the kernels are truncated: the centers
+    `q` are sorted along the first coordinate and for each block only the centers within 
+    cutoff * h_max of the block along this coordinate are included, so the cost becomes 
+    O(npts log npts) for a uniform enough distribution of points. Here, h_max is the largest
+    width among the centers with similar widths (within a factor of 2) - each such group
+    of centers is handled separately
+    
+    Args:
+        x ( np.array( nx ) or np.array( (nx, ndim) ) ): coordinates of the points of interest
+        q ( np.array( npts ) or np.array( (npts, ndim) ) ): the centers of the Gaussian kernels ("worlds")
+        h ( np.array( npts ) ): Gaussian width parameters for each center
+        cutoff ( double or None ): the kernel truncation radius in the units of the widths,
+            e.g. 8.0; if None - no truncation [ default: None ]
+        block_size ( int ): the number of points of interest processed at once [ default: 1000 ]
         
+    Returns: 
+        np.array( nx ): the values of the probability density at the points of interest
+        
+    References:
+        arXiv:1712.01918 [physics, physics:quant-ph], Eq. 27
+    """
+
+    q = np.asarray(q, dtype=float)
+    npts = q.shape[0]
+    q = q.reshape(npts, -1)
+    ndim = q.shape[1]
+    x = np.asarray(x, dtype=float).reshape(-1, ndim)
+    nx = x.shape[0]
+    h = np.asarray(h, dtype=float).reshape(npts)
+
+    pref = (2.0*math.pi*h*h)**(-0.5*ndim)
+    alp = 0.5/(h*h)
+
+    res = np.zeros(nx)
+
+    if cutoff is None:
+        for start in range(0, nx, block_size):
+            d2 = np.sum( (x[start:start+block_size, np.newaxis, :] - q[np.newaxis, :, :])**2, axis=2)
+            res[start:start+block_size] = np.dot( np.exp(-d2 * alp), pref )
+
+        return res / npts
+
+    # Truncated kernels: the centers are grouped by their widths (factor of 2 bins), so that the 
+    # window of each group is defined by the largest width in this group, not in the whole set
+    xorder = np.argsort(x[:,0], kind="stable")
+    xs = x[xorder]
+    res_s = np.zeros(nx)
+
+    groups = np.floor(np.log2(h)).astype(int)
+    for grp in np.unique(groups):
+        sel = np.nonzero(groups==grp)[0]
+        qorder = sel[ np.argsort(q[sel,0], kind="stable") ]
+        qs, pref_s, alp_s = q[qorder], pref[qorder], alp[qorder]
+        rc = cutoff * np.max(h[sel])
+
+        for start in range(0, nx, block_size):
+            xb = xs[start:start+block_size]
+            lo = np.searchsorted(qs[:,0], xb[0,0] - rc, side="left")
+            hi = np.searchsorted(qs[:,0], xb[-1,0] + rc, side="right")
+
+            if hi > lo:
+                d2 = np.sum( (xb[:, np.newaxis, :] - qs[np.newaxis, lo:hi, :])**2, axis=2)
+                res_s[start:start+block_size] += np.dot( np.exp(-d2 * alp_s[lo:hi]), pref_s[lo:hi] )
+
+    res[xorder] = res_s
+
+    return res / npts
+
+
+
+def compute_widths(q, niter=5, guess_h_val=None, target_dens=None, tol=None, cutoff=None, block_size=1000, verbose=0):
+    """
+    This is a vectorized version of `compute_widths_1D`, generalized to multiple dimensions.
+    The width parameters are refined iteratively, according to:  h_i -> h_i * rho(q_i) / target_dens_i
+    
+    Args:
+        q ( np.array( npts ) or np.array( (npts, ndim) ) ): the points, whose probability density function we want compute
+        niter ( int ): the maximal number of refinement iterations [ default: 5 ]
+        guess_h_val ( double or None ): the guess value of the width parameters. If None, the guess widths
+            are set to the local inter-point spacings, (npts * target_dens_i)^(-1/ndim), which is the best
+            choice for large sets of points, especially with the kernel truncation [ default: None ]
+        target_dens ( np.array( npts ) or None ): the target probability densities at the points `q`.
+            If None, computed with `compute_apriory_prob_densities` [ default: None ]
+        tol ( double or None ): if given, the iterations stop once the largest relative change of 
+            the width parameters, max_i |h_i(new)/h_i(old) - 1|, gets below this value [ default: None ]
+        cutoff ( double or None ): the kernel truncation radius, see `gaussian_density_estimator` [ default: None ]
+        block_size ( int ): the block size, see `gaussian_density_estimator` [ default: 1000 ]
+        verbose ( int ): if > 0, print the convergence info [ default: 0 ]
+    
+    Returns:
+        np.array( npts ): the width parameters for each of the Gaussian kernel functions, ordered
+            according to the order of the original input centers 
+
+    References:
+        arXiv:1712.01918 [physics, physics:quant-ph], Eq. 32        
+    """
+
+    q = np.asarray(q, dtype=float)
+    npts = q.shape[0]
+
+    if target_dens is None:
+        target_dens = compute_apriory_prob_densities(q)
+    target_dens = np.asarray(target_dens, dtype=float)
+
+    if guess_h_val is None:
+        ndim = 1 if q.ndim==1 else q.shape[1]
+        h = (npts * target_dens)**(-1.0/ndim)
+    else:
+        h = np.full(npts, float(guess_h_val))
 
-    
\ No newline at end of file
+    for it in range(niter):
+        ratio = gaussian_density_estimator(q, q, h, cutoff, block_size) / target_dens
+        h = h * ratio
+
+        err = np.max(np.abs(ratio - 1.0))
+        if verbose > 0:
+            print(F"iteration {it}: max relative change of widths = {err}")
+
+        if tol is not None and err < tol:
+            break
+
+    return h
@@ -27,6 +27,8 @@ import math
 import os
 import sys
 import unittest
+import multiprocessing as mp
+import numpy as np
 
 if sys.platform=="cygwin":
     from cyglibra_core import *
@@ -39,6 +41,22 @@ from . import units
 from . import data_stat
 from . import acf
 from . import ft
+from . import data_conv
+
+
+
+def _write_acf(filename, T, norm_acf, raw_acf):
+    f = open(filename,"w")
+    for it in range(0,len(T)):
+        f.write("%8.5f  %8.5f  %8.5f  \n" % (T[it] , norm_acf[it], raw_acf[it]))
+    f.close()
+
+
+def _write_spectrum(filename, W, J, J2):
+    f = open(filename,"w")
+    for iw in range(0,len(W)):
+        f.write("%8.5f  %8.5f  %8.5f\n" % (W[iw], J[iw], J2[iw] ) )
+    f.close()
 
 
 
@@ -123,10 +141,7 @@ def recipe1(data, params):
         T[it] = T[it]/units.fs2au  # convert to fs
 
     if do_output:
-        f = open(acf_filename,"w")
-        for it in range(0,sz):
-            f.write("%8.5f  %8.5f  %8.5f  \n" % (T[it] , norm_acf[it], raw_acf[it]))
-        f.close()
+        _write_acf(acf_filename, T, norm_acf, raw_acf)
 
 
     #=========== FT =============
@@ -139,10 +154,86 @@ def recipe1(data, params):
         J2.append( (1.0/(2.0*math.pi))*J[iw]*J[iw] )
 
     if do_output:
-        f = open(spectrum_filename,"w")
-        for iw in range(0,sz):
-            f.write("%8.5f  %8.5f  %8.5f\n" % (W[iw], J[iw], J2[iw] ) )
-        f.close()
+        _write_spectrum(spectrum_filename, W, J, J2)
+
+    return T, norm_acf, raw_acf, W, J, J2
+
+
+
+def recipe1_batch(data, params):
+    """A batched version of `recipe1` for many scalar data series at once
+
+    All the series are centered and their ACFs are computed together with a zero-padded FFT
+    along the time axis. The cos-transform of the normalized ACFs is done as a matrix product
+    over blocks of frequencies. The results are the same as calling `recipe1` on every
+    series (as the list of MATRIX(1,1) objects) separately. No files are written here.
+
+    Args:
+        data ( numpy array of shape (nsteps, nseries) ): the time-series, one column per series
+        params ( Python dictionary ): controlling the parameters, same as in `recipe1`:
+
+            * dt
+            * wspan
+            * dw
+            * do_center
+            * acf_type
+
+    Returns:
+        tuple: (T, norm_acf, raw_acf, W, J, J2), where:
+
+            * T ( numpy array of nsteps doubles ): time axis [ units: fs ]
+            * norm_acf ( numpy array (nsteps, nseries) ): normalized ACFs
+            * raw_acf ( numpy array (nsteps, nseries) ): un-normalized ACFs
+            * W ( numpy array of npoints doubles ): frequencies axis [ units: cm^-1 ]
+            * J ( numpy array (npoints, nseries) ): amplitudes of FT
+            * J2 ( numpy array (npoints, nseries) ): (1/2pi)*|J|^2
+
+    """
+
+    critical_params = [ ]
+    default_params = { "dt":1.0, "wspan":3000.0, "dw":1.0, "do_center":True, "acf_type":0 }
+    comn.check_input(params, default_params, critical_params)
+
+    dt = params["dt"] * units.fs2au            # convert to  atomic units of time
+    wspan = params["wspan"] * units.inv_cm2Ha  # convert to Ha (atomic units)
+    dw = params["dw"] * units.inv_cm2Ha        # convert to Ha (atomic units)
+    do_center = params["do_center"]
+    acf_type = params["acf_type"]
+
+    data_new = np.array(data, dtype=float)
+    if do_center:
+        data_new -= data_new.mean(axis=0)
+
+    #=========== ACFs ==============
+    nsteps = data_new.shape[0]
+    F = np.fft.rfft(data_new, n=2*nsteps, axis=0)
+    raw_acf = np.fft.irfft(F.real**2 + F.imag**2, n=2*nsteps, axis=0)[:nsteps]
+
+    if acf_type==0:
+        raw_acf /= np.arange(nsteps, 0, -1)[:, None]  # less bias, chemistry adopted
+    elif acf_type==1:
+        raw_acf /= nsteps                              # statistically-preferred option
+
+    norm = np.ones(raw_acf.shape[1])
+    nz = np.abs(raw_acf[0]) > 0.0
+    norm[nz] = 1.0/raw_acf[0, nz]
+    norm_acf = norm * raw_acf
+
+    T = np.arange(nsteps) * dt / units.fs2au   # in fs
+
+    #=========== FT =============
+    npoints = int(wspan/dw)
+    w = np.arange(npoints) * dw
+    t = np.arange(1, nsteps) * dt
+
+    J = np.empty((npoints, raw_acf.shape[1]))
+    blk = 256
+    for iw in range(0, npoints, blk):
+        C = np.cos(np.outer(w[iw:iw+blk], t))
+        J[iw:iw+blk] = dt * (1.0 + 2.0 * np.dot(C, norm_acf[1:]))
+
+    W = w / units.inv_cm2Ha   # in cm^-1
+    J2 = (1.0/(2.0*math.pi))*J*J
 
     return T, norm_acf, raw_acf, W, J, J2
 
@@ -229,9 +320,22 @@ def compute_mat_elt(X, a, b, params):
     #===== Determine all frequencies (peaks) and sort them (in accending manner) ====
     out = data_stat.find_maxima(J2, params1)
 
+    freqs = _select_freqs(out, W, J, nfreqs, do_output, logname, params1["spectrum_filename"])
+
+    return  freqs, T, norm_acf, raw_acf, W, J, J2
+
+
+
+def _select_freqs(out, W, J, nfreqs, do_output, logname, spectrum_filename):
+    """Picks up to `nfreqs` largest peaks from the output of `data_stat.find_maxima`
+
+    Returns:
+        list of [W, J, J/norm] lists, see `compute_mat_elt`
+    """
+
     if do_output:
         lgfile = open(logname, "a")
-        lgfile.write("Maximal peaks in the file "+params1["spectrum_filename"]+"\n")
+        lgfile.write("Maximal peaks in the file "+spectrum_filename+"\n")
 
     # Reduce the number of frequencies to the maximal number available
     if nfreqs > len(out):
@@ -263,8 +367,25 @@ def compute_mat_elt(X, a, b, params):
             lgfile.write(" Normalized amplitude = %8.5f \n" % (a[2]))
         lgfile.close()
 
-   
-    return  freqs, T, norm_acf, raw_acf, W, J, J2
+    return freqs
+
+
+
+def _elt_params(params, i, j):
+    """Parameters that `compute_all` would pass to `compute_mat_elt` for the element X_ij"""
+    params1 = dict(params)
+    prefix = params["filename"] + ("_re_" if i==j else "_im_")
+    params1["acf_filename"] = prefix+"_acf_"+str(i)+"_"+str(j)+".txt"
+    params1["spectrum_filename"] = prefix+"_acf_"+str(i)+"_"+str(j)+".txt"
+    params1["verbose"] = 0
+    return params1
+
+
+
+def _find_maxima(args):
+    """Worker for the parallel peak search in `compute_all`"""
+    J2, params = args
+    return data_stat.find_maxima(J2, params)
 
 
 
@@ -275,11 +396,19 @@ def compute_all(X, params):
     diagonal elements and in frequencies of imaginary part of non-diagonal elements.
     This is a typical situation for the "vibronic" Hamiltonian data in the NA-MD
 
+    The whole time-series is converted to a numpy array once and the ACFs and spectra of
+    all the matrix elements are computed together (see `recipe1_batch`). If the input is
+    Hermitian, only the upper triangle is computed: the imaginary parts of X_ab and X_ba
+    differ only by sign, so they have the same ACFs and spectra.
+
     Args:
         X ( list of CMATRIX ): time-series data of complex matrices, e.g. "vibronic" Hamiltonian
         params ( dictionary ): parameters controlling the execution of :funct:`compute_mat_elt` function
             ..seealso::`compute_mat_elt` for the full description of the required and allowed parameters and the default values
 
+            * **params["nprocs"]** ( int ): the number of processes to use for the peak search. Only 
+                used when `do_output == False`, so that the log file is written in order [ default: 1 ]
+
     Returns:
         list[nstates][nstates][nfreqs][3]: freqs, such that
         
@@ -289,29 +418,63 @@ def compute_all(X, params):
             * freqs[a][b][fr][2] ( double ):  normalized amplitued of the mode fr for the matrix 
                 element X_ab  [arb.units]
 
+        as well as T, norm_acf, raw_acf, W, J, J2 - list[nstates][nstates] of the corresponding 
+        outputs of `compute_mat_elt`
+
     """
 
+    params = dict(params)
     critical_params = [ ] 
-    default_params = { "filename":"influence_spectra_" }
+    default_params = { "filename":"influence_spectra_", "nfreqs":1, "logname":"out.log", 
+                       "do_output":0, "nprocs":1 }
     comn.check_input(params, default_params, critical_params)
 
+    nfreqs = params["nfreqs"]
+    do_output = params["do_output"]
+    logname = params["logname"]
+    nprocs = params["nprocs"]
 
-    params_re = dict(params)
-    params_re.update({"filename":params["filename"]+"_re_"})
 
-    params_im = dict(params)
-    params_im.update({"filename":params["filename"]+"_im_"})
-    
+    # The whole time-series as a single (nsteps, nstates, nstates) array
+    X_np = data_conv.MATRIXList2nparray(X)
+    nstates = X_np.shape[2]
 
-    # Split the X array into two arrays - real and imaginary parts
-    X_re, X_im = [], []
-    nsteps = len(X)
-    for step in range(0,nsteps):
-        X_re.append(X[step].real())
-        X_im.append(X[step].imag())
+    # Real parts of the diagonal elements and imaginary parts of the off-diagonal ones
+    hermitian = np.array_equal(X_np, np.conj(X_np).transpose(0,2,1))
+
+    elts = []
+    for i in range(0,nstates):
+        for j in range(0,nstates):
+            if i==j or not hermitian or i<j:
+                elts.append( (i,j) )
+
+    data = np.empty( (X_np.shape[0], len(elts)) )
+    for k, (i,j) in enumerate(elts):
+        if i == j:
+            data[:, k] = X_np[:, i, j].real
+        else:
+            data[:, k] = X_np[:, i, j].imag
+    X_np = None
+
+    T_np, norm_acf_np, raw_acf_np, W_np, J_np, J2_np = recipe1_batch(data, dict(params))
+    data = None
+
+    T_all, W_all = T_np.tolist(), W_np.tolist()
+    norm_acf_all, raw_acf_all = norm_acf_np.T.tolist(), raw_acf_np.T.tolist()
+    J_all, J2_all = J_np.T.tolist(), J2_np.T.tolist()
+    norm_acf_np, raw_acf_np, J_np, J2_np = None, None, None, None
+
+
+    #===== Peak search =====
+    if nprocs > 1 and not do_output:
+        args = [ (J2_all[k], _elt_params(params, i, j)) for k, (i,j) in enumerate(elts) ]
+        pool = mp.Pool( processes = nprocs )
+        out_all = pool.map( _find_maxima, args )
+        pool.close()
+        pool.join()
+    else:
+        out_all = [None] * len(elts)
 
-    # Do the calculations for each matrix element
-    nstates = X[0].num_of_cols   
 
     freqs = [ [ [] for i in range(0,nstates)] for j in range(0,nstates)]
     T = [ [ [] for i in range(0,nstates)] for j in range(0,nstates)]
@@ -321,13 +484,28 @@ def compute_all(X, params):
     J = [ [ [] for i in range(0,nstates)] for j in range(0,nstates)]
     J2 = [ [ [] for i in range(0,nstates)] for j in range(0,nstates)]
 
- 
+    indx = { elt:k for k, elt in enumerate(elts) }
+
+    # Same order as the element-by-element calculation, so the output files and the log match
     for i in range(0,nstates):
         for j in range(0,nstates):
-            if i == j:
-                freqs[i][j], T[i][j],  norm_acf[i][j],  raw_acf[i][j],  W[i][j], J[i][j], J2[i][j] = compute_mat_elt(X_re, i, j, params_re)
-            else:
-                freqs[i][j], T[i][j],  norm_acf[i][j],  raw_acf[i][j],  W[i][j], J[i][j], J2[i][j] = compute_mat_elt(X_im, i, j, params_im)
+            k = indx[ (min(i,j), max(i,j)) if hermitian else (i,j) ]
+
+            params1 = _elt_params(params, i, j)
+            if do_output:
+                _write_acf(params1["acf_filename"], T_all, norm_acf_all[k], raw_acf_all[k])
+                _write_spectrum(params1["spectrum_filename"], W_all, J_all[k], J2_all[k])
+
+            out = out_all[k]
+            if out is None or do_output:
+                out = data_stat.find_maxima(J2_all[k], params1)
+                out_all[k] = out
+
+            freqs[i][j] = _select_freqs(out, W_all, J_all[k], nfreqs, do_output, logname, params1["spectrum_filename"])
+            # Every matrix element gets its own lists, as from `compute_mat_elt`
+            T[i][j], W[i][j] = list(T_all), list(W_all)
+            norm_acf[i][j], raw_acf[i][j] = list(norm_acf_all[k]), list(raw_acf_all[k])
+            J[i][j], J2[i][j] = list(J_all[k]), list(J2_all[k])
 
     return freqs, T,  norm_acf,  raw_acf,  W,  J, J2
 
@@ -21,6 +21,7 @@ import os
 import sys
 import math
 import copy
+import numpy as np
 
 if sys.platform=="cygwin":
     from cyglibra_core import *
@@ -113,6 +114,46 @@ def model1(q, params):
 
 
 
+def model1_grid(q, params):
+    """
+
+    Vectorized version of ::funct:```model1``` evaluated for many points at once, 
+    to be used with the grid-based methods
+    
+
+              k*x^2         V
+    Hdia =       V        k*(x-x0)^2 + D
+
+    Args: 
+        q ( numpy.array(npts, 1) ): coordinates of all the points, ndof = 1
+        params ( dictionary ): model parameters, same as in ::funct:```model1```
+
+    Returns:       
+        PyObject: obj, with the members:
+
+            * obj.ham_dia ( numpy.array(npts, 2, 2) ): diabatic Hamiltonians for all points
+
+    """
+
+    critical_params = [ ] 
+    default_params = {"x0":1.0, "k":0.01, "D":0.0, "V":0.005 }
+    comn.check_input(params, default_params, critical_params)
+
+    x0,k,D,V = params["x0"], params["k"], params["D"], params["V"]
+
+    x = np.asarray(q, dtype=float)[:, 0]
+
+    Hdia = np.zeros( (x.shape[0], 2, 2), dtype=complex)
+    Hdia[:, 0, 0] = k*x*x;   Hdia[:, 0, 1] = V
+    Hdia[:, 1, 0] = V;       Hdia[:, 1, 1] = k*(x-x0)**2 + D
+
+    obj = tmp()
+    obj.ham_dia = Hdia
+
+    return obj
+
+
+
 def model1a(Hdia, Sdia, d1ham_dia, dc1_dia, q, params):
     """
 
@@ -18,6 +18,7 @@ import os
 import sys
 import math
 import copy
+import numpy as np
 
 if sys.platform=="cygwin":
     from cyglibra_core import *
@@ -289,6 +290,136 @@ def Tully3(q, params):
 
 
 
+def Tully1_grid(q, params):
+    """
+   
+    Vectorized implementation of the Tully model I = Simple Avoided Crossing (SAC)
+    evaluated for many points at once, to be used with the grid-based methods
+
+    H_00 = A*(1.0-exp(-B*x)) x>=0,  
+         = A*(exp(B*x)-1.0 ) x<0
+    H_11 = -H_00
+    H_01 = C*exp(-D*x^2)
+
+    Args: 
+        q ( numpy.array(npts, 1) ): coordinates of all the points, ndof = 1
+        params ( dictionary ): model parameters, same as in ::funct:```Tully1```
+
+    Returns:       
+        PyObject: obj, with the members:
+
+            * obj.ham_dia ( numpy.array(npts, 2, 2) ): diabatic Hamiltonians for all points
+ 
+    """
+
+    critical_params = [ ] 
+    default_params = {"A":0.010, "B":1.600, "C":0.005, "D":1.000 }
+    comn.check_input(params, default_params, critical_params)
+
+    A, B, C, D = params["A"], params["B"], params["C"], params["D"]
+
+    x = np.asarray(q, dtype=float)[:, 0]
+    e = np.exp(-B*np.abs(x))
+    H00 = np.where(x>=0, A*(1.0 - e), A*(e - 1.0))
+    H01 = C * np.exp(-D*x*x)
+
+    Hdia = np.zeros( (x.shape[0], 2, 2), dtype=complex)
+    Hdia[:, 0, 0] = H00;    Hdia[:, 0, 1] = H01
+    Hdia[:, 1, 0] = H01;    Hdia[:, 1, 1] = -H00
+
+    obj = tmp()
+    obj.ham_dia = Hdia
+
+    return obj
+
+
+
+def Tully2_grid(q, params):
+    """
+   
+    Vectorized implementation of the Tully model II = Double Avoided Crossing (DAC)
+    evaluated for many points at once, to be used with the grid-based methods
+
+    H_00 = 0.0
+    H_11 = E - A*exp(-B*x^2)
+    H_01 = C*exp(-D*x^2)
+
+    Args: 
+        q ( numpy.array(npts, 1) ): coordinates of all the points, ndof = 1
+        params ( dictionary ): model parameters, same as in ::funct:```Tully2```
+
+    Returns:       
+        PyObject: obj, with the members:
+
+            * obj.ham_dia ( numpy.array(npts, 2, 2) ): diabatic Hamiltonians for all points
+ 
+    """
+
+    critical_params = [ ] 
+    default_params = {"A":0.10, "B":0.28, "C":0.015, "D":0.060, "E":0.050 }
+    comn.check_input(params, default_params, critical_params)
+
+    A, B, C, D, E = params["A"], params["B"], params["C"], params["D"], params["E"]
+
+    x = np.asarray(q, dtype=float)[:, 0]
+    H01 = C * np.exp(-D*x*x)
+
+    Hdia = np.zeros( (x.shape[0], 2, 2), dtype=complex)
+    Hdia[:, 0, 1] = H01
+    Hdia[:, 1, 0] = H01
+    Hdia[:, 1, 1] = E - A*np.exp(-B*x*x)
+
+    obj = tmp()
+    obj.ham_dia = Hdia
+
+    return obj
+
+
+
+def Tully3_grid(q, params):
+    """
+   
+    Vectorized implementation of the Tully model III = Extended Coupling With Reflection (ECWR)
+    evaluated for many points at once, to be used with the grid-based methods
+
+    H_00 = A
+    H_11 = -H_00
+    H_01 = B*exp(C*x);          x < 0
+           B*(2.0 - exp(-C*x)); x >= 0
+
+    Args: 
+        q ( numpy.array(npts, 1) ): coordinates of all the points, ndof = 1
+        params ( dictionary ): model parameters, same as in ::funct:```Tully3```
+
+    Returns:       
+        PyObject: obj, with the members:
+
+            * obj.ham_dia ( numpy.array(npts, 2, 2) ): diabatic Hamiltonians for all points
+ 
+    """
+
+    critical_params = [ ] 
+    default_params = {"A":0.0006, "B":0.1000, "C":0.9000 }
+    comn.check_input(params, default_params, critical_params)
+
+    A, B, C = params["A"], params["B"], params["C"]
+
+    x = np.asarray(q, dtype=float)[:, 0]
+    e = np.exp(-C*np.abs(x))
+    H01 = np.where(x>=0, B*(2.0 - e), B*e)
+
+    Hdia = np.zeros( (x.shape[0], 2, 2), dtype=complex)
+    Hdia[:, 0, 0] = A;      Hdia[:, 0, 1] = H01
+    Hdia[:, 1, 0] = H01;    Hdia[:, 1, 1] = -A
+
+    obj = tmp()
+    obj.ham_dia = Hdia
+
+    return obj
+
+
+
+
 def chain_potential(q, params, full_id):
     """    
     A 1D linear chain potential. 
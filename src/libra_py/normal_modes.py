@@ -39,12 +39,289 @@
 import os
 import math
 import sys
+import numpy as np
 if sys.platform=="cygwin":
     from cyglibra_core import *
 elif sys.platform=="linux" or sys.platform=="linux2":
     from liblibra_core import *
 
 from . import units
+from . import data_conv
+
+
+
+class CovarianceAccumulator:
+    """
+    Accumulates the mean and the second moment of the data (R, V, or A) frame by frame, so
+    the covariance matrices can be computed without keeping the whole trajectory in memory.
+
+    The running sums are updated with the pairwise (Chan et al.) formulas:
+
+        n = n_a + n_b
+        mean = mean_a + (mean_b - mean_a) * n_b / n
+        M2 = M2_a + M2_b + (mean_b - mean_a) (mean_b - mean_a)^T * n_a * n_b / n
+
+    where M2 = sum_t { (x_t - mean) (x_t - mean)^T }. The accumulators built for independent
+    pieces of a trajectory (e.g. in parallel) can be combined with `merge`
+
+    Usage:
+
+        acc = CovarianceAccumulator()
+        for block in trajectory_blocks:   # numpy arrays (nframes_in_block, ndof)
+            acc.add_frames(block)
+        K = acc.covariance_matrix(M, 1)
+
+    """
+
+    def __init__(self, ndof=None):
+        """
+        Args:
+            ndof ( int ): the number of DOFs; if None, it is set by the first added frame [ default: None ]
+
+        """
+
+        self.ndof = ndof
+        self.nframes = 0
+        self.mean = None    # numpy array (ndof)
+        self.m2 = None      # numpy array (ndof, ndof)
+        self.first = None   # numpy array (ndof) - the first frame, used as the reference geometry
+
+
+    def add_frame(self, x):
+        """
+        Adds one frame
+
+        Args:
+            x ( numpy array (ndof) or MATRIX(ndof, 1) ): the data for one time step
+
+        """
+
+        if isinstance(x, MATRIX):
+            x = data_conv.MATRIX2nparray(x)
+        self.add_frames( np.asarray(x, dtype=float).reshape(1, -1) )
+
+
+    def add_frames(self, X):
+        """
+        Adds a block of frames
+
+        Args:
+            X ( numpy array (nframes, ndof) or MATRIX(ndof, nframes) ): the data for several time steps;
+                note the different order of the dimensions - the MATRIX layout is the same as used by `compute_cov`
+
+        """
+
+        if isinstance(X, MATRIX):
+            X = data_conv.MATRIX2nparray(X).T
+        X = np.asarray(X, dtype=float)
+
+        nb = X.shape[0]
+        if nb==0:
+            return
+
+        mean_b = np.mean(X, axis=0)
+        dX = X - mean_b
+        self._merge(nb, mean_b, np.dot(dX.T, dX), X[0])
+
+
+    def merge(self, other):
+        """
+        Adds all the frames accumulated by another CovarianceAccumulator object
+
+        Args:
+            other ( CovarianceAccumulator ): the accumulator for another piece of the trajectory
+
+        """
+
+        if other.nframes > 0:
+            self._merge(other.nframes, other.mean, other.m2, other.first)
+
+
+    def _merge(self, nb, mean_b, m2_b, first_b):
+
+        if self.nframes==0:
+            self.ndof = mean_b.shape[0]
+            self.nframes = nb
+            self.mean = np.array(mean_b)
+            self.m2 = np.array(m2_b)
+            self.first = np.array(first_b)
+            return
+
+        if mean_b.shape[0] != self.ndof:
+            print(F"Error in CovarianceAccumulator: the data for {mean_b.shape[0]} DOFs can not be added to the data for {self.ndof} DOFs")
+            print("Exiting...")
+            sys.exit(0)
+
+        na = self.nframes
+        n = na + nb
+        delta = mean_b - self.mean
+
+        self.mean = self.mean + delta * (nb / n)
+        self.m2 = self.m2 + m2_b + np.outer(delta, delta) * (na * nb / n)
+        self.nframes = n
+
+
+    def covariance(self, flag=1):
+        """
+        Computes the covariance matrix cov_ij = < x_i * x_j > (no mass weighting), same as the `covariance` function
+
+        Args:
+            flag ( int ): controls how to compute variance
+
+                * 0 - using the data as they are (no centering)
+                * 1 - using the fluctuations of the data around the mean (do centering) [ default ]
+
+        Returns:
+            numpy array (ndof, ndof): the covariance matrix
+
+        """
+
+        K = self.m2 / self.nframes
+        if flag==0:
+            K = K + np.outer(self.mean, self.mean)
+
+        return K
+
+
+    def covariance_matrix(self, M, flag):
+        """
+        Computes the mass-weighted covariance matrix, same as the `covariance_matrix` function
+
+        Args:
+            M ( MATRIX(ndof, 1) ): masses of all DOFs
+            flag ( int ): controls how to compute variance, see `covariance`
+
+        Returns:
+            MATRIX(ndof, ndof): the matrix of covariance of all DOFs averaged over the trajectory
+
+        """
+
+        sM = np.sqrt( data_conv.MATRIX2nparray(M).reshape(-1) )
+
+        return data_conv.nparray2MATRIX( self.covariance(flag) * (0.5 * np.outer(sM, sM)) )
+
+
+    def reference(self):
+        """
+        Returns:
+            MATRIX(ndof, 1): the first accumulated frame, e.g. the reference geometry for `visualize_modes`
+
+        """
+
+        return data_conv.nparray2MATRIX( self.first.reshape(-1, 1) )
+
+
+
+def accumulate_hdf5(filename, dataset, chunk_size=1000):
+    """
+    Reads the trajectory data from the HDF5 file by pieces and accumulates the statistics
+
+    Args:
+        filename ( string ): the name of the HDF5 file
+        dataset ( string ): the name of the dataset, the data should be stored as an (nframes, ndof) array
+        chunk_size ( int ): how many frames to read at once [ default: 1000 ]
+
+    Returns:
+        CovarianceAccumulator: the statistics of the data
+
+    """
+
+    import h5py
+
+    acc = CovarianceAccumulator()
+
+    with h5py.File(filename, "r") as f:
+        data = f[dataset]
+        nframes = data.shape[0]
+        for start in range(0, nframes, chunk_size):
+            block = data[start : min(start + chunk_size, nframes)]
+            acc.add_frames( block.reshape(block.shape[0], -1) )
+
+    return acc
+
+
+
+def accumulate_xyz(filename, chunk_size=1000):
+    """
+    Reads the coordinates from the xyz trajectory file by pieces and accumulates the statistics
+
+    Args:
+        filename ( string ): the name of the xyz file, the coordinates are in Angstrom
+        chunk_size ( int ): how many frames to accumulate before updating the statistics [ default: 1000 ]
+
+    Returns:
+        CovarianceAccumulator: the statistics of the coordinates [ units: Bohr ]
+
+    """
+
+    acc = CovarianceAccumulator()
+    block = []
+
+    f = open(filename, "r")
+    while True:
+        line = f.readline()
+        if not line:
+            break
+        if len(line.split())==0:
+            continue
+
+        nat = int(line.split()[0])
+        f.readline()   # comment line
+
+        frame = np.zeros(3*nat)
+        for at in range(0,nat):
+            tmp = f.readline().split()
+            frame[3*at : 3*at+3] = [ float(tmp[1]), float(tmp[2]), float(tmp[3]) ]
+        block.append(frame * units.Angst)
+
+        if len(block)==chunk_size:
+            acc.add_frames(np.array(block));  block = []
+    f.close()
+
+    if len(block) > 0:
+        acc.add_frames(np.array(block))
+
+    return acc
+
+
+
+def as_covariance_input(X, chunk_size=1000):
+    """
+    Converts the trajectory data given in one of the supported forms into the one accepted by `covariance_matrix`
+
+    Args:
+        X ( MATRIX(ndof, nsteps), CovarianceAccumulator, string, or tuple ): the data:
+
+            * MATRIX or CovarianceAccumulator - returned as they are
+            * string - the name of the xyz trajectory file, see `accumulate_xyz`
+            * tuple (filename, dataset) - the HDF5 file and dataset, see `accumulate_hdf5`
+
+        chunk_size ( int ): how many frames to read at once from the files [ default: 1000 ]
+
+    Returns:
+        MATRIX(ndof, nsteps) or CovarianceAccumulator: the data
+
+    """
+
+    if isinstance(X, str):
+        return accumulate_xyz(X, chunk_size)
+    elif isinstance(X, tuple):
+        return accumulate_hdf5(X[0], X[1], chunk_size)
+
+    return X
+
+
+
+def reference_frame(R):
+    """
+    Returns the MATRIX whose first column contains the reference geometry: R itself for MATRIX data,
+    or the first accumulated frame for CovarianceAccumulator
+    """
+
+    if isinstance(R, CovarianceAccumulator):
+        return R.reference()
+    return R
+
 
 
 def covariance_matrix(X, M, flag):
@@ -53,8 +330,8 @@ def covariance_matrix(X, M, flag):
     Computes the covariance matrix $$K^x = <sqrt(m_i * m_j) * x_i * x_j }>$$
 
     Args:
-        X ( MATRIX(ndof, nsteps) ): data collected along a trajectory: can be R, V, or A
-        M ( MATRIX(ndof, 1) ): masses of all DOFs 
+        X ( MATRIX(ndof, nsteps) or CovarianceAccumulator ): data collected along a trajectory: can be R, V, or A
+        M ( MATRIX(ndof, 1) ): masses of all DOFs
         flag ( int ): controls how to compute variance
 
             * 0 - using the data as they are (no centering)
@@ -65,6 +342,9 @@ def covariance_matrix(X, M, flag):
 
     """
 
+    if isinstance(X, CovarianceAccumulator):
+        return X.covariance_matrix(M, flag)
+
     ndof = X.num_of_rows
     nsteps = X.num_of_cols
 
@@ -80,13 +360,13 @@ def covariance_matrix(X, M, flag):
         dX = deviation(X)
         K = covariance(dX)
 
-    # Compute the covariance matrix
-    for i in range(0,ndof):
-        for j in range(0,ndof):
-            mij = sM.get(i) * sM.get(j)
-            K.scale(i,j, 0.5*mij)
+    # Compute the covariance matrix: K_ij * 0.5 * sqrt(m_i * m_j), as the element-wise product
+    W = sM * sM.T()
+    W *= 0.5
+    res = MATRIX(ndof, ndof)
+    res.dot_product(K, W)
 
-    return K
+    return res
 
 
 def visualize_modes(E, R, U, M, w, params):
@@ -164,6 +444,10 @@ def compute_cov(R, V, A, M, E, params):
         R ( MATRIX(ndof x nsteps-1) ): coordinates of all DOFs for all mid-timesteps
         V ( MATRIX(ndof x nsteps-1) ): velocities of all DOFs for all mid-timesteps
         A ( MATRIX(ndof x nsteps-1) ): accelerations of all DOFs for all mid-timesteps
+
+            Instead of the MATRIX objects, R, V, and A may be given as the CovarianceAccumulator objects,
+            the xyz file names, or the (HDF5 file name, dataset name) tuples, see `as_covariance_input`
+
         M ( MATRIX(ndof x 1) ): masses of all DOFs
         E ( list of ndof/3 strings ): atom names (elements) of all atoms
         params ( dictionary ): parameters controlling the computations, including the 
@@ -195,7 +479,9 @@ def compute_cov(R, V, A, M, E, params):
         print("Strachan, A. Normal Modes and Frequencies from Covariances in Molecular Dynamics\
         or Monte Carlo Simulation. J. Chem. Phys. 2003, 120, 1-4.\n")
 
-    ndof = R.num_of_rows
+    R, V, A = as_covariance_input(R), as_covariance_input(V), as_covariance_input(A)
+
+    ndof = M.num_of_rows
     nat = ndof/3
     cov_flag = params["cov_flag"]
     
@@ -265,12 +551,12 @@ def compute_cov(R, V, A, M, E, params):
             print("Visualizing modes based on velocities covariance\n")
         prefix = params["prefix"]
         params.update({"prefix": prefix+"_velocity"})
-        visualize_modes(E, R, U_v.real(), M, w, params);
+        visualize_modes(E, reference_frame(R), U_v.real(), M, w, params);
 
         if verbosity>0:
             print("Visualizing modes based on accelerations covariance\n")
         params.update({"prefix": prefix+"_acceleration"})
-        visualize_modes(E, R, U_a.real(), M, w2, params);
+        visualize_modes(E, reference_frame(R), U_a.real(), M, w2, params);
 
     if verbosity>0:
         print("========= Done with the Normal modes calculations =============================")
@@ -292,6 +578,10 @@ def compute_cov1(R, V, M, E, params):
     Args:
         R ( MATRIX(ndof x nsteps-1) ): coordinates of all DOFs for all mid-timesteps [Bohr]
         V ( MATRIX(ndof x nsteps-1) ): velocities of all DOFs for all mid-timesteps [a.u. of velocity]
+
+            Instead of the MATRIX objects, R and V may be given as the CovarianceAccumulator objects,
+            the xyz file names, or the (HDF5 file name, dataset name) tuples, see `as_covariance_input`
+
         M ( MATRIX(ndof x 1) ): masses of all DOFs [a.u. of mass]
         E ( list of ndof/3 strings ): atom names (elements) of all atoms
         params ( dictionary ): parameters controlling the computations, including the 
@@ -320,7 +610,9 @@ def compute_cov1(R, V, M, E, params):
         print("Strachan, A. Normal Modes and Frequencies from Covariances in Molecular Dynamics\
         or Monte Carlo Simulation. J. Chem. Phys. 2003, 120, 1-4.\n")
 
-    ndof = R.num_of_rows
+    R, V = as_covariance_input(R), as_covariance_input(V)
+
+    ndof = M.num_of_rows
     nat = ndof/3
     cov_flag = params["cov_flag"]
     
@@ -368,7 +660,7 @@ def compute_cov1(R, V, M, E, params):
             print("Visualizing modes based on velocities covariance\n")
         prefix = params["prefix"]
         params.update({"prefix": prefix+"_velocity"})
-        visualize_modes(E, R, U_v.real(), M, w, params);
+        visualize_modes(E, reference_frame(R), U_v.real(), M, w, params);
 
 
     if verbosity>0:
@@ -390,6 +682,10 @@ def compute_cov2(R, A, M, E, T, params):
     Args:
         R ( MATRIX(ndof x nsteps-1) ): coordinates of all DOFs for all mid-timesteps
         A ( MATRIX(ndof x nsteps-1) ): accelerations of all DOFs for all mid-timesteps
+
+            Instead of the MATRIX objects, R and A may be given as the CovarianceAccumulator objects,
+            the xyz file names, or the (HDF5 file name, dataset name) tuples, see `as_covariance_input`
+
         M ( MATRIX(ndof x 1) ): masses of all DOFs
         E ( list of ndof/3 strings ): atom names (elements) of all atoms
         T ( double ): temperature of simulation (in K)
@@ -421,14 +717,18 @@ def compute_cov2(R, A, M, E, T, params):
         print("Pereverzev, A.; Sewell, T. D. Obtaining the Hessian from the Force Covariance Matrix:\
         Application to Crystalline Explosives PETN and RDX. J. Chem. Phys. 2015, 142, 134110.\n")
     
-    ndof = R.num_of_rows
+    R, A = as_covariance_input(R), as_covariance_input(A)
+
+    ndof = M.num_of_rows
     nat = ndof/3
     cov_flag = params["cov_flag"]
 
     if verbosity>0:
         print("Computing covariance matrix of accelerations\n")
     K_a = None
-    if cov_flag==0:
+    if isinstance(A, CovarianceAccumulator):
+        K_a = CMATRIX(data_conv.nparray2MATRIX(A.covariance(cov_flag)))
+    elif cov_flag==0:
         K_a = CMATRIX(covariance(A))
     elif cov_flag==1:
         dA = deviation(A)
@@ -458,7 +758,7 @@ def compute_cov2(R, A, M, E, T, params):
     if params["visualize"]>0:
         if verbosity>0:
             print("Visualizing modes based on accelerations covariance matrix\n")
-        visualize_modes(E, R, U_a.real(), M, w, params);
+        visualize_modes(E, reference_frame(R), U_a.real(), M, w, params);
 
     if verbosity>0:
         print("========= Done with the Normal modes calculations =============================")
@@ -23,20 +23,125 @@ import math
 import os
 import sys
 import time
+import multiprocessing as mp
 if sys.platform=="cygwin":
     from cyglibra_core import *
 elif sys.platform=="linux" or sys.platform=="linux2":
     from liblibra_core import *
 from . import units
+from . import data_conv
 import util.libutil as comn
 import numpy as np
 
-def convolve(X0, Y0, dx0, dx, var):
+def gaussian_broadening(x0, y0, x, var, cutoff=10.0, method=0, block_size=512):
+    """
+    This function broadens the stick data (x0, y0) with Gaussians of a given width, for all 
+    projections (columns of y0) at once:
+
+        y[i, j] = sum_{i0} y0[i0, j] * exp(- (x[i] - x0[i0])^2 / (2*var^2) )
+
+    Note that no normalization is applied - the caller should scale y0 as needed.
+
+    Args:
+        x0 ( np.array( N0 ) ): original (sorted) grid
+        y0 ( np.array( (N0, Nproj) ) or np.array( (nsets, N0, Nproj) ) ): the values to broaden, 
+            one column per projection; the leading dimension, if present, enumerates independent 
+            data sets (e.g. MD snapshots) defined on the same grid
+        x ( np.array( N ) ): the new (sorted) grid
+        var ( double ): width of the Gaussians [ units of x ]
+        cutoff ( double or None ): the Gaussians are truncated beyond cutoff * var; 
+            None - no truncation [ default: 10.0 ]
+        method ( int ): how to do the convolution:
+
+            * 0 - truncated (banded) kernel matrix times the data matrix, done in blocks of
+                  `block_size` original grid points [ default ]
+            * 1 - FFT convolution; requires the new grid to be uniform and all the original grid 
+                  points to fall on the new grid points. If this is not the case, method 0 is used
+
+        block_size ( int ): the number of original grid points processed at once in the method 0 [ default: 512 ]
+
+    Returns:
+        np.array( (N, Nproj) ) or np.array( (nsets, N, Nproj) ): the broadened data
+
+    """
+
+    x0 = np.asarray(x0, dtype=float).reshape(-1)
+    x = np.asarray(x, dtype=float).reshape(-1)
+    y0 = np.asarray(y0, dtype=float)
+
+    is_2d = (y0.ndim==2)
+    if is_2d:
+        y0 = y0[np.newaxis, :, :]
+
+    nsets, N0, nproj = y0.shape
+    N = x.shape[0]
+    alp = 0.5/(var**2)
+
+    res = None
+    if method==1 and N > 1:
+        res = _gaussian_broadening_fft(x0, y0, x, alp, cutoff)
+
+    if res is None:
+        res = np.zeros( (nsets, N, nproj) )
+        for start in range(0, N0, block_size):
+            xb = x0[start:start+block_size]
+            lo, hi = 0, N
+            if cutoff is not None:
+                lo = np.searchsorted(x, np.min(xb) - cutoff*var, side="left")
+                hi = np.searchsorted(x, np.max(xb) + cutoff*var, side="right")
+            if hi <= lo:
+                continue
+
+            K = np.exp(-alp * (x[lo:hi, np.newaxis] - xb[np.newaxis, :])**2 )
+            res[:, lo:hi, :] += np.matmul(K, y0[:, start:start+block_size, :])
+
+    if is_2d:
+        return res[0]
+    return res
+
+
+
+def _gaussian_broadening_fft(x0, y0, x, alp, cutoff):
+    """
+    The FFT branch of `gaussian_broadening`, returns None if the grids are not compatible
+    """
+
+    N = x.shape[0]
+    dx = x[1] - x[0]
+    if not np.allclose(np.diff(x), dx, rtol=1e-8, atol=0.0):
+        return None
+
+    pos = (x0 - x[0]) / dx
+    indx = np.rint(pos).astype(int)
+    if np.any(np.abs(pos - indx) > 1e-6) or np.any(indx < 0) or np.any(indx >= N):
+        return None
+
+    nsets, N0, nproj = y0.shape
+
+    # Put the sticks on the new grid
+    sticks = np.zeros( (nsets, N, nproj) )
+    np.add.at(sticks, (slice(None), indx, slice(None)), y0)
+
+    # Kernel on the grid offsets -(N-1) ... (N-1), possibly truncated
+    k = np.arange(-(N-1), N)
+    kernel = np.exp(-alp * (k*dx)**2 )
+    if cutoff is not None:
+        kernel[ np.abs(k*dx) > cutoff * math.sqrt(0.5/alp) ] = 0.0
+
+    nfft = 1 << int(math.ceil(math.log2(3*N-2)))
+    res = np.fft.irfft( np.fft.rfft(sticks, nfft, axis=1) * np.fft.rfft(kernel, nfft)[np.newaxis, :, np.newaxis], nfft, axis=1)
+
+    return res[:, N-1:2*N-1, :]
+
+
+
+def convolve(X0, Y0, dx0, dx, var, method=0, cutoff=10.0):
     """
     This function convolves the original data with the Gaussian
     of a given width:  exp(- (x - x0)^2 / (2*var^2) )
     This also means the energy grid spacing may change (usually to a denser one)
     The difference in grid densities is defined by the multiplicative factor dx0/dx
+    The convolution is done by the `gaussian_broadening` function for all the projections at once
 
     Args:
         X0 ( MATRIX(N0, 1) ): original X grid, N0 - the number of energy grid points
@@ -45,6 +150,8 @@ def convolve(X0, Y0, dx0, dx, var):
         dx0 ( double ): original X grid spacing [in units of energy]
         dx ( double ): new X grid spacing [in units of energy]
         var ( double ): width of the Gaussians that broaden the original data [in units of energy]
+        method ( int ): the convolution method, see `gaussian_broadening` [ default: 0 ]
+        cutoff ( double or None ): the Gaussians truncation, see `gaussian_broadening` [ default: 10.0 ]
 
     Returns:
         tuple: ( X, Y ), where:
@@ -60,36 +167,19 @@ def convolve(X0, Y0, dx0, dx, var):
     print("new grid spacing = ", dx)
     print("gaussian variance = ", var)
         
-    # Prepare arrays
-    N0    = Y0.num_of_rows     # how many original grid points
-    nproj = Y0.num_of_cols     # how many components
+    x0 = data_conv.MATRIX2nparray(X0)[:, 0].real
+    y0 = data_conv.MATRIX2nparray(Y0).real
+    N0 = y0.shape[0]           # how many original grid points
     N  = N0*mult               # how many new grid points
 
-    X = MATRIX(N, 1)           # new X axis
-    Y = MATRIX(N, nproj)       # new Y axes
-
-
-    for i in range(0,N):
-        X.set(i,0, X0.get(0,0) + i*dx)
-
+    x = x0[0] + np.arange(N)*dx  # new X axis
 
     area = var*math.sqrt(2.0*math.pi)  # area under Gaussian of type exp( -(x - x0)^2 / 2*var^2 ) 
-    alp = 0.5/(var**2)
-
-    for j in range(0,nproj):  
+    w = y0 * (dx0/area)                # initial areas, normalized
 
-        for i0 in range(0,N0):   # all initial grid points
-            x0 = X0.get(i0, 0)
-            y0 = Y0.get(i0, j)
+    y = gaussian_broadening(x0, w, x, var, cutoff, method)
 
-            area0 = dx0*y0      # initial area
-            w = area0/area
-
-            for i in range(0,N):
-                x = X.get(i, 0)
-                Y.add(i,j, w*math.exp(-alp*(x0-x)**2))
-
-    return X, Y
+    return data_conv.nparray2MATRIX(x.reshape(N, 1)), data_conv.nparray2MATRIX(y)
 
 
 
@@ -210,31 +300,21 @@ def QE_pdos(prefix, emin, emax, de, projections, Ef, outfile_prefix, do_convolve
         E, pDOSb = convolve(en, dosb, de, de_new, var)
 
     #============= Print out ==================
-    f2a = open(outfile_prefix+"_alp.txt","w"); f2a.close()
-    f2b = open(outfile_prefix+"_bet.txt","w"); f2b.close()
-
-    N = E.num_of_rows
-    for i in range(0,N):  # loop over grid points
-        line = str(E.get(i,0))+"   "
-        tot = 0.0
-        for j in range(0,nproj):
-            tot = tot + pDOSa.get(i,j)
-            line = line + str(pDOSa.get(i,j))+"   "
-        line = line + str(tot)+"\n"
-        f2a = open(outfile_prefix+"_alp.txt","a")
-        f2a.write(line)
-        f2a.close()
-
-    for i in range(0,N):  # loop over grid points
-        line = str(E.get(i,0))+"   "
-        tot = 0.0
-        for j in range(0,nproj):
-            tot = tot + pDOSb.get(i,j)
-            line = line + str(pDOSb.get(i,j))+"   "
-        line = line + str(tot)+"\n"
-        f2b = open(outfile_prefix+"_bet.txt","a")
-        f2b.write(line)
-        f2b.close()
+    E_np = data_conv.MATRIX2nparray(E)[:, 0].real
+    for pDOS, fname in [ (pDOSa, outfile_prefix+"_alp.txt"), (pDOSb, outfile_prefix+"_bet.txt") ]:
+        dos_np = data_conv.MATRIX2nparray(pDOS).real
+        tot = np.sum(dos_np, axis=1)
+
+        lines = []
+        for i in range(0, E_np.shape[0]):  # loop over grid points
+            line = str(E_np[i])+"   "
+            for j in range(0,nproj):
+                line = line + str(dos_np[i,j])+"   "
+            lines.append(line + str(tot[i])+"\n")
+
+        f2 = open(fname, "w")
+        f2.write("".join(lines))
+        f2.close()
 
     if nspin == 2:
         return E, pDOSa, pDOSb
@@ -357,32 +437,21 @@ def libra_pdos(_emin, _emax, _de, projections, prefix, outfile, Nel, do_convolve
     E *= (1.0/units.ev2Ha)
 
         
-    f2 = open(outfile,"w")
-    f2.write("Ef = %5.3f eV\n" % (Ef / units.ev2Ha) )
-    f2.close()
-
-    
     res = np.zeros( (N, nproj+2), dtype=float)
-    
-    # Now compute projections
-    for i in range(0,N):  # loop energy grid
-
-        res[i, 0] = E.get(i,0) 
-        line = str(E.get(i,0))+"   "
+    res[:, 0] = data_conv.MATRIX2nparray(E)[:N, 0].real
+    res[:, 1:nproj+1] = data_conv.MATRIX2nparray(pDOSa)[:N, :].real
+    res[:, nproj+1] = np.sum(res[:, 1:nproj+1], axis=1)
 
-        tot = 0.0
+    lines = ["Ef = %5.3f eV\n" % (Ef / units.ev2Ha) ]
+    for i in range(0,N):  # loop energy grid
+        line = str(res[i, 0])+"   "
         for j in range(0,nproj):
-            res[i, j+1] = pDOSa.get(i,j)
-            tot = tot + pDOSa.get(i,j)
-            line = line + str(pDOSa.get(i,j))+"   "
-            
-        res[i, nproj+1] = tot
-        line = line + str(tot)+"\n"
+            line = line + str(res[i, j+1])+"   "
+        lines.append(line + str(res[i, nproj+1])+"\n")
 
-        f2 = open(outfile,"a")
-        f2.write(line)
-        f2.close()
-    
+    f2 = open(outfile,"w")
+    f2.write("".join(lines))
+    f2.close()
 
     return res
     
@@ -445,123 +514,221 @@ def convolve_cp2k_pdos(params: dict):
     # The angular momentum columns in the .pdos files
     angular_momentum_cols = params["angular_momentum_cols"]
 
+    levels, homo_energies = read_cp2k_pdos(cp2k_pdos_file, angular_momentum_cols, energy_conversion)
+
+    # The energy grid and the HOMO energy are defined by the first step in the file
+    homo_energy = homo_energies[0]
+    min_energy = levels[0, 0, 0]
+    max_energy = levels[0, -1, 0]
+
+    # Now we make an equispaced energy vector from min_energy ad max_energy with npoints.
+    energy_grid = np.linspace( min_energy-2, max_energy+2, npoints )
+
+    t1 = time.time()
+    convolved_pdos = broaden_cp2k_pdos(levels[time_step], energy_grid, sigma, coef)
+    print('Elapsed time for convolving ',cp2k_pdos_file,': ',time.time()-t1,' seconds')
+
+    return energy_grid, convolved_pdos, homo_energy
+
+
+
+def read_cp2k_pdos(cp2k_pdos_file, angular_momentum_cols, energy_conversion=units.au2ev):
+    """
+    This function reads all the time steps stored in the pdos file produced by CP2K and sums 
+    up the requested angular momentum columns
+
+    Args:
+        cp2k_pdos_file (str): The CP2K .pdos file.
+        angular_momentum_cols (list of lists of ints): The angular momentum columns in the *.pdos files 
+            produced by CP2K to be summed up into each of the projections.
+        energy_conversion (float): The energy conversion unit from Hartree [ default: units.au2ev ]
+
+    Returns:
+        tuple: ( levels, homo_energies ), where:
+
+            * levels ( np.array( (nsteps, num_levels, nproj+1) ) ): the energies of all levels [converted units]
+                stored in levels[step, level, 0] and the summed PDOS of all projections stored in 
+                levels[step, level, 1:]
+            * homo_energies ( np.array( nsteps ) ): the HOMO energy at each step [converted units]
+
+    """
+
     # Opening the file
     file = open(cp2k_pdos_file,'r')
     lines = file.readlines()
     file.close()
-    
-    # Lines with 'DOS'
-    lines_with_dos = []
-    
-    # Finding the lines with 'DOS'
-    for i in range(0,len(lines)):
-        if 'DOS'.lower() in lines[i].lower().split():
-            lines_with_dos.append(i)
-    
-    # Finding the first and last index of PDOS for each time step
-    if len(lines_with_dos)==1:
-        # First index
-        first_index = 2
-        # Last index
-        last_index = int(lines[len(lines)-1].split()[0])
-    elif len(lines_with_dos)>1:
-        # First index
-        first_index = 2
-        # Last index
-        last_index = int(lines_with_dos[1]-1)
-    
-    # Find the number of columns in the PDOS file showing the number 
-    # of orbital components, energy, and occupation column.
-    num_cols = len(lines[first_index].split())
-    
-    # Number of energy levels considered for PDOS
-    num_levels = last_index - first_index + 1
 
-    
-    # Finding the homo and lumo energy level by appending the 
-    # pdos numerical values of unoccupied states only
-    pdos_unocc = []
-    # Energy levels
-    energy_levels = []
-    for i in range(first_index, last_index + 1):
-        energy_levels.append(float(lines[i].split()[1])*energy_conversion)
-        if float(lines[i].split()[2])==0:
-            pdos_unocc.append(i)
-    # HOMO energy level
-    homo_level = int(lines[min(pdos_unocc)].split()[0])
-    # HOMO energy
-    homo_energy = float(lines[homo_level].split()[1])*energy_conversion
-    # Minimum energy level
-    min_energy = float(lines[first_index].split()[1])*energy_conversion
-    # Maximum energy level
-    max_energy = float(lines[last_index].split()[1])*energy_conversion
-    
-    
-    # Now we make an equispaced energy vector from min_energy ad max_energy with npoints.
-    energy_grid = np.linspace( min_energy-2, max_energy+2, npoints )
-    energy_grid = np.array(energy_grid)
-    
-    
-    # Appending the energy lines with their component densities of states
-    energy_lines = []
-    # The initial line in the .pdos file of step 'time_step'
-    init_line  = time_step * ( num_levels + 2 ) + 2
-    # The final line in the .pdos file of step 'time_step'
-    final_line = ( time_step + 1 ) * ( num_levels + 2 )
-    for i in range( init_line, final_line ):
-        # Appending the energy lines into enrgy_lines
-        energy_lines.append( lines[i].split() )
-
-    for i in range(0, len(energy_lines)):
-        
-        for j in range(0,len(energy_lines[0])):
-            
-            energy_lines[i][j] = float(energy_lines[i][j])
-            
-    energy_lines = np.array(energy_lines)
+    # Finding the lines with 'DOS' - these are the headers of each time step
+    lines_with_dos = [ i for i in range(0,len(lines)) if 'DOS'.lower() in lines[i].lower().split() ]
+    if len(lines_with_dos)==0:
+        print(F"Error in read_cp2k_pdos - no time step headers found in the file {cp2k_pdos_file}\nExiting")
+        sys.exit(0)
+
+    # The levels of each time step are all the non-comment lines up to the next header
+    steps_data = []
+    for k, header in enumerate(lines_with_dos):
+        end = lines_with_dos[k+1] if k+1 < len(lines_with_dos) else len(lines)
+        steps_data.append( [ lin.split() for lin in lines[header+1 : end] if lin.strip()!="" and not lin.lstrip().startswith('#') ] )
+
+    # Number of energy levels considered for PDOS and the number of columns showing
+    # the number of orbital components, energy, and occupation column.
+    nsteps = len(steps_data)
+    num_levels = len(steps_data[0])
+    num_cols = len(steps_data[0][0])
+
+    for step in range(nsteps):
+        if len(steps_data[step])!=num_levels or any( len(lin)!=num_cols for lin in steps_data[step] ):
+            print(F"Error in read_cp2k_pdos - the time step {step} in the file {cp2k_pdos_file} has a different")
+            print(F"number of levels or columns than the first one ({num_levels} levels, {num_cols} columns)\nExiting")
+            sys.exit(0)
+
+    data = np.array(steps_data, dtype=float)
 
     # Now we sum the PDOSs defined in angular_momentum_cols by user
-    pdos_sum = []
-    for k in range(0, len(energy_lines)):
-        
-        # A temporary vector for summation of the PDOS
-        tmp_vec = []
-        tmp_vec.append(energy_lines[k][1])
-        
-        for i in range(0,len(angular_momentum_cols)):
-            # Initializing a new sum variable
-            # print("angular_momentum_cols[i]",angular_momentum_cols[i])
-            tmp_sum = 0
-            for j in angular_momentum_cols[i]:
-                
-                # If j is less than the number of columns 
-                # then sum the PDOS
-                if j<=num_cols:
-                    tmp_sum += energy_lines[k][j]
-            # Appending tmp_sum into tmp_vec
-            tmp_vec.append(tmp_sum)
-        
-        # Now append tmp_vec into pdos_sum, we will
-        # then use this pdos_sum for convolution
-        pdos_sum.append(tmp_vec)
-    
-    convolved_pdos = []
-    t1 = time.time()
-    # The pre-factor for Gaussian functions
+    nproj = len(angular_momentum_cols)
+    levels = np.zeros( (nsteps, num_levels, nproj + 1) )
+    levels[:, :, 0] = data[:, :, 1] * energy_conversion
+    for i in range(0, nproj):
+        cols = [ j for j in angular_momentum_cols[i] if j < num_cols ]
+        levels[:, :, i+1] = np.sum(data[:, :, cols], axis=2)
+
+    # The HOMO is the level right below the first unoccupied one, or the highest level if
+    # all of them are occupied
+    homo_energies = np.zeros(nsteps)
+    for step in range(nsteps):
+        unocc = np.nonzero(data[step, :, 2]==0)[0]
+        if len(unocc)==0:
+            homo_energies[step] = levels[step, num_levels - 1, 0]
+        elif unocc[0]==0:
+            print(F"Error in read_cp2k_pdos - none of the levels of the time step {step} in the file {cp2k_pdos_file} is occupied\nExiting")
+            sys.exit(0)
+        else:
+            homo_energies[step] = levels[step, unocc[0] - 1, 0]
+
+    return levels, homo_energies
+
+
+
+def broaden_cp2k_pdos(levels, energy_grid, sigma, coef=1.0):
+    """
+    This function convolves the summed CP2K PDOS with the normalized Gaussian functions:
+    coef / (sigma * sqrt(2*pi)) * exp( -(E - E_i)^2 / (2*sigma^2) ) for all projections at once
+
+    Args:
+        levels ( np.array( (num_levels, nproj+1) ) or np.array( (nsteps, num_levels, nproj+1) ) ): the energies 
+            and the projections, as returned by `read_cp2k_pdos`
+        energy_grid ( np.array( npoints ) ): the energy grid for the convolved PDOS
+        sigma (float): The standard deviation in Gaussian function.
+        coef (float): The coefficient multiplied in Gaussian function [ default: 1.0 ]
+
+    Returns:
+        np.array( (nproj, npoints) ) or np.array( (nsteps, nproj, npoints) ): the convolved PDOS
+
+    """
+
+    levels = np.asarray(levels)
+    is_2d = (levels.ndim==2)
+    if is_2d:
+        levels = levels[np.newaxis, :, :]
+
     pre_factor = (coef/(sigma*np.sqrt(2.0*np.pi)))
-    for j in range(1,len(angular_momentum_cols)+1):
-        # Initialize a vector of zeros summing the weighted PDOS
-        tmp_weighted_pdos = np.zeros(energy_grid.shape)
 
-        for i in range(0,num_levels):
-            # The Guassian function
-            gaussian_fun = pre_factor*(np.exp(-0.5*np.power(((energy_grid-float(pdos_sum[i][0])*energy_conversion)/sigma),2)))
-            
-            tmp_weighted_pdos = tmp_weighted_pdos + gaussian_fun * float( pdos_sum[i][j] )
-        convolved_pdos.append(tmp_weighted_pdos)
-    print('Elapsed time for convolving ',cp2k_pdos_file,': ',time.time()-t1,' seconds')
-    convolved_pdos = np.array(convolved_pdos)
-    
-    return energy_grid, convolved_pdos, homo_energy
-   
-   
+    # Each step has its own energy levels, so the steps are broadened one by one
+    res = np.zeros( (levels.shape[0], levels.shape[2]-1, energy_grid.shape[0]) )
+    for step in range(levels.shape[0]):
+        res[step] = pre_factor * gaussian_broadening(levels[step, :, 0], levels[step, :, 1:], energy_grid, sigma, None).T
+
+    if is_2d:
+        return res[0]
+    return res
+
+
+
+def _convolve_cp2k_pdos_file(args):
+    """
+    The worker function of `convolve_cp2k_pdos_md`
+    """
+
+    cp2k_pdos_file, energy_grid, params = args
+    levels, homo_energies = read_cp2k_pdos(cp2k_pdos_file, params["angular_momentum_cols"], params["energy_conversion"])
+
+    if params["time_steps"] is not None:
+        levels, homo_energies = levels[params["time_steps"]], homo_energies[params["time_steps"]]
+
+    return broaden_cp2k_pdos(levels, energy_grid, params["sigma"], params["coef"]), homo_energies
+
+
+
+def convolve_cp2k_pdos_md(params: dict):
+    """
+    This function is the MD version of `convolve_cp2k_pdos`: it reads all the time steps stored 
+    in one or several CP2K .pdos files (e.g. one file per MD snapshot), convolves them on a common
+    energy grid and puts the results into a single time-resolved PDOS array. The files are 
+    processed in parallel.
+
+    Args:
+
+        params (dictionary):
+
+            cp2k_pdos_files (list of str): The CP2K .pdos files, in the order of the MD time.
+
+            time_steps (list of int or None): The time steps to take from each file. None - all [ default: None ]
+
+            sigma (float): The standard deviation in Gaussian function [ default: 0.02 ]
+
+            coef (float): The coefficient multiplied in Gaussian function [ default: 1.0 ]
+
+            npoints (int): The number of points used in convolution [ default: 4000 ]
+
+            energy_conversion (float): The energy conversion unit from Hartree [ default: units.au2ev ]
+
+            angular_momentum_cols (list): The angular momentum columns in the *.pdos files produced by CP2K.
+
+            nprocs (int): The number of processes to use [ default: 1 ]
+
+            output_file (str or None): if given, the results are saved into this .npz file with the keys
+                "energy_grid", "pdos", "homo_energies" [ default: None ]
+
+    Returns:
+
+        energy_grid (numpy array): The energy grid points vector, defined by the first step of the first file
+            in the same way as in `convolve_cp2k_pdos`.
+
+        convolved_pdos (numpy array( (nsteps, nproj, npoints) ) ): The convolved pDOS for all steps.
+
+        homo_energies (numpy array( nsteps ) ): The HOMO energies for all steps.
+
+    """
+
+    # Critical parameters
+    critical_params = [ "cp2k_pdos_files", "angular_momentum_cols"]
+    # Default parameters
+    default_params = { "time_steps": None, "sigma": 0.02, "coef": 1.0, "npoints": 4000, 
+                       "energy_conversion": units.au2ev, "nprocs": 1, "output_file": None }
+    # Check input
+    comn.check_input(params, default_params, critical_params) 
+
+    files = params["cp2k_pdos_files"]
+
+    # The common energy grid
+    levels, homo_energies = read_cp2k_pdos(files[0], params["angular_momentum_cols"], params["energy_conversion"])
+    energy_grid = np.linspace( levels[0, 0, 0]-2, levels[0, -1, 0]+2, params["npoints"] )
+
+    t1 = time.time()
+    args = [ (f, energy_grid, params) for f in files ]
+    if params["nprocs"] > 1:
+        pool = mp.Pool(processes=params["nprocs"])
+        res = pool.map(_convolve_cp2k_pdos_file, args)
+        pool.close()
+        pool.join()
+    else:
+        res = [ _convolve_cp2k_pdos_file(a) for a in args ]
+    print('Elapsed time for convolving ', len(files), ' files: ', time.time()-t1, ' seconds')
+
+    convolved_pdos = np.concatenate( [ r[0] for r in res ], axis=0 )
+    homo_energies = np.concatenate( [ r[1] for r in res ] )
+
+    if params["output_file"] is not None:
+        np.savez(params["output_file"], energy_grid=energy_grid, pdos=convolved_pdos, homo_energies=homo_energies)
+
+    return energy_grid, convolved_pdos, homo_energies
@@ -0,0 +1,301 @@
+#*********************************************************************************
+#* Copyright (C) 2020 Alexey V. Akimov
+#*
+#* This file is distributed under the terms of the GNU General Public License
+#* as published by the Free Software Foundation, either version 3 of
+#* the License, or (at your option) any later version.
+#* See the file LICENSE in the root directory of this distribution
+#* or <http://www.gnu.org/licenses/>.
+#***********************************************************************************
+"""
+.. module:: profiling
+   :platform: Unix, Windows
+   :synopsis: This module implements the opt-in timing of the phases of the dynamics drivers
+       (Hamiltonian updates, model calls, electronic propagation, hopping, statistics, saving, etc.).
+       For each phase, the wall time, the CPU time, and the number of calls are accumulated and
+       are reported as a table at the end of the run. Optionally, the wall times of all phases on
+       every step are stored and written into an HDF5 file.
+
+       When the profiling is disabled, the drivers get a `null_timer` object, whose methods do nothing
+
+       Usage:
+
+           timer = profiling.make_timer(params)
+
+           for step in range(nsteps):
+               with timer.phase("propagation"):
+                   ...
+               timer.end_step()
+
+           timer.summarize(filename)
+
+       List of classes:
+           * phase_timer
+           * null_timer
+
+       List of functions:
+           * make_timer(params)
+
+.. moduleauthor:: Alexey V. Akimov
+
+"""
+
+__author__ = "Alexey V. Akimov"
+__copyright__ = "Copyright 2020 Alexey V. Akimov"
+__credits__ = ["Alexey V. Akimov"]
+__license__ = "GNU-3"
+__version__ = "1.0"
+__maintainer__ = "Alexey V. Akimov"
+__email__ = "alexvakimov@gmail.com"
+__url__ = "https://quantum-dynamics-hub.github.io/libra/index.html"
+
+
+import time
+import numpy as np
+
+
+
+class _phase:
+    """
+    The context manager that measures one call of a phase and adds it to the timer
+    """
+
+    __slots__ = ["timer", "name", "wall0", "cpu0"]
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.wall0 = time.perf_counter()
+        self.cpu0 = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timer.add(self.name, time.perf_counter() - self.wall0, time.process_time() - self.cpu0)
+        return False
+
+
+
+class _null_phase:
+    """
+    The context manager that does nothing
+    """
+
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_PHASE = _null_phase()
+
+
+
+class phase_timer:
+    """
+    Accumulates the wall and CPU times and the numbers of calls for named phases of a calculation
+
+    The phases may be nested (e.g. the model calls within the Hamiltonian update), in which case
+    the time of the inner phase is also included in the time of the outer one
+
+    """
+
+    def __init__(self, record_steps=False):
+        """
+        Args:
+            record_steps ( Boolean ): whether to also store the wall time of every phase on every step,
+                the steps are delimited by the calls of `end_step` [ default: False ]
+
+        """
+
+        self.wall = {}      # phase name -> total wall time [ s ]
+        self.cpu = {}       # phase name -> total CPU time [ s ]
+        self.ncalls = {}    # phase name -> the number of calls
+        self.order = []     # the phase names, in the order they were first seen
+
+        self.record_steps = record_steps
+        self.step_wall = {} # phase name -> list of the wall times on each of the recorded steps
+        self.current = {}   # phase name -> wall time accumulated since the last `end_step` call
+        self.nsteps = 0     # the number of recorded steps
+
+        self.wall0 = time.perf_counter()
+        self.cpu0 = time.process_time()
+
+
+    def phase(self, name):
+        """
+        Returns the context manager that measures the code within the `with` block as the phase `name`
+        """
+        return _phase(self, name)
+
+
+    def add(self, name, wall, cpu):
+        """
+        Adds the times of one call of the phase `name`
+
+        Args:
+            name ( string ): the name of the phase
+            wall ( double ): the wall time [ s ]
+            cpu ( double ): the CPU time [ s ]
+
+        """
+
+        if name not in self.wall:
+            self.wall[name], self.cpu[name], self.ncalls[name] = 0.0, 0.0, 0
+            self.order.append(name)
+            if self.record_steps:
+                self.step_wall[name] = [0.0] * self.nsteps
+
+        self.wall[name] += wall
+        self.cpu[name] += cpu
+        self.ncalls[name] += 1
+
+        if self.record_steps:
+            self.current[name] = self.current.get(name, 0.0) + wall
+
+
+    def wrap(self, name, funct):
+        """
+        Returns the function that calls `funct` timing it as the phase `name`. This is handy for
+        the Python callbacks (e.g. the model Hamiltonian functions) that are called from within C++
+        """
+
+        def _timed(*args, **kwargs):
+            with self.phase(name):
+                return funct(*args, **kwargs)
+
+        return _timed
+
+
+    def end_step(self):
+        """
+        Marks the end of a step: the wall times of all phases since the previous call are stored
+        as the times of this step. Does nothing unless `record_steps` is True
+        """
+
+        if not self.record_steps:
+            return
+
+        for name in self.order:
+            self.step_wall[name].append( self.current.get(name, 0.0) )
+        self.current = {}
+        self.nsteps += 1
+
+
+    def report(self, title="Timings"):
+        """
+        Prints out the table of the accumulated times, the phases are listed in the order they were first seen
+        """
+
+        total_wall = time.perf_counter() - self.wall0
+        total_cpu = time.process_time() - self.cpu0
+
+        print(F"===== {title} =====")
+        print(F"{'phase':<24} {'ncalls':>10} {'wall, s':>12} {'cpu, s':>12} {'wall, %':>8} {'wall/call, ms':>14}")
+        for name in self.order:
+            frac = 0.0
+            if total_wall > 0.0:
+                frac = 100.0 * self.wall[name] / total_wall
+            per_call = 1000.0 * self.wall[name] / max(1, self.ncalls[name])
+            print(F"{name:<24} {self.ncalls[name]:>10} {self.wall[name]:>12.4f} {self.cpu[name]:>12.4f} {frac:>8.2f} {per_call:>14.4f}")
+        print(F"{'total':<24} {'':>10} {total_wall:>12.4f} {total_cpu:>12.4f} {100.0:>8.2f}")
+
+
+    def save_hdf5(self, filename, group="timings"):
+        """
+        Writes the timings into the group `group` of the HDF5 file `filename` (the file is appended,
+        the existing group is overwritten):
+
+            group/<phase>/data - the wall times of the phase on every recorded step, if `record_steps` is True
+            group/<phase> attributes: "wall", "cpu", "ncalls" - the totals
+
+        """
+
+        import h5py
+
+        with h5py.File(filename, "a") as f:
+            if group in f:
+                del f[group]
+            g = f.create_group(group)
+
+            for name in self.order:
+                gp = g.create_group(name)
+                gp.attrs["wall"] = self.wall[name]
+                gp.attrs["cpu"] = self.cpu[name]
+                gp.attrs["ncalls"] = self.ncalls[name]
+                if self.record_steps:
+                    gp.create_dataset("data", data=np.array(self.step_wall[name]))
+
+
+    def summarize(self, filename=None, title="Timings"):
+        """
+        Prints out the timings table and, if the per-step timings are recorded and the `filename`
+        is not None, writes the timings into that HDF5 file
+        """
+
+        self.report(title)
+        if self.record_steps and filename != None:
+            self.save_hdf5(filename)
+
+
+
+class null_timer:
+    """
+    The timer with the same interface as `phase_timer`, which does nothing. It is used when
+    the profiling is disabled, so the instrumented code runs at (nearly) no extra cost
+    """
+
+    def phase(self, name):
+        return _NULL_PHASE
+
+    def add(self, name, wall, cpu):
+        pass
+
+    def wrap(self, name, funct):
+        return funct
+
+    def end_step(self):
+        pass
+
+    def report(self, title="Timings"):
+        pass
+
+    def save_hdf5(self, filename, group="timings"):
+        pass
+
+    def summarize(self, filename=None, title="Timings"):
+        pass
+
+
+
+def make_timer(params):
+    """
+    Creates the timer according to the profiling settings
+
+    Args:
+        params ( dictionary ): parameters of the calculations, the following key is used:
+
+            * **params["profiling"]** ( int ): the profiling level
+
+                - 0: no profiling [ default ]
+                - 1: accumulate the times of the phases and print out the summary table at the end
+                - 2: same as 1, plus the wall times of the phases on every step are written into an HDF5 file
+
+    Returns:
+        phase_timer or null_timer: the timer object
+
+    """
+
+    level = 0
+    if "profiling" in params.keys():
+        level = params["profiling"]
+
+    if level <= 0:
+        return null_timer()
+
+    return phase_timer(record_steps = level >= 2)
+
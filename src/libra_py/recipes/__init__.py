@@ -6,7 +6,17 @@
 # * License, or (at your option) any later version.
 # * http://www.gnu.org/copyleft/gpl.txt
 #***********************************************************/
-from . import step2_recipes
 
 __all__ = ["step2_recipes"
           ]
+
+
+import importlib
+
+def __getattr__(name):
+    """
+    Imports the recipes modules on the first access (PEP 562)
+    """
+    if name in __all__:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError(F"module {__name__!r} has no attribute {name!r}")
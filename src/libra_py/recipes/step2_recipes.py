@@ -14,7 +14,6 @@ import logging
 import numpy as np
 import multiprocessing as mp
 
-import matplotlib.pyplot as plt
 
 import util.libutil as comn
 from libra_py import CP2K_methods
@@ -33,6 +33,7 @@ import libra_py.probabilities as prob
 import libra_py.tsh as tsh
 from . import decoherence_times
 from . import step4
+import libra_py.profiling as profiling
 
 
 
@@ -371,6 +372,10 @@ def run(H_vib, params):
         * **params["extend_md"]** ( Boolean ) : whether or not to extend md time by resampling the NBRA hopping probabilities
         * **params["extend_md_time"]** ( int ) : length of the new dynamics trajectory, in units dt
         * **params["detect_SD_difference"]** ( Boolean ) : see if SD states differ by more than 1 electron, if so probability to zero [ default: False ]
+        * **params["profiling"]** ( int ) : whether to time the phases of the calculations: "probabilities", "statistics",
+            "output", "markov", and "hopping", see :funct:`profiling.make_timer` [ default: 0 ]
+        * **params["profiling_file"]** ( string ) : the name of the HDF5 file where to write the per-step timings, 
+            if params["profiling"] is 2 [ default: None - don't write the timings ]
 
     """
 
@@ -382,12 +387,16 @@ def run(H_vib, params):
                        "evolve_Markov":True, "evolve_TSH":True, 
                        "extend_md":False, "extend_md_time":1,
                        "detect_SD_differences":False,
-                       "return_probabilities":False }
+                       "return_probabilities":False,
+                       "profiling":0, "profiling_file":None }
 
     comn.check_input(params, default_params, critical_params)
     
     rnd = Random()
 
+    # Profiling: when it is disabled, the timer does nothing
+    timer = profiling.make_timer(params)
+
     ndata = len(H_vib)
     nsteps = params["nsteps"]
     nstates= H_vib[0][0].num_of_cols
@@ -411,9 +420,10 @@ def run(H_vib, params):
     itimes = params["init_times"]
     nitimes = len(itimes)
 
-    for idata in range(0,ndata):
-        p = Belyaev_Lebedev(H_vib[idata], params)
-        P.append(p)
+    with timer.phase("probabilities"):
+        for idata in range(0,ndata):
+            p = Belyaev_Lebedev(H_vib[idata], params)
+            P.append(p)
 
     if detect_SD_difference == True:
         P = adjust_SD_probabilities(P, params)  
@@ -467,16 +477,18 @@ def run(H_vib, params):
         # Compute the averages
         #res_i = step4.traj_statistics(i, Coeff, istate, H_vib, itimes)
         #res_i = step4.traj_statistics2(i, Pop, istate, H_vib, itimes)
-        res_i = step4.traj_statistics2_fast(i, Pop, istate, H_vib, itimes)
+        with timer.phase("statistics"):
+            res_i = step4.traj_statistics2_fast(i, Pop, istate, H_vib, itimes)
 
-        # Print out into a file
-        if do_output==True:
-            step4.printout(i*dt, res_i, params["outfile"])
+        with timer.phase("output"):
+            # Print out into a file
+            if do_output==True:
+                step4.printout(i*dt, res_i, params["outfile"])
 
-        # Update the overal results matrix
-        res.set(i,0, i*dt)
-        if do_return==True:
-            push_submatrix(res, res_i, Py2Cpp_int(list([i])), Py2Cpp_int(list(range(1,3*nstates+5))) )
+            # Update the overal results matrix
+            res.set(i,0, i*dt)
+            if do_return==True:
+                push_submatrix(res, res_i, Py2Cpp_int(list([i])), Py2Cpp_int(list(range(1,3*nstates+5))) )
 
         #=============== Propagation ==============================
         for idata in range(0,ndata):   # over all data sets (MD trajectories)
@@ -495,28 +507,33 @@ def run(H_vib, params):
                     # The convention is:
                     # P(i,j) - the probability to go from j to i
                     if evolve_Markov==True:
-                        Pop[Tr] = CMATRIX(P[idata][it+i]) * Pop[Tr]
+                        with timer.phase("markov"):
+                            Pop[Tr] = CMATRIX(P[idata][it+i]) * Pop[Tr]
 
                     if evolve_TSH==True:        
-
-                        # Surface hopping 
-                        ksi  = rnd.uniform(0.0, 1.0)
+                        with timer.phase("hopping"):
+                            # Surface hopping 
+                            ksi  = rnd.uniform(0.0, 1.0)
                         
-                        # Proposed hop:
-                        st_new = tsh.hop_py(istate[Tr], P[idata][it+i].T(), ksi)  
+                            # Proposed hop:
+                            st_new = tsh.hop_py(istate[Tr], P[idata][it+i].T(), ksi)  
                         
-                        # Accept the proposed hop with the Boltzmann probability
-                        E_new = H_vib[idata][it+i].get(st_new,st_new).real
-                        E_old = H_vib[idata][it+i].get(istate[Tr], istate[Tr]).real
-                        de = E_new - E_old
+                            # Accept the proposed hop with the Boltzmann probability
+                            E_new = H_vib[idata][it+i].get(st_new,st_new).real
+                            E_old = H_vib[idata][it+i].get(istate[Tr], istate[Tr]).real
+                            de = E_new - E_old
                         
-                        if de>0.0:
-                            bf = tsh.boltz_factor(E_new, E_old, T, boltz_opt)
-                            ksi  = rnd.uniform(0.0, 1.0)
-                            if ksi < bf:
-                                istate[Tr] = st_new                  
-                        else:
-                            istate[Tr] = st_new
+                            if de>0.0:
+                                bf = tsh.boltz_factor(E_new, E_old, T, boltz_opt)
+                                ksi  = rnd.uniform(0.0, 1.0)
+                                if ksi < bf:
+                                    istate[Tr] = st_new                  
+                            else:
+                                istate[Tr] = st_new
+
+        timer.end_step()
+
+    timer.summarize(params["profiling_file"], "NBRA LZ timings")
 
     if return_probabilities == True:
         return res, P
@@ -25,6 +25,7 @@ import cmath
 import math
 import os
 import sys
+import numpy as np
 
 if sys.platform=="cygwin":
     from cyglibra_core import *
@@ -38,6 +39,79 @@ import util.libutil as comn
 import libra_py.units as units
 import libra_py.influence_spectrum as influence_spectrum
 import libra_py.data_stat as data_stat
+import libra_py.data_conv as data_conv
+
+
+def sum_of_sinusoids(theta, nsamples):
+    """Computes the sums of sin(theta*r) and cos(theta*r) over r = 0, 1, ... nsamples-1 in the closed form
+
+    Args:
+        theta ( numpy array of doubles ): the phase increments [ units: radian ]
+        nsamples ( int ): the number of terms in the sums
+
+    Returns:
+        tuple: (S, C), where:
+
+            S ( numpy array of doubles ): S[k] = sum_r sin(theta[k]*r)
+            C ( numpy array of doubles ): C[k] = sum_r cos(theta[k]*r)
+
+    """
+
+    half = 0.5 * np.asarray(theta, dtype=float)
+    s = np.sin(half)
+
+    # theta = 2*pi*m: all the terms of the sines are 0, all the terms of the cosines are 1
+    small = np.abs(s) < 1e-12
+    ratio = np.sin(nsamples * half) / np.where(small, 1.0, s)
+
+    S = np.where(small, 0.0, ratio * np.sin((nsamples - 1) * half))
+    C = np.where(small, float(nsamples), ratio * np.cos((nsamples - 1) * half))
+
+    return S, C
+
+
+def compute_qs_deviation(freqs_ij, nfreqs, dt, nsamples=1000000):
+    """Computes the standard deviation of the QSH term (sum of sines) for one matrix element
+
+    The QSH term sampled on the grid t_r = r * dt, r = 0, 1, ... nsamples-1 is:
+
+        fu(r) = sum_k { A_k * sin(w_k * r * dt) }
+
+    Its sum and the sum of its squares over the grid are computed in the closed form:
+
+        sum_r fu(r) = sum_k { A_k * sum_r sin(w_k * r * dt) }
+
+        sum_r fu(r)^2 = 1/2 * sum_k sum_l { A_k * A_l * sum_r [ cos((w_k - w_l) * r * dt) - cos((w_k + w_l) * r * dt) ] }
+
+    so the cost does not depend on the number of samples
+
+    Args:
+        freqs_ij ( list of lists of double ): the spectral info for one matrix element,
+            SeeAlso: influence_spectrum.compute_mat_elt for the description of the output `freqs`
+        nfreqs ( int ): the maximal number of frequencies to use
+        dt ( double ): the sampling time step [ units: fs ]
+        nsamples ( int ): the number of the time points in the sampling grid [ default: 1000000 ]
+
+    Returns:
+        double: the standard deviation of the QSH term
+
+    """
+
+    nfreqs = min(nfreqs, len(freqs_ij))
+    conv = units.wavn2au * units.fs2au
+
+    w = np.array([ freqs_ij[k][0] for k in range(nfreqs) ], dtype=float) * conv * dt
+    a = np.array([ freqs_ij[k][2] for k in range(nfreqs) ], dtype=float)
+
+    S, C = sum_of_sinusoids(w, nsamples)
+    fu_ave = np.dot(a, S)
+
+    _, C_minus = sum_of_sinusoids(w[:, None] - w[None, :], nsamples)
+    _, C_plus = sum_of_sinusoids(w[:, None] + w[None, :], nsamples)
+    fu2_ave = 0.5 * np.dot(a, np.dot(C_minus - C_plus, a))
+
+    return math.sqrt( max(0.0, (fu2_ave - fu_ave**2) / nsamples) )
+
 
 
 def compute_freqs(H_vib, params):
@@ -68,6 +142,9 @@ def compute_freqs(H_vib, params):
                 * acf_type
                 * data_type
 
+            * **params["nsamples"]** ( int ): the number of the time points used to compute the standard
+                deviation of the QSH terms [ default: 1000000 ]
+
     Returns:
         tuple: (freqs, dev), where:
 
@@ -80,45 +157,28 @@ def compute_freqs(H_vib, params):
 
     # Set defaults and check critical parameters
     critical_params = [ ] 
-    default_params = {  }
+    default_params = { "nsamples":1000000 }
     comn.check_input(params, default_params, critical_params)
 
 
     # Local variables and dimensions
-    nsteps = len(H_vib)    
+    nsteps = len(H_vib)
     nstates = H_vib[0].num_of_rows
 
     freqs, T,  norm_acf,  raw_acf,  W,  J, J2 = influence_spectrum.compute_all(H_vib, params)  # T in fs, W and freqs in cm^-1
 
     dt = params["dt"]
-    conv = units.wavn2au * units.fs2au
+    nsamples = params["nsamples"]
+
 
-    
     # Ok, now we have the function - sum of sines, so let's compute the standard deviation
-    # This is a silly method - just do it numerically
+    # over the grid of nsamples time points
     dev = [ [ 0.0 for i in range(0,nstates)] for j in range(0,nstates)]
-        
+
     for i in range(0,nstates):
         for j in range(0,nstates):
+            dev[i][j] = compute_qs_deviation(freqs[i][j], params["nfreqs"], dt, nsamples)
 
-            # Adjust the number of frequencies
-            nfreqs = params["nfreqs"]            
-            if len(freqs[i][j]) < nfreqs:
-                nfreqs = len(freqs[i][j])
-
-            # Compute the variation of the QSH terms
-            fu_ave, fu2_ave = 0.0, 0.0
-            for r in range(0,1000000):
-
-                fu = 0.0
-                for k in range(0,nfreqs):
-                    fu = fu + freqs[i][j][k][2] * math.sin(conv*freqs[i][j][k][0]*r*dt)
-
-                fu_ave = fu_ave + fu
-                fu2_ave = fu2_ave + fu*fu
-
-            dev[i][j] = math.sqrt( (fu2_ave - fu_ave**2) / 1000000.0 ) 	
-    
     return freqs, dev
 
 
@@ -196,6 +256,109 @@ def compute_qs_Hvib(Nfreqs, freqs, t,
 
 
 
+def compute_qs_Hvib_chunks(Nfreqs, freqs, times,
+                 H_vib_re_ave, H_vib_re_std, dw_Hvib_re, up_Hvib_re,
+                 H_vib_im_ave, H_vib_im_std, dw_Hvib_im, up_Hvib_im,
+                 dev, chunk_size=10000, output_type=1):
+    """Generates the QSH Hamiltonians for a series of times, in chunks of `chunk_size` time points
+
+    Same as calling `compute_qs_Hvib` for every time in `times`, but the QSH terms of each
+    matrix element for all the times of the chunk are computed at once, as the product of the
+    (ntimes x nfreqs) matrix of sines and the vector of amplitudes. Only one chunk is kept in
+    memory at a time, so the series of any length can be generated
+
+    Args:
+        Nfreqs, freqs, H_vib_re_ave, H_vib_re_std, dw_Hvib_re, up_Hvib_re,
+        H_vib_im_ave, H_vib_im_std, dw_Hvib_im, up_Hvib_im, dev: SeeAlso: compute_qs_Hvib
+        times ( list or 1D numpy array of doubles ): times at which we want to reconstruct the QSH [ units: a.u. ]
+        chunk_size ( int ): the maximal number of the time points in a chunk [ default: 10000 ]
+        output_type ( int ): the format of the chunks:
+
+            - 0: list of CMATRIX(nstates, nstates)
+            - 1: complex numpy array of shape (ntimes, nstates, nstates) [ default ]
+
+    Yields:
+        list of CMATRIX or 3D numpy array: the QSH vibronic Hamiltonians at the times of the next chunk
+
+    """
+
+    nstates = H_vib_re_ave.num_of_cols
+    conv = units.wavn2au
+    times = np.asarray(times, dtype=float)
+    ntimes = times.shape[0]
+
+    re_ave, re_std = data_conv.MATRIX2nparray(H_vib_re_ave), data_conv.MATRIX2nparray(H_vib_re_std)
+    re_dw, re_up = data_conv.MATRIX2nparray(dw_Hvib_re), data_conv.MATRIX2nparray(up_Hvib_re)
+    im_ave, im_std = data_conv.MATRIX2nparray(H_vib_im_ave), data_conv.MATRIX2nparray(H_vib_im_std)
+    im_dw, im_up = data_conv.MATRIX2nparray(dw_Hvib_im), data_conv.MATRIX2nparray(up_Hvib_im)
+
+    # Frequencies and amplitudes of the upper-triangle matrix elements
+    elts = []
+    for i in range(0,nstates):
+        for j in range(i,nstates):
+            nfreqs = min(Nfreqs, len(freqs[i][j]))
+            w = conv * np.array([ freqs[i][j][k][0] for k in range(nfreqs) ], dtype=float)
+            a = np.array([ freqs[i][j][k][2] for k in range(nfreqs) ], dtype=float)
+            elts.append( (i, j, w, a) )
+
+    for start in range(0, ntimes, chunk_size):
+        t = times[start : start + chunk_size]
+        res = np.zeros( (t.shape[0], nstates, nstates), dtype=complex )
+
+        for i, j, w, a in elts:
+            x = np.outer(t, w)
+            fu = np.dot( np.sin(x, out=x), a )
+
+            if i==j:
+                xab = re_ave[i,j] + re_std[i,j] * (fu/dev[i][j])
+                xab = np.where(xab < re_dw[i,j], re_dw[i,j], np.where(xab > re_up[i,j], re_up[i,j], xab))
+                res[:, i, j] = xab
+            else:
+                xab = im_ave[i,j] + im_std[i,j] * (fu/dev[i][j])
+                xab = np.where(xab < im_dw[i,j], im_dw[i,j], np.where(xab > im_up[i,j], im_up[i,j], xab))
+                res[:, i, j] = -1.0j * xab
+                res[:, j, i] =  1.0j * xab
+
+        if output_type==0:
+            yield [ data_conv.nparray2CMATRIX(res[n]) for n in range(t.shape[0]) ]
+        else:
+            yield res
+
+
+
+def compute_qs_Hvib_series(Nfreqs, freqs, times,
+                 H_vib_re_ave, H_vib_re_std, dw_Hvib_re, up_Hvib_re,
+                 H_vib_im_ave, H_vib_im_std, dw_Hvib_im, up_Hvib_im,
+                 dev, output_type=1):
+    """Compute the QSH Hamiltonians for a series of times
+
+    Args:
+        SeeAlso: compute_qs_Hvib_chunks
+
+    Returns:
+        list of CMATRIX or 3D numpy array: the QSH vibronic Hamiltonians at all the `times`:
+
+            - if output_type == 0: list of CMATRIX(nstates, nstates), one per time
+            - if output_type == 1: complex numpy array of shape (ntimes, nstates, nstates)
+
+    """
+
+    chunks = list( compute_qs_Hvib_chunks(Nfreqs, freqs, times,
+                       H_vib_re_ave, H_vib_re_std, dw_Hvib_re, up_Hvib_re,
+                       H_vib_im_ave, H_vib_im_std, dw_Hvib_im, up_Hvib_im,
+                       dev, 10000, output_type) )
+
+    if output_type==0:
+        return [ x for chunk in chunks for x in chunk ]
+
+    if len(chunks)==0:
+        nstates = H_vib_re_ave.num_of_cols
+        return np.zeros( (0, nstates, nstates), dtype=complex )
+
+    return np.concatenate(chunks, axis=0)
+
+
+
 
 def run(H_vib, params):
     """
@@ -294,20 +457,18 @@ def run(H_vib, params):
 
         
         #============= Output the resulting QSH Hamiltonians ===========================
-        Hvib = []
-        for i in range(0,nsteps):
-            # compute QSH Hvib at time t_i = i * dt
-            qs_Hvib = compute_qs_Hvib(nfreqs, freqs, i*dt, H_vib_re_ave, H_vib_re_std, dw_Hvib_re, 
-                            up_Hvib_re, H_vib_im_ave, H_vib_im_std, dw_Hvib_im, up_Hvib_im,  dev)
-
-            Hvib.append(CMATRIX(qs_Hvib))
+        # compute QSH Hvib at all times t_i = i * dt
+        times = [ i*dt for i in range(0,nsteps) ]
+        Hvib = compute_qs_Hvib_series(nfreqs, freqs, times, H_vib_re_ave, H_vib_re_std, dw_Hvib_re,
+                            up_Hvib_re, H_vib_im_ave, H_vib_im_std, dw_Hvib_im, up_Hvib_im,  dev, 0)
 
-            if params["do_QSH_output"]==True:
+        if params["do_QSH_output"]==True:
+            for i in range(0,nsteps):
                 #============= Output the resulting QSH Hamiltonians ===========================
-                re_filename = prms["output_set_paths"][idata] + prms["qsh_Hvib_re_prefix"] + str(i) + prms["qsh_Hvib_re_suffix"]
-                im_filename = prms["output_set_paths"][idata] + prms["qsh_Hvib_im_prefix"] + str(i) + prms["qsh_Hvib_im_suffix"]        
-                qs_Hvib.real().show_matrix(re_filename)
-                qs_Hvib.imag().show_matrix(im_filename)
+                re_filename = params["output_set_paths"][idata] + params["qsh_Hvib_re_prefix"] + str(i) + params["qsh_Hvib_re_suffix"]
+                im_filename = params["output_set_paths"][idata] + params["qsh_Hvib_im_prefix"] + str(i) + params["qsh_Hvib_im_suffix"]
+                Hvib[i].real().show_matrix(re_filename)
+                Hvib[i].imag().show_matrix(im_filename)
 
         qsh_H_vib.append(Hvib)        
         
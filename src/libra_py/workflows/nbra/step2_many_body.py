@@ -239,7 +239,7 @@ def integrate_cube_set( cubefiles_set_1, cubefiles_set_2, dv ):
 
 
 
-def compute_cube_ks_overlaps( cubefiles_prev, params):
+def compute_cube_ks_overlaps( cubefiles_prev, params, pool=None ):
     """
     This function computes overlaps between cube files of two time steps. In order to not read the cube files 
     twice it returns the cube files of the current step, and gets the cube files of the previous step.
@@ -257,6 +257,9 @@ def compute_cube_ks_overlaps( cubefiles_prev, params):
                          it is restricted.
             
             nprocs (int): The number of processors used to read the cube files and perform the integration.
+
+        pool (multiprocessing.Pool): The pool of workers to read the cube files. If None, a new pool 
+            is created and closed in this function [ default: None ]
             
     Returns:
     
@@ -288,7 +291,9 @@ def compute_cube_ks_overlaps( cubefiles_prev, params):
     print('Reading cube files with %i number of processors'%nprocs)
     # First read all the .cube files (This is the most time consuming part)
     # Creating a pool and assigning the number of processors for mp.Pool
-    pool = mp.Pool(processes=nprocs)
+    own_pool = pool is None
+    if own_pool:
+        pool = mp.Pool(processes=nprocs)
     
     # for curr_step
     print("Reading the cubes for step ", curr_step)
@@ -305,7 +310,8 @@ def compute_cube_ks_overlaps( cubefiles_prev, params):
     # Apply pool.map to the cube_file_methods to the set of variables of the cubefile_names_curr
     cubefiles_curr = pool.map( cube_file_methods.read_cube, cubefile_names_curr )
     # Close the pool
-    pool.close()
+    if own_pool:
+        pool.close()
     
     # Calculate the dv element for integration
     dv = cube_file_methods.grid_volume( cubefile_names_curr[0] )
@@ -591,6 +597,84 @@ def form_Hvib_real( params ):
 
 
 
+def run_es_calculation( params, curr_step ):
+    """
+    This function prepares the input, runs the electronic structure calculation (CP2K, Gaussian, or DFTB+)
+    for a given time step and generates the cube files. The pdos and log files are moved to the
+    `pdosfiles` and `logfiles` directories, the cube files are left in the working directory.
+
+    Args:
+
+        params (dictionary): the same as in `run_step2_many_body`. The following keys are used:
+
+            es_software (string): The electronic structure calculation software ("cp2k", "gaussian", or "dftb+").
+
+            es_software_exe (string): The executable file or path.
+
+            es_software_input_template (str): The full path to the input template.
+
+            waveplot_exe (string): The waveplot executable, for DFTB+ only.
+
+            project_name (string): The project name.
+
+            trajectory_xyz_filename (string): The full path to trajectory xyz file.
+
+            nprocs (integer): The number of processors to be used.
+
+            ks_orbital_indicies (list of ints): The KS orbitals for which to generate the cubes.
+
+            isUKS (integer): The flag for unrestricted spin calculations.
+
+        curr_step (int): The time step to compute
+
+    Returns:
+
+        None
+
+    """
+
+    es_software = params["es_software"]
+    es_exe = params["es_software_exe"]
+    input_template = params["es_software_input_template"]
+    project_name = params["project_name"]
+    nprocs = int(params["nprocs"])
+    ks_orbital_indicies = params["ks_orbital_indicies"]
+
+    if es_software == "cp2k":
+
+        # Set up the cp2k input template with the atomic positions for this timestep
+        CP2K_methods.CP2K_input_static( input_template, project_name, params["trajectory_xyz_filename"], curr_step )
+        # Running the CP2K calculations
+        os.system("mpirun -np %d %s -i %s-%i.inp -o logfiles/step_%d.log "%( nprocs, es_exe, project_name, curr_step, curr_step ) )
+        # After finishing the CP2K calculations move all the pdos files to specified folders
+        os.system("mv *.pdos pdosfiles")
+
+    elif es_software == "gaussian":
+
+        Gaussian_methods.gaussian_input( project_name, curr_step, input_template, params["trajectory_xyz_filename"] )
+        os.system("%s < %s-%i.gjf > logfiles/step_%d.log "%( es_exe, project_name, curr_step, curr_step ) )
+        Gaussian_methods.cube_generator_gaussian(project_name,curr_step,ks_orbital_indicies[0],ks_orbital_indicies[-1],nprocs,'../../sample_cube_file.cube',int(params["isUKS"]))
+
+    elif es_software == "dftb+":
+
+        print( 'curr_step', curr_step)
+        # Set up the dftb+ input template.
+        DFTB_methods.make_dftb_input( input_template, 0, curr_step  )
+        # Convert the xyz file for currstep to the .gen file format
+        os.system("xyz2gen coord-"+str(curr_step)+".xyz")
+        # Run the dftb+ program
+        os.system("srun %s"%( es_exe ) )
+        os.system("mv band.out step_"+str(curr_step)+"_ks.log")
+        os.system("mv step_"+str(curr_step)+"_ks.log logfiles/.")
+        os.system("mv EXC.DAT EXC_"+str(curr_step)+".DAT")
+        os.system("mv EXC_"+str(curr_step)+".DAT logfiles/.")
+        os.system("mv TRA.DAT TRA_"+str(curr_step)+".DAT")
+        os.system("mv TRA_"+str(curr_step)+".DAT logfiles/.")
+        DFTB_methods.cube_generator_dftbplus( project_name, curr_step, ks_orbital_indicies[0], ks_orbital_indicies[-1], params["waveplot_exe"], int(params["isUKS"]) )
+
+
+
+
 def run_step2_many_body( params ):
     """
     This function is the main function which runs the following calculations:
@@ -743,37 +827,7 @@ def run_step2_many_body( params ):
     timer1 = time.time()
     # Set up an initial parameter to compute the norm of the vector
 
-    if es_software == "cp2k":
-
-        # Set up the cp2k input template with the atomic positions for the first timestep of this job batch
-        CP2K_methods.CP2K_input_static( cp2k_input_template, project_name, trajectory_xyz_filename, curr_step )
-        # Running the CP2K calculations
-        os.system("mpirun -np %d %s -i %s-%i.inp -o logfiles/step_%d.log "%( nprocs, cp2k_exe, project_name, curr_step, curr_step ) )
-        # After finishing the CP2K calculations move all the pdos and cube files to specified folders
-        os.system("mv *.pdos pdosfiles")
-
-    elif es_software == "gaussian":
-
-        Gaussian_methods.gaussian_input( project_name, curr_step, gaussian_input_template, trajectory_xyz_filename )
-        os.system("%s < %s-%i.gjf > logfiles/step_%d.log "%( gaussian_exe, project_name, curr_step, curr_step ) )
-        Gaussian_methods.cube_generator_gaussian(project_name,curr_step,ks_orbital_indicies[0],ks_orbital_indicies[-1],nprocs,'../../sample_cube_file.cube',int(params["isUKS"]))
-
-    elif es_software == "dftb+":
-
-        print( 'params["curr_step"]', params["curr_step"])
-        # Set up the dftb+ input template.
-        DFTB_methods.make_dftb_input( dftb_input_template, 0, params["curr_step"]  )
-        # Convert the xyz file for currstep to the .gen file format
-        os.system("xyz2gen coord-"+str(params["curr_step"])+".xyz")
-        # Run the dftb+ program
-        os.system("srun %s"%( dftbp_exe ) )
-        os.system("mv band.out step_"+str(curr_step)+"_ks.log")
-        os.system("mv step_"+str(curr_step)+"_ks.log logfiles/.")
-        os.system("mv EXC.DAT EXC_"+str(curr_step)+".DAT")
-        os.system("mv EXC_"+str(curr_step)+".DAT logfiles/.")
-        os.system("mv TRA.DAT TRA_"+str(curr_step)+".DAT")
-        os.system("mv TRA_"+str(curr_step)+".DAT logfiles/.")
-        DFTB_methods.cube_generator_dftbplus( project_name, curr_step, ks_orbital_indicies[0], ks_orbital_indicies[-1], waveplot_exe, int(params["isUKS"]) )
+    run_es_calculation( params, curr_step )
 
     os.system("mv *.cube cubefiles")
     # Print the elapsed time for CP2K calculations for this step.
@@ -839,38 +893,8 @@ def run_step2_many_body( params ):
         # Setting up the timer
         timer1 = time.time()
 
-        if es_software == "cp2k":
-
-            # Creating the CP2K input
-            CP2K_methods.CP2K_input_static( cp2k_input_template, project_name, trajectory_xyz_filename, curr_step )
-            # Run CP2K
-            os.system("mpirun -np %d %s -i %s-%i.inp -o logfiles/step_%d.log "%( nprocs, cp2k_exe, project_name, curr_step, curr_step ) )
-            # Move all the pdos and cube files to one folder
-            os.system("mv *.pdos pdosfiles")
-
-        elif es_software == "gaussian":
-
-            Gaussian_methods.gaussian_input( project_name, curr_step, gaussian_input_template, trajectory_xyz_filename )
-            os.system("%s < %s-%i.gjf > logfiles/step_%d.log "%( gaussian_exe, project_name, curr_step, curr_step ) )
-            Gaussian_methods.cube_generator_gaussian(project_name,curr_step,ks_orbital_indicies[0],ks_orbital_indicies[-1],nprocs,'../../sample_cube_file.cube',int(params["isUKS"]))
+        run_es_calculation( params, curr_step )
 
-        elif es_software == "dftb+":
-
-            print( 'params["curr_step"]', params["curr_step"])
-            # Set up the dftb+ input template.
-            DFTB_methods.make_dftb_input( dftb_input_template, 0, params["curr_step"]  )
-            # Convert the xyz file for currstep to the .gen file format
-            os.system("xyz2gen coord-"+str(params["curr_step"])+".xyz")
-            # Run the dftb+ program
-            os.system("srun %s"%( dftbp_exe ) )
-            os.system("mv band.out step_"+str(curr_step)+"_ks.log")
-            os.system("mv step_"+str(curr_step)+"_ks.log logfiles/.")
-            os.system("mv EXC.DAT EXC_"+str(curr_step)+".DAT")
-            os.system("mv EXC_"+str(curr_step)+".DAT logfiles/.")
-            os.system("mv TRA.DAT TRA_"+str(curr_step)+".DAT")
-            os.system("mv TRA_"+str(curr_step)+".DAT logfiles/.")
-            DFTB_methods.cube_generator_dftbplus( project_name, curr_step, ks_orbital_indicies[0], ks_orbital_indicies[-1], waveplot_exe, int(params["isUKS"]) )
-  
         os.system("mv *.cube cubefiles")
         # Print the Timing
         print("Elapsed time for step ", params["curr_step"]," was ", time.time() - timer1)
@@ -925,3 +949,190 @@ def run_step2_many_body( params ):
     os.system("mv pdosfiles/* ../../all_pdosfiles/.")
     os.system("rm "+trajectory_xyz_filename)
     os.system("rm *wfn")
+
+
+
+
+def run_step2_many_body_pipelined( params ):
+    """
+    This function does the same calculations as `run_step2_many_body`, but it pipelines them:
+    the electronic structure calculation for the step t+1 (and optionally further steps) runs 
+    in the background while the cube files of the step t are read and the overlaps are computed.
+    The cube files are read by a single pool of workers that persists for the whole job.
+
+    The cube files of each step are kept separately (by their step index), so at most 
+    `nsteps_ahead` + 1 sets of cube files exist on disk at any time. The outputs (files in res_dir, 
+    logfiles, pdosfiles) are the same as those of `run_step2_many_body`.
+
+    Args:
+
+        params (dictionary): the same parameters as in `run_step2_many_body`, plus:
+
+            nsteps_ahead (integer): The number of electronic structure calculations that are allowed
+                to run ahead of the overlap calculations. Note that the ES calculations themselves 
+                are still done one at a time [ default: 1 ]
+
+            nprocs_pool (integer): The number of processes in the pool for reading the cube files
+                [ default: nprocs ]
+
+    Returns:
+
+        dictionary: timings (in seconds) accumulated for each stage of the pipeline:
+
+            * "es": the electronic structure calculations (run in the background)
+            * "es_wait": the time the main process waited for the electronic structure calculations
+            * "hvib": extracting the energies from the log files
+            * "cubes_overlaps": reading the cube files and computing the overlaps
+            * "save": writing the results
+            * "total": the total time
+
+    """
+
+    timer0 = time.time()
+
+    # Critical variables
+    critical_params = []
+    # Default parameters
+    default_params = { "min_band":1, "max_band":1, "ks_orbital_homo_index":0, "nsteps_this_job":1, 'trajectory_xyz_filename':"md.xyz", "isUKS": 0, "es_software": "cp2k", "es_software_exe": "cp2k.popt", "es_software_input_template": "cp2k_input_template.inp", "project_name": "Libra_CP2K", "njob": 1, "nprocs": 2, "logfile_directory": "logfiles", "istep": 0, "do_cube_visualization": 0, "states_to_be_plotted": [], "waveplot_exe":"/util/academic/dftbplus/20.2.1-arpack/bin/waveplot", "nsteps_ahead": 1, "nprocs_pool": None }
+    # Check input
+    comn.check_input(params, default_params, critical_params)  
+
+    min_band = int( params["min_band"] )
+    max_band = int( params["max_band"] )
+    params.update({"min_band":min_band, "max_band":max_band})
+    params.update({"ks_orbital_indicies": list( range( min_band, max_band+1 ) ) })
+    params.update({"es_software": params["es_software"].lower() })
+
+    nsteps_this_job = int(params["nsteps_this_job"])
+    nsteps_ahead = max(1, int(params["nsteps_ahead"]))
+    project_name = params["project_name"]
+    trajectory_xyz_filename = params["trajectory_xyz_filename"]
+    nprocs  = int(params["nprocs"])
+    params.update({"nprocs":nprocs})
+    nprocs_pool = nprocs
+    if params["nprocs_pool"] is not None:
+        nprocs_pool = int(params["nprocs_pool"])
+    res_dir = params["res_dir"]
+    istep = int(params["istep"])
+    do_cube_visualization = int(params["do_cube_visualization"])
+
+    # Make a directory for this job folder for storing the logfiles, cubefiles, and pdosfiles
+    os.mkdir("logfiles")
+    os.mkdir("cubefiles")
+    os.mkdir("pdosfiles")
+    if not os.path.exists("../../all_logfiles"):
+        os.mkdir("../../all_logfiles")
+    if not os.path.exists("../../all_pdosfiles"):
+        os.mkdir("../../all_pdosfiles")
+
+    timings = { "es":0.0, "es_wait":0.0, "hvib":0.0, "cubes_overlaps":0.0, "save":0.0, "total":0.0 }
+
+    # Each stage gets its own copy of the parameters, since the functions below update them
+    def step_params( step ):
+        prms = dict(params)
+        prms.update({ "curr_step": step })
+        return prms
+
+    def es_stage( step ):
+        t = time.time()
+        run_es_calculation( step_params(step), step )
+        # Only the cubes of this step are moved, so the cubes of the other steps are not affected
+        os.system("mv %s-%d-*.cube cubefiles" % ( project_name, step ) )
+        return time.time() - t
+
+    # The pool is created before any background thread starts
+    pool = mp.Pool( processes = nprocs_pool )
+    executor = concurrent.futures.ThreadPoolExecutor( max_workers = 1 )
+
+    # ES jobs are queued on a single worker, so they run one at a time, in order
+    es_futures = {}
+    last_step = istep + nsteps_this_job - 1
+    for step in range( istep, min(istep + nsteps_ahead, last_step) + 1 ):
+        es_futures[step] = executor.submit( es_stage, step )
+
+    def wait_es( step ):
+        t = time.time()
+        timings["es"] += es_futures.pop(step).result()
+        timings["es_wait"] += time.time() - t
+        # Keep the ES queue filled
+        next_step = step + nsteps_ahead
+        if next_step <= last_step and next_step not in es_futures:
+            es_futures[next_step] = executor.submit( es_stage, next_step )
+
+    if do_cube_visualization == 1:
+        phase_factor_visual = np.ones( ( max_band - min_band + 1 ) * 2 )
+        params.update({"phase_factor_visual":phase_factor_visual})
+        states_to_be_plotted = [ int( state ) for state in list( params["states_to_be_plotted"].split(",") ) ]
+        params.update({"states_to_be_plotted":states_to_be_plotted})
+
+    ####### The initial step
+    wait_es( istep )
+    prms = step_params( istep )
+
+    t = time.time()
+    cubefiles_prev = pool.map( cube_file_methods.read_cube, CP2K_methods.cube_file_names_cp2k( prms ) )
+    timings["cubes_overlaps"] += time.time() - t
+
+    if do_cube_visualization == 1:
+        cube_file_methods.plot_cubes( prms )
+    os.system("rm cubefiles/%s-%d-*.cube" % ( project_name, istep ) )
+
+    t = time.time()
+    E_ks_prev, total_energy = form_Hvib_real( prms )
+    timings["hvib"] += time.time() - t
+
+    S_ks_curr = None
+    ####### All other steps 
+    for step in range( nsteps_this_job-1 ):
+        curr_step = istep + step + 1
+
+        wait_es( curr_step )
+        prms = step_params( curr_step )
+
+        t = time.time()
+        E_ks_curr, total_energy = form_Hvib_real( prms )
+        timings["hvib"] += time.time() - t
+
+        t = time.time()
+        cubefiles_curr, S_ks_prev, S_ks_curr, St_ks = compute_cube_ks_overlaps( cubefiles_prev, prms, pool )
+        cubefiles_prev = cubefiles_curr
+        timings["cubes_overlaps"] += time.time() - t
+
+        if do_cube_visualization == 1:
+            for row_index in range(len(St_ks)):
+                if St_ks[row_index][row_index]<0:
+                    phase_factor_visual[row_index] = phase_factor_visual[row_index] * (-1)
+            prms.update({"phase_factor_visual":phase_factor_visual})
+            cube_file_methods.plot_cubes( prms )
+
+        os.system("rm cubefiles/%s-%d-*.cube" % ( project_name, curr_step ) )
+
+        t = time.time()
+        np.savetxt("%s/S_ks_%d_re"  % (res_dir, istep+step), S_ks_prev, fmt='%.16e', delimiter=" ")
+        np.savetxt("%s/E_ks_%d_re"  % (res_dir, istep+step), E_ks_prev, fmt='%.16e', delimiter=" ")
+        np.savetxt("%s/St_ks_%d_re" % (res_dir, istep+step), St_ks, fmt='%.16e', delimiter=" ")
+        timings["save"] += time.time() - t
+
+        E_ks_prev = E_ks_curr
+
+    executor.shutdown()
+    pool.close()
+    pool.join()
+
+    # Print out the KS Overlap and Energy matricies for the last step in this job batch
+    if S_ks_curr is not None:
+        np.savetxt("%s/S_ks_%d_re" % (res_dir, istep+nsteps_this_job-1), S_ks_curr, fmt='%.16e', delimiter=" ")
+        np.savetxt("%s/E_ks_%d_re" % (res_dir, istep+nsteps_this_job-1), E_ks_prev, fmt='%.16e', delimiter=" ")
+    print("All steps were done successfully for this job!")
+
+    os.system("mv logfiles/* ../../all_logfiles/.")
+    os.system("mv pdosfiles/* ../../all_pdosfiles/.")
+    os.system("rm "+trajectory_xyz_filename)
+    os.system("rm *wfn")
+
+    timings["total"] = time.time() - timer0
+    print("Timings of the step2 stages (seconds):")
+    for key in ["es", "es_wait", "hvib", "cubes_overlaps", "save", "total"]:
+        print("    %-16s %12.3f" % (key, timings[key]))
+
+    return timings
@@ -1487,68 +1487,212 @@ def make_T_matricies( ci_coefficients, ci_basis_states, spin_components, sd_stat
 
     """
 
-    number_of_states = nstates
-    ci_coefficients_libra = []
+    SD2CI_sparse = make_T_matricies_sparse( ci_coefficients, ci_basis_states, spin_components, sd_states_unique_sorted, 
+                                            nstates, istep, fstep, None, verbose )
+
+    SD2CI = []
+    for step in range( fstep - istep ):
+
+        T = SD2CI_sparse[step].tocoo()
+        SD2CI.append( CMATRIX( T.shape[0], T.shape[1] ) )
+        for i, j, val in zip( T.row.tolist(), T.col.tolist(), T.data.tolist() ):
+            SD2CI[step].set( i, j, val * (1.0+0.0j) )
+
+        # Output the transformation matrix. This is how you can double check that it worked ( it does ... :) )
+        SD2CI[step].show_matrix( "%s/T_%s.txt" % (outdir, str(step)) )
+
+    return SD2CI
+
+
+
+
+def sd_registry_key( sd_state ):
+    """
+    This function converts the description of an SD (and its spin), e.g. [ ['28 29'], ['alp'] ], 
+    into a hashable key (nested lists become nested tuples), so the SDs can be looked up in dictionaries
+
+    Args:
+        sd_state (list of lists): the SP transition and its spin, as used in `sd_states_unique`
+
+    Returns:
+        tuple: the hashable key 
+
+    """
+
+    if isinstance( sd_state, (list, tuple) ):
+        return tuple( sd_registry_key(x) for x in sd_state )
+    return sd_state
+
+
+
+
+def make_SD_registry( sd_states ):
+    """
+    This function makes the dictionary that maps the SDs (and their spin) onto their indices in the list
+    `sd_states`. If the same SD appears several times, the first index is kept
+
+    Args:
+        sd_states (list of lists): the SP transitions and their spins, as in `sd_states_unique`
+
+    Returns:
+        dictionary: { sd_registry_key(sd_state): index }
+
+    """
+
+    registry = {}
+    for index, sd_state in enumerate( sd_states ):
+        registry.setdefault( sd_registry_key( sd_state ), index )
+
+    return registry
+
+
+
+
+def make_T_matricies_sparse( ci_coefficients, ci_basis_states, spin_components, sd_states_unique_sorted, nstates, istep, fstep, outdir=None, verbose=0 ):
+    """
+    This function is the same as `make_T_matricies`, but it returns the SD-to-CI transformation matrices as 
+    the sparse scipy matrices. The SDs are looked up in a dictionary (see `make_SD_registry`), which is only rebuilt 
+    when the list of SDs changes from the previous timestep, so the cost of each step is proportional to the number 
+    of CI coefficients, rather than to their product with the number of SDs. As in `make_T_matricies`, the rows of 
+    each step follow the order of the SDs in `sd_states_unique_sorted` for that step
+
+    Args:
+        ci_coefficients (list of lists of lists): coefficients for the many-body states for each step
+        ci_basis_states (list of lists): All SD basis states that comprise the many-body excitations for each step
+        spin_components (list of lists): the spin components of the excitation (alpha or beta excitaiton?) for all states and all steps  
+        sd_states_unique_sorted (list of lists): 1 of each of the SP transitions (and its spin) that made up the considered CI states,
+            for each step
+        nstates (int): number of excited MB states
+        istep (int): step at which to start counting
+        fstep (int): stap at which to stop counting
+        outdir (string or None): output directory for the T matricies (saved as `T_<step>.npz`); None - do not save [ default: None ]
+        verbose (int): want to see some messages? [ default: 0 ]
+
+    Returns:
+        SD2CI (list of scipy.sparse.csc_matrix( (nSDs, nCIs) ) ): the transformation matrices at each timestep, the rows are SDs
+            and the cols are MB states, just like in `make_T_matricies`
+
+    """
+
+    import scipy.sparse as sp
+
     nSDs = len( sd_states_unique_sorted[0] ) + 1
     # Add one to the number of CI states because the ground state is not included yet
-    nCIs  = number_of_states + 1
-    SD2CI = []
+    nCIs  = nstates + 1
+
+    # The registry of SDs of the current step: the SDs may be sorted differently or be different at each step
+    registry = make_SD_registry( sd_states_unique_sorted[0] )
+    prev_sorted = sd_states_unique_sorted[0]
 
+    SD2CI = []
     for step in range( fstep - istep ):
 
-        # Make the list of ci_coefficients for each step in the way Libra accepts
-        ci_coefficients_libra.append( [] )
+        if sd_states_unique_sorted[step] is not prev_sorted and sd_states_unique_sorted[step] != prev_sorted:
+            registry = make_SD_registry( sd_states_unique_sorted[step] )
+            prev_sorted = sd_states_unique_sorted[step]
+
         # Start with the ground state. This is not explicitly given by electronic strcture calculations
-        ci_coefficients_libra[step].insert( 0, [0.0] * nSDs )
-        ci_coefficients_libra[step][0][0] = 1.0
+        rows, cols, vals = [0], [0], [1.0]
 
-        # For each ci state for this step
         for i in range( len( ci_coefficients[step] ) ):
-            count = 0
-            # The ci wavefunction is a linear combination of SD states. Make a list of zeros the size of the number of unique
-            # SD states + 1 for the ground state
-            ci_coefficients_libra[step].append( [0.0] * nSDs )
-            # Exclude ground state here in the index, that info is not explicitly contained 
-            # in the ci_coefficients_dynamics list from electronic structure calculations
-            tmp_ci_basis_state_and_spin = []
-            # For each ci_coefficient in this ci state for this step, get the ci coefficients and spin (alp or bet)
-            for k in range(len(ci_coefficients[step][i])):
-                tmp_ci_basis_state_and_spin.append( [ci_basis_states[step][i][k] , spin_components[step][i][k]] )
-            # Now, loop over the SDs (excluding the ground state) to assign the coefficients
-            for j in range( nSDs-1 ):
-                # Check to see if one of the SDs from the list of unique SDs comprises this ci state
-                if sd_states_unique_sorted[step][j] in tmp_ci_basis_state_and_spin:
-                    # ok, it has found a match, now what is the index of the SD in the list of unique SDs?
-                    item_index = tmp_ci_basis_state_and_spin.index(sd_states_unique_sorted[step][j])
-                    ci_coefficients_libra[step][i+1][j+1] = float(ci_coefficients[step][i][item_index])
-
+            # Only the first appearance of each SD in the CI state counts
+            found = set()
+            for k in range( len( ci_coefficients[step][i] ) ):
+                index = registry.get( sd_registry_key( [ ci_basis_states[step][i][k], spin_components[step][i][k] ] ) )
+                # Only the first nSDs - 1 SDs of each step fit into the matrix, as in `make_T_matricies`
+                if index is not None and index < nSDs - 1 and index not in found:
+                    found.add( index )
+                    rows.append( index + 1 )
+                    cols.append( i + 1 )
+                    vals.append( float( ci_coefficients[step][i][k] ) )
+
+        T = sp.csc_matrix( ( vals, (rows, cols) ), shape=( nSDs, nCIs ) )
 
         # Sanity check. Make sure sum of squared elements of columns == 1:
+        check_norm = np.asarray( T.multiply(T).sum(axis=0) ).reshape( nCIs )
         for i in range( nCIs ):
-            check_norm = 0
-            for j in range( nSDs ):
-                check_norm += ci_coefficients_libra[step][i][j]**2
             if verbose == 1:
-                print("Step", step, "state", i, "check_norm", check_norm)
-            if check_norm < 0.99 or check_norm > 1.01:
+                print("Step", step, "state", i, "check_norm", check_norm[i])
+            if check_norm[i] < 0.99 or check_norm[i] > 1.01:
                 print("Warning: Step, ", step)
                 print("Column ", i, "in SD2Ci (T) matrix has norm either < 0.99 or > 1.01")
                 print("Exiting now")
                 sys.exit(0)
 
-        SD2CI.append( CMATRIX( nSDs, nCIs ) )
-        for i in range( nSDs ):
-            for j in range( nCIs ):
-                SD2CI[step].set( i, j, ci_coefficients_libra[step][j][i] * (1.0+0.0j) )
+        SD2CI.append( T )
 
-        # Output the transformation matrix. This is how you can double check that it worked ( it does ... :) )
-        SD2CI[step].show_matrix( "%s/T_%s.txt" % (outdir, str(step)) )
+        if outdir is not None:
+            sp.save_npz( "%s/T_%s.npz" % (outdir, str(step)), T )
 
     return SD2CI
 
 
 
 
+def sort_unique_SD_basis_np( E_ks, sd_states_unique, sd_states_reindexed, istep, fstep, sorting_type, verbose=0 ):
+    """
+    This function is the same as `sort_unique_SD_basis`, but the SD energies for all the steps are computed at once, 
+    as a product of the matrix of the KS orbital energies (nsteps x nbasis) and the SD occupation matrix (nbasis x nSDs),
+    and they are returned as arrays rather than as lists of CMATRIX objects
+
+    Args:
+        E_ks (list of CMATRIX): KS orbital energies at each timestep. Spin block style 
+        sd_states_unique (list of lists): all SP transitions and which spin it was
+        sd_states_reindexed (list of lists): sd_states_unique but in internal  Libra notation 
+        istep (int): step from which to start counting
+        fstep (int): step at which to stop counting
+        sorting_type ( (string) ): "energy"   - sort by energy
+                                   "identity" - sort by identity
+        verbose (int): whether to print the sorted SDs and their energies [ default: 0 ]
+
+    Returns:       
+        E_sd (numpy array( nsteps, nSDs ) ): sorted SD energies at each timestep
+        sd_states_unique_sorted (list of lists): All SP transitions and which spin it is, but now sorted either by identity (no sorting) or energy
+        sd_states_reindexed_sorted (list of lists): The sd_states_unique_sorted, but in Libra's notation
+        reindex_nsteps (numpy array( nsteps, nSDs ) ): The energy ordering of the SD for each step in terms of the index of the SD from the initial step
+
+    """
+
+    nsteps = fstep - istep
+    nstates_sd = len(sd_states_reindexed)
+    nbasis = E_ks[0].num_of_rows
+
+    # The occupation matrix: occ[i, sd] = how many times the spin-orbital i is occupied in the SD sd
+    occ = np.zeros( (nbasis, nstates_sd) )
+    for sd, SD in enumerate( sd_states_reindexed ):
+        for i in mapping.sd2indx( SD, nbasis ):
+            occ[i, sd] += 1.0
+
+    # KS energies at all steps
+    e_ks = np.array( [ [ E_ks[step].get(i,i).real for i in range(nbasis) ] for step in range(nsteps) ] )
+    e = np.dot( e_ks, occ )
+
+    if sorting_type == "identity":
+        reindex_nsteps = np.tile( np.arange(nstates_sd), (nsteps, 1) )
+    elif sorting_type == "energy":
+        reindex_nsteps = np.argsort( e, axis=1 )
+
+    E_sd = np.take_along_axis( e, reindex_nsteps, axis=1 )
+
+    sd_states_unique_sorted, sd_states_reindexed_sorted = [], []
+    for step in range( nsteps ):
+        reindex = reindex_nsteps[step].tolist()
+        sd_states_reindexed_sorted.append( [ sd_states_reindexed[ i ] for i in reindex ] )
+
+        if sorting_type == "identity":
+            sd_states_unique_sorted.append( list( sd_states_unique[ : nstates_sd-1 ] ) )
+        elif sorting_type == "energy":
+            sd_states_unique_sorted.append( [ sd_states_unique[ i-1 ] for i in reindex[1:] ] )
+
+        if verbose > 0:
+            for i in range( nstates_sd ):
+                print( sd_states_reindexed_sorted[step][i], ( E_sd[step, i] - E_sd[step, 0] ) * units.au2ev )
+
+    return E_sd, sd_states_unique_sorted, sd_states_reindexed_sorted, reindex_nsteps
+
+
+
+
 def compute_ci_energies_midpoint( ci_energies, num_excited_states, istep, fstep ):
     """
     This function compute the excitation energies energies at the midpoint from a list of excitation energies at each step. 
@@ -58,6 +58,7 @@ from . import decoherence_times as dectim
 import libra_py.tsh as tsh
 import libra_py.tsh_stat as tsh_stat
 import libra_py.units as units
+import libra_py.profiling as profiling
 
 
 def get_Hvib(params):
@@ -544,6 +545,13 @@ def run(H_vib, params):
             * **params["outfile"]** ( string ): the name of the file where to print populations
                 and energies of states [default: "_out.txt"]    
 
+            * **params["profiling"]** ( int ): whether to time the phases of the calculations: "statistics", 
+                "output", "decoherence_params", "electronic", "decoherence", and "hopping", see 
+                :funct:`profiling.make_timer` [default: 0]
+
+            * **params["profiling_file"]** ( string ): the name of the HDF5 file where to write the per-step
+                timings, if ```params["profiling"] == 2``` [default: None - don't write the timings]
+
     Returns: 
         MATRIX(nsteps, 3*nstates+5): the trajectory (and initial-condition)-averaged observables for every timesteps,
             the assumed format is: 
@@ -560,12 +568,16 @@ def run(H_vib, params):
     default_params = { "T":300.0, "ntraj":1,
                        "tdse_Ham":0, "sh_method":1, "decoherence_constants": 0, "decoherence_method":0, "dt":41.0, "Boltz_opt":3,
                        "Hvib_type":1,
-                       "istate":0, "init_times":[0], "outfile":"_out.txt" }
+                       "istate":0, "init_times":[0], "outfile":"_out.txt",
+                       "profiling":0, "profiling_file":None }
     comn.check_input(params, default_params, critical_params)
 
 
     rnd = Random()
 
+    # Profiling: when it is disabled, the timer does nothing
+    timer = profiling.make_timer(params)
+
     ndata = len(H_vib)
     nsteps = params["nsteps"]
     nstates = H_vib[0][0].num_of_cols  # number of states
@@ -588,7 +600,8 @@ def run(H_vib, params):
     tau, dephasing_rates = None, None
 
     if params["decoherence_constants"] == 0 or params["decoherence_constants"]==20:
-        tau, dephasing_rates = dectim.decoherence_times_ave(H_vib, params["init_times"], nsteps, 1) 
+        with timer.phase("decoherence_params"):
+            tau, dephasing_rates = dectim.decoherence_times_ave(H_vib, params["init_times"], nsteps, 1) 
 
     elif params["decoherence_constants"] == 1 or params["decoherence_constants"]==21:
         if params["decoherence_times"].num_of_cols != nstates:
@@ -625,14 +638,16 @@ def run(H_vib, params):
 
         #============== Analysis of the Dynamics  =================
         # Compute the averages
-        res_i = traj_statistics(i, Coeff, istate, H_vib, params["init_times"])
+        with timer.phase("statistics"):
+            res_i = traj_statistics(i, Coeff, istate, H_vib, params["init_times"])
 
-        # Print out into a file
-        printout(i*dt, res_i, params["outfile"])
+        with timer.phase("output"):
+            # Print out into a file
+            printout(i*dt, res_i, params["outfile"])
 
-        # Update the overal results matrix
-        res.set(i,0, i*dt)
-        push_submatrix(res, res_i, Py2Cpp_int([i]), Py2Cpp_int( list(range(1,3*nstates+5)) ) )
+            # Update the overal results matrix
+            res.set(i,0, i*dt)
+            push_submatrix(res, res_i, Py2Cpp_int([i]), Py2Cpp_int( list(range(1,3*nstates+5)) ) )
 
 
         #=============== Propagation ==============================
@@ -648,14 +663,15 @@ def run(H_vib, params):
 
                     #============== Propagation: TD-SE and surface hopping ==========
                     # Coherent evolution amplitudes
-                    Heff = None 
+                    with timer.phase("electronic"):
+                        Heff = None 
 
-                    if tdse_Ham==0:
-                        Heff = H_vib[idata][it+i]
-                    elif tdse_Ham==1:
-                        Heff = tsh.Boltz_corr_Ham(H_vib[idata][it+i], Coeff[Tr], params["T"], params["Hvib_type"])
+                        if tdse_Ham==0:
+                            Heff = H_vib[idata][it+i]
+                        elif tdse_Ham==1:
+                            Heff = tsh.Boltz_corr_Ham(H_vib[idata][it+i], Coeff[Tr], params["T"], params["Hvib_type"])
 
-                    propagate_electronic(dt, Coeff[Tr], Heff)   # propagate the electronic DOFs
+                        propagate_electronic(dt, Coeff[Tr], Heff)   # propagate the electronic DOFs
 
         
                     # Surface hopping 
@@ -671,16 +687,24 @@ def run(H_vib, params):
                             do_collapse = 1
                         elif params["decoherence_method"]==2:  # MSDM
                             do_collapse = 0                            
-                            Coeff[Tr] = sdm(Coeff[Tr], dt, istate[Tr], dephasing_rates)
+                            with timer.phase("decoherence"):
+                                Coeff[Tr] = sdm(Coeff[Tr], dt, istate[Tr], dephasing_rates)
  
-                        istate[Tr], Coeff[Tr] = tsh.hopping(Coeff[Tr], Heff, istate[Tr], params["sh_method"], do_collapse, ksi, ksi2, dt, T, bolt_opt)
+                        with timer.phase("hopping"):
+                            istate[Tr], Coeff[Tr] = tsh.hopping(Coeff[Tr], Heff, istate[Tr], params["sh_method"], do_collapse, ksi, ksi2, dt, T, bolt_opt)
                     
                     elif params["decoherence_method"] in [3]:  # DISH
                     
-                        tau_m[Tr] = coherence_intervals(Coeff[Tr], dephasing_rates)
-                        istate[Tr] = tsh.dish_py(Coeff[Tr], istate[Tr], t_m[Tr], tau_m[Tr], Heff, bolt_opt, T, ksi, ksi2)
+                        with timer.phase("decoherence"):
+                            tau_m[Tr] = coherence_intervals(Coeff[Tr], dephasing_rates)
+
+                        with timer.phase("hopping"):
+                            istate[Tr] = tsh.dish_py(Coeff[Tr], istate[Tr], t_m[Tr], tau_m[Tr], Heff, bolt_opt, T, ksi, ksi2)
                         t_m[Tr] += dt
 
+        timer.end_step()
+
+    timer.summarize(params["profiling_file"], "NBRA TSH timings")
         
     return res
 
@@ -620,6 +620,41 @@ public:
 
   }
 
+  ///< Bulk copy of the matrix elements into a Python bytearray object
+  boost::python::object to_bytearray(){
+  /** Returns the copy of the internal storage (row-major, n_rows x n_cols elements of type T1)
+  as the Python bytearray object, so it can be wrapped without the element-wise conversion,
+  e.g. by numpy.frombuffer
+  */
+
+    PyObject* res = PyByteArray_FromStringAndSize((const char*)M, sizeof(T1)*n_elts);
+    if(res==NULL){ boost::python::throw_error_already_set(); }
+
+    return boost::python::object(boost::python::handle<>(res));
+  }
+
+  ///< Bulk copy of the matrix elements from a Python object supporting the buffer protocol
+  void from_buffer(boost::python::object obj){
+  /** Copies the data from a C-contiguous buffer (e.g. a numpy array) into the internal storage.
+  The buffer should contain exactly n_rows x n_cols elements of type T1 in the row-major order,
+  otherwise the Python exception is raised
+  */
+
+    Py_buffer view;
+
+    if(PyObject_GetBuffer(obj.ptr(), &view, PyBUF_C_CONTIGUOUS)!=0){  boost::python::throw_error_already_set(); }
+
+    if(view.len != (Py_ssize_t)(sizeof(T1)*n_elts)){
+      PyBuffer_Release(&view);
+      PyErr_Format(PyExc_ValueError, "from_buffer: the buffer has %zd bytes, but the %d x %d matrix needs %zd bytes",
+                   view.len, n_rows, n_cols, (Py_ssize_t)(sizeof(T1)*n_elts));
+      boost::python::throw_error_already_set();
+    }
+
+    if(view.len > 0){  memcpy(M, view.buf, view.len);  }
+    PyBuffer_Release(&view);
+  }
+
   friend ostream& operator<<(ostream &strm, base_matrix<T1> ob){
     strm.setf(ios::showpoint);
     for(int i=0;i<ob.n_rows;i++){
@@ -144,6 +144,8 @@ void export_base_matrix(){
       /// Generic IO operations
       .def("bin_dump", &base_matrix<T1>::bin_dump )
       .def("bin_load", &base_matrix<T1>::bin_load )
+      .def("to_bytearray", &base_matrix<T1>::to_bytearray )
+      .def("from_buffer", &base_matrix<T1>::from_buffer )
       .def("show_matrix", expt_show_matrix_v1)
       .def("show_matrix", expt_show_matrix_v2)
       .def("show_matrix_address", &base_matrix<T1>::show_matrix_address)
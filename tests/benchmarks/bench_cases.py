@@ -0,0 +1,403 @@
+#*********************************************************************************
+#* Copyright (C) 2020 Alexey V. Akimov
+#*
+#* This file is distributed under the terms of the GNU General Public License
+#* as published by the Free Software Foundation, either version 3 of
+#* the License, or (at your option) any later version.
+#* See the file LICENSE in the root directory of this distribution
+#* or <http://www.gnu.org/licenses/>.
+#*
+#*********************************************************************************/
+
+"""
+  The benchmark cases for the libra_py dynamics and NBRA hot paths
+
+  Each case is a function decorated with `@case(group, param, values)`. The runner calls it
+  with one of the `values` of its parameter (e.g. the number of trajectories), in a scratch
+  directory. The function does all the setup and returns a function without arguments - only
+  that returned function is timed.
+
+  All the inputs are synthetic: the Hvib time series, overlaps, cube data and signals are
+  generated with seeded NumPy generators, so no external data are needed. Note that the
+  surface hopping uses the Libra's Random object, which is seeded from the clock, so the
+  TSH timings may fluctuate a bit from run to run - compare the medians
+"""
+
+import os
+import sys
+import math
+import numpy as np
+
+if sys.platform=="cygwin":
+    from cyglibra_core import *
+elif sys.platform=="linux" or sys.platform=="linux2":
+    from liblibra_core import *
+
+import util.libutil as comn
+
+from libra_py import units
+from libra_py import data_conv
+from libra_py import data_savers
+from libra_py import acf
+from libra_py import ft
+from libra_py import cube_file_methods
+import libra_py.models.Tully as Tully
+import libra_py.models.Holstein as Holstein
+import libra_py.models.LVC as LVC
+import libra_py.dynamics.tsh.compute as tsh_dynamics
+import libra_py.dynamics.tsh.save as tsh_save
+import libra_py.dynamics.heom.compute as heom_dynamics
+import libra_py.dynamics.exact.compute as exact_dynamics
+from libra_py.workflows.nbra import step3
+from libra_py.workflows.nbra import step4
+from libra_py.workflows.nbra import lz
+
+
+
+CASES = []
+
+def case(group, param, values):
+    """
+    Registers the decorated function as a benchmark case
+
+    Args:
+        group ( string ): the group of the benchmarks, e.g. "tsh", "nbra"
+        param ( string ): the name of the size parameter of the case
+        values ( list ): the values of the size parameter to run the case with
+
+    """
+
+    def _register(funct):
+        CASES.append( {"name":funct.__name__, "group":group, "param":param, "values":values, "funct":funct} )
+        return funct
+
+    return _register
+
+
+def case_key(c, value):
+    """
+    The unique name of the case `c` run with the parameter `value`, e.g. "tsh_tully1[ntraj=10]"
+    """
+    return F"{c['name']}[{c['param']}={value}]"
+
+
+def case_instances(groups=None, pattern=None):
+    """
+    Returns the list of (key, funct, value) for all the cases in the selected `groups` (all, if None)
+    whose keys contain the `pattern` (all, if None)
+    """
+
+    res = []
+    for c in CASES:
+        if groups != None and c["group"] not in groups:
+            continue
+        for value in c["values"]:
+            key = case_key(c, value)
+            if pattern != None and pattern not in key:
+                continue
+            res.append( (key, c["funct"], value) )
+    return res
+
+
+
+#=========================== Synthetic inputs ================================
+
+def synthetic_hvib(nstates, nsteps, ndata=1, seed=0):
+    """
+    Generates the Hvib time series: the energies are the state-specific levels (0.05 Ha apart)
+    plus the Ornstein-Uhlenbeck-like fluctuations, the NACs are small random numbers
+
+    Returns:
+        list of lists of CMATRIX(nstates, nstates): Hvib[idata][istep]
+    """
+
+    rng = np.random.default_rng(seed)
+    res = []
+
+    for idata in range(ndata):
+        E = np.zeros(nstates)
+        hvib = []
+        for istep in range(nsteps):
+            E = 0.9 * E + 0.002 * rng.standard_normal(nstates)
+            nac = 0.001 * rng.standard_normal((nstates, nstates))
+            nac = nac - nac.T
+
+            h = np.diag( 0.05 * np.arange(nstates) + E ) - 1.0j * nac
+            hvib.append( data_conv.nparray2CMATRIX(h) )
+        res.append(hvib)
+
+    return res
+
+
+def synthetic_St(norbitals, nsteps, seed=0):
+    """
+    Generates the time-overlaps of the spin-orbitals, CMATRIX(2N, 2N), which are close to
+    identity with random signs of the diagonal elements (to trigger the phase corrections)
+    """
+
+    rng = np.random.default_rng(seed)
+    N = norbitals
+    res = []
+
+    for istep in range(nsteps):
+        a = np.eye(N) + 0.05 * rng.standard_normal((N, N))
+        q, r = np.linalg.qr(a)
+        q = q * np.sign(rng.standard_normal(N))
+
+        st = np.zeros((2*N, 2*N), dtype=complex)
+        st[:N, :N] = q
+        st[N:, N:] = q
+        res.append( data_conv.nparray2CMATRIX(st) )
+
+    return res
+
+
+
+#=========================== TSH ================================
+
+def compute_model(q, params, full_id):
+    """
+    The model Hamiltonians used in the TSH benchmarks
+    """
+
+    model = params["model"]
+    Id = Cpp2Py(full_id)
+    indx = Id[-1]
+    res = None
+
+    if model == "tully1":
+        res = Tully.Tully1(q.col(indx), params)
+    elif model == "holstein":
+        res = Holstein.Holstein_uncoupled(q.col(indx), params)
+    elif model == "lvc":
+        res = LVC.LVC(q.col(indx), params)
+
+    res.rep = params["rep"]
+
+    return res
+
+
+def tsh_run(model_params, nstates, Q, P, M, ntraj, extra_params={}):
+    """
+    Prepares the TSH calculations on the model `model_params["model"]` and returns the function running them
+    """
+
+    dyn_params = { "nsteps":100, "dt":10.0, "rep_tdse":1, "ntraj":ntraj,
+                   "hdf5_output_level":-1, "mem_output_level":1, "txt_output_level":-1,
+                   "properties_to_save":[ "timestep", "time", "Ekin_ave", "Epot_ave", "Etot_ave", "SH_pop" ],
+                   "prefix":"out", "progress_frequency":1.0 }
+    dyn_params.update(extra_params)
+
+    model_params = dict(model_params)
+    model_params.update({"model0":model_params["model"], "rep":0, "nstates":nstates})
+
+    elec_params = {"init_type":1, "nstates":nstates, "istate":nstates-1, "rep":1, "ntraj":ntraj }
+    nucl_params = {"init_type":3, "force_constant":[0.001]*len(Q), "ntraj":ntraj }
+
+    def _run():
+        rnd = Random()
+        q, p, iM = tsh_dynamics.init_nuclear_dyn_var(Q, P, M, nucl_params, rnd)
+        tsh_dynamics.generic_recipe(q, p, iM, dict(dyn_params), compute_model, dict(model_params),
+                                    dict(elec_params), rnd)
+
+    return _run
+
+
+@case("tsh", "ntraj", [1, 10, 50])
+def tsh_tully1(ntraj):
+    return tsh_run({"model":"tully1"}, 2, [-10.0], [20.0], [2000.0], ntraj)
+
+
+@case("tsh", "ntraj", [1, 10, 50])
+def tsh_holstein(ntraj):
+    nsites = 4
+    prms = Holstein.get_Holstein_set1()
+    prms.update({"model":"holstein"})
+    return tsh_run(prms, nsites, [0.0]*nsites, [0.0]*nsites, [prms["mass"]]*nsites, ntraj)
+
+
+@case("tsh", "ntraj", [1, 10, 50])
+def tsh_lvc(ntraj):
+    prms = LVC.get_LVC_set1()
+    prms.update({"model":"lvc"})
+    ndof = len(prms["omega"])
+    prms["mass"] = [2000.0]*ndof
+    return tsh_run(prms, 2, [0.0]*ndof, [0.0]*ndof, prms["mass"], ntraj)
+
+
+
+#=========================== Savers ================================
+
+@case("savers", "level", [1, 2, 3, 4])
+def savers_tsh_mem(level):
+    return tsh_run({"model":"tully1"}, 2, [-10.0], [20.0], [2000.0], 10,
+                   { "mem_output_level":level, "hdf5_output_level":-1,
+                     "properties_to_save":list(tsh_save.tsh_property_levels.keys()) })
+
+
+@case("savers", "level", [1, 2, 3, 4])
+def savers_tsh_hdf5(level):
+    return tsh_run({"model":"tully1"}, 2, [-10.0], [20.0], [2000.0], 10,
+                   { "mem_output_level":-1, "hdf5_output_level":level,
+                     "properties_to_save":list(tsh_save.tsh_property_levels.keys()) })
+
+
+
+#=========================== NBRA ================================
+
+@case("nbra", "norbitals", [4, 8, 16])
+def nbra_step3_phase_correction(norbitals):
+    St = synthetic_St(norbitals, 200)
+
+    def _run():
+        step3.apply_phase_correction( [ CMATRIX(x) for x in St ] )
+
+    return _run
+
+
+@case("nbra", "nstates", [2, 5, 10, 20])
+def nbra_step4(nstates):
+    Hvib = synthetic_hvib(nstates, 301)
+    params = { "nsteps":300, "T":300.0, "ntraj":10, "sh_method":1, "decoherence_method":0,
+               "dt":41.0, "Boltz_opt":3, "istate":nstates-1, "init_times":[0], "outfile":"_out.txt" }
+
+    def _run():
+        step4.run(Hvib, dict(params))
+
+    return _run
+
+
+@case("nbra", "nstates", [2, 5, 10, 20])
+def nbra_dish(nstates):
+    Hvib = synthetic_hvib(nstates, 301)
+    params = { "nsteps":300, "T":300.0, "ntraj":10, "sh_method":1, "decoherence_method":3,
+               "dt":41.0, "Boltz_opt":3, "istate":nstates-1, "init_times":[0], "outfile":"_out.txt" }
+
+    def _run():
+        step4.run(Hvib, dict(params))
+
+    return _run
+
+
+@case("nbra", "nstates", [2, 5, 10, 20])
+def nbra_lz(nstates):
+    Hvib = synthetic_hvib(nstates, 301)
+    params = { "nsteps":300, "dt":41.0, "ntraj":10, "istate":nstates-1,
+               "T":300.0, "Boltz_opt":1, "Boltz_opt_BL":1, "gap_min_exception":0, "target_space":1,
+               "do_output":False }
+
+    def _run():
+        lz.run(Hvib, dict(params))
+
+    return _run
+
+
+
+#=========================== HEOM ================================
+
+@case("heom", "LL", [2, 4, 6])
+def heom_2state(LL):
+    Ham = CMATRIX(2, 2)
+    Ham.set(0, 0, 0.0 + 0.0j);                    Ham.set(0, 1, 100.0 * units.inv_cm2Ha + 0.0j)
+    Ham.set(1, 0, 100.0 * units.inv_cm2Ha + 0.0j); Ham.set(1, 1, 0.0 + 0.0j)
+
+    rho = CMATRIX(2, 2)
+    rho.set(0, 0, 1.0 + 0.0j)
+
+    params = { "KK":0, "LL":LL, "dt":0.1*units.fs2au, "nsteps":200, "verbosity":-1, "progress_frequency":1.0,
+               "prefix":"out", "mem_output_level":3, "hdf5_output_level":0 }
+
+    def _run():
+        heom_dynamics.run_dynamics(dict(params), Ham, rho)
+
+    return _run
+
+
+
+#=========================== Exact dynamics ================================
+
+def tully1_potential(q, params, full_id):
+    return Tully.Tully1(q, params)
+
+
+@case("exact", "npts", [256, 512, 1024])
+def exact_tully1(npts):
+    params = { "nsteps":100, "dt":10.0, "progress_frequency":1.0,
+               "rmin":[-16.0], "rmax":[16.0], "dx":[32.0/npts], "nstates":2,
+               "x0":[-5.0], "p0":[20.0], "istate":[1,0], "masses":[2000.0], "k":[0.001],
+               "integrator":"SOFT", "prefix":"out", "hdf5_output_level":0, "mem_output_level":3,
+               "txt_output_level":0, "use_compression":0, "compression_level":[0,0,0],
+               "properties_to_save":[ "timestep", "time", "Ekin_dia", "Epot_dia", "Etot_dia", "norm_dia", "pop_adi" ]
+             }
+    model_params = {"E_n":[0.0, 0.0]}
+
+    def _run():
+        exact_dynamics.run_relaxation(dict(params), tully1_potential, dict(model_params))
+
+    return _run
+
+
+@case("exact", "npts", [256, 512, 1024])
+def exact_tully1_grid(npts):
+    params = { "nsteps":100, "dt":10.0, "progress_frequency":1.0,
+               "rmin":[-16.0], "rmax":[16.0], "dx":[32.0/npts], "nstates":2,
+               "x0":[-5.0], "p0":[20.0], "istate":[1,0], "masses":[2000.0], "k":[0.001],
+               "integrator":"SOFT", "prefix":"out", "hdf5_output_level":0, "mem_output_level":3,
+               "txt_output_level":0, "use_compression":0, "compression_level":[0,0,0],
+               "properties_to_save":[ "timestep", "time", "Ekin_dia", "Epot_dia", "Etot_dia", "norm_dia", "pop_adi" ],
+               "vectorized_potential":1
+             }
+    model_params = {"E_n":[0.0, 0.0]}
+
+    def _run():
+        exact_dynamics.run_relaxation(dict(params), Tully.Tully1_grid, dict(model_params))
+
+    return _run
+
+
+
+#=========================== Kernels ================================
+
+@case("kernels", "npts", [40, 80, 120])
+def kernel_cube_overlaps(npts):
+    rng = np.random.default_rng(0)
+    norbs = 10
+    cubes = [ rng.standard_normal(npts**3) for i in range(norbs) ]
+    dv = 0.1**3
+
+    def _run():
+        for i in range(norbs):
+            for j in range(norbs):
+                cube_file_methods.integrate_cube(cubes[i], cubes[j], dv)
+
+    return _run
+
+
+@case("kernels", "nsteps", [1000, 5000])
+def kernel_acf(nsteps):
+    rng = np.random.default_rng(0)
+    ndof = 3
+    data = []
+    for i in range(nsteps):
+        x = MATRIX(ndof, 1)
+        for j in range(ndof):
+            x.set(j, 0, rng.standard_normal())
+        data.append(x)
+
+    def _run():
+        acf.acf_mat(data, 1.0)
+
+    return _run
+
+
+@case("kernels", "nsteps", [1000, 5000])
+def kernel_ft(nsteps):
+    rng = np.random.default_rng(0)
+    dt = 1.0 * units.fs2au
+    X = list( np.cos(0.01 * np.arange(nsteps)) + 0.1 * rng.standard_normal(nsteps) )
+
+    def _run():
+        ft.ft(X, 3000.0 * units.inv_cm2Ha, 1.0 * units.inv_cm2Ha, dt)
+
+    return _run
+
@@ -0,0 +1,211 @@
+#*********************************************************************************
+#* Copyright (C) 2020 Alexey V. Akimov
+#*
+#* This file is distributed under the terms of the GNU General Public License
+#* as published by the Free Software Foundation, either version 3 of
+#* the License, or (at your option) any later version.
+#* See the file LICENSE in the root directory of this distribution
+#* or <http://www.gnu.org/licenses/>.
+#*
+#*********************************************************************************/
+
+"""
+  Runs the benchmark cases defined in `bench_cases.py`, stores the timings in a JSON file and
+  compares them to the stored baseline
+
+  Usage:
+
+      python run_benchmarks.py                               # run all cases, compare to baselines/default.json
+      python run_benchmarks.py --group tsh nbra --repeat 5   # run only some groups
+      python run_benchmarks.py --filter nstates=10           # run only the cases whose names contain the string
+      python run_benchmarks.py --save-baseline default       # store the results as baselines/default.json
+      python run_benchmarks.py --threshold 0.2 --fail-on-regression
+
+  The baselines are machine-specific: generate them with `--save-baseline` on the reference machine
+  (e.g. on the commit before the optimization) and compare on the same machine
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import shutil
+import tempfile
+import platform
+import argparse
+import contextlib
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bench_cases
+
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+
+def time_case(funct, value, repeat, verbose=False):
+    """
+    Prepares the case `funct` with the parameter `value` in a scratch directory and times
+    the returned function `repeat` times
+
+    Returns:
+        list of doubles: the wall times of all the repeats [ s ]
+    """
+
+    cwd = os.getcwd()
+    scratch = tempfile.mkdtemp(prefix="libra_bench_")
+    times = []
+
+    try:
+        os.chdir(scratch)
+        out = sys.stdout if verbose else io.StringIO()
+
+        with contextlib.redirect_stdout(out):
+            run = funct(value)
+            for r in range(repeat):
+                t0 = time.perf_counter()
+                run()
+                times.append( time.perf_counter() - t0 )
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return times
+
+
+def run_cases(groups=None, pattern=None, repeat=3, verbose=False):
+    """
+    Runs the selected benchmark cases
+
+    Returns:
+        dictionary: case name -> {"min", "median", "mean", "std", "repeat"} [ times in s ]
+    """
+
+    results = {}
+
+    for key, funct, value in bench_cases.case_instances(groups, pattern):
+        times = time_case(funct, value, repeat, verbose)
+        results[key] = { "min":min(times), "median":float(np.median(times)), "mean":float(np.mean(times)),
+                         "std":float(np.std(times)), "repeat":repeat }
+        print(F"{key:<48} median = {results[key]['median']:10.4f} s   min = {results[key]['min']:10.4f} s")
+        sys.stdout.flush()
+
+    return results
+
+
+def machine_info():
+    """
+    The description of the machine and software, stored along with the timings
+    """
+
+    return { "date":time.strftime("%Y-%m-%d %H:%M:%S"), "python":platform.python_version(),
+             "numpy":np.__version__, "platform":platform.platform(), "processor":platform.processor(),
+             "ncpus":os.cpu_count() }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares the median times to the baseline ones
+
+    Args:
+        results ( dictionary ): the current timings, as returned by `run_cases`
+        baseline ( dictionary ): the baseline timings, same format
+        threshold ( double ): the relative slowdown above which a case is reported as a regression
+
+    Returns:
+        (list, list): the names of the regressed and of the improved cases
+    """
+
+    regressed, improved = [], []
+
+    print(F"{'case':<48} {'baseline, s':>12} {'current, s':>12} {'ratio':>8}")
+    for key in results.keys():
+        if key not in baseline:
+            print(F"{key:<48} {'-':>12} {results[key]['median']:>12.4f} {'new':>8}")
+            continue
+
+        t0 = baseline[key]["median"]
+        t1 = results[key]["median"]
+        ratio = t1 / t0 if t0 > 0.0 else float("inf")
+
+        status = ""
+        if ratio > 1.0 + threshold:
+            regressed.append(key);  status = "  SLOWER"
+        elif ratio < 1.0 / (1.0 + threshold):
+            improved.append(key);  status = "  faster"
+
+        print(F"{key:<48} {t0:>12.4f} {t1:>12.4f} {ratio:>8.3f}{status}")
+
+    print(F"{len(regressed)} regressions, {len(improved)} improvements (threshold = {100.0*threshold:.0f}%)")
+
+    return regressed, improved
+
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Runs the libra_py benchmarks")
+    parser.add_argument("--group", nargs="*", default=None, help="groups to run: tsh, savers, nbra, heom, exact, kernels")
+    parser.add_argument("--filter", default=None, help="run only the cases whose names contain this string")
+    parser.add_argument("--repeat", type=int, default=3, help="the number of timed repeats of each case")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the timings")
+    parser.add_argument("--baseline", default="default", help="the name of the baseline (in baselines/) or the path to the JSON file")
+    parser.add_argument("--save-baseline", default=None, help="store the results as the baseline with this name")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with code 1 if there are regressions")
+    parser.add_argument("--list", action="store_true", help="only list the cases")
+    parser.add_argument("--verbose", action="store_true", help="do not suppress the output of the cases")
+    args = parser.parse_args()
+
+    if args.list:
+        for key, funct, value in bench_cases.case_instances(args.group, args.filter):
+            print(key)
+        return 0
+
+    results = run_cases(args.group, args.filter, args.repeat, args.verbose)
+    data = {"machine":machine_info(), "results":results}
+
+    with open(args.output, "w") as f:
+        json.dump(data, f, indent=1)
+
+    if args.save_baseline != None:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        filename = os.path.join(BASELINE_DIR, F"{args.save_baseline}.json")
+
+        # Keep the baseline timings of the cases that were not run this time
+        if os.path.exists(filename):
+            with open(filename, "r") as f:
+                old = json.load(f)
+            old["results"].update(results)
+            data = {"machine":machine_info(), "results":old["results"]}
+
+        with open(filename, "w") as f:
+            json.dump(data, f, indent=1)
+        print(F"Saved the baseline to {filename}")
+        return 0
+
+    filename = args.baseline
+    if not os.path.exists(filename):
+        filename = os.path.join(BASELINE_DIR, F"{args.baseline}.json")
+
+    if not os.path.exists(filename):
+        print(F"No baseline {args.baseline} found, run with --save-baseline to create one")
+        return 0
+
+    with open(filename, "r") as f:
+        baseline = json.load(f)
+
+    print(F"Comparing to the baseline {filename} recorded on {baseline['machine']['date']}")
+    regressed, improved = compare(results, baseline["results"], args.threshold)
+
+    if args.fail_on_regression and len(regressed) > 0:
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
@@ -0,0 +1,82 @@
+#*********************************************************************************
+#* Copyright (C) 2020 Alexey V. Akimov
+#*
+#* This file is distributed under the terms of the GNU General Public License
+#* as published by the Free Software Foundation, either version 3 of
+#* the License, or (at your option) any later version.
+#* See the file LICENSE in the root directory of this distribution
+#* or <http://www.gnu.org/licenses/>.
+#*
+#*********************************************************************************/
+
+"""
+  The benchmark cases of `bench_cases.py` run via the pytest-benchmark plugin:
+
+      pytest tests/benchmarks --benchmark-autosave
+      pytest tests/benchmarks --benchmark-compare --benchmark-compare-fail=median:20%
+
+  These tests are skipped if the plugin is not installed.
+
+  The `test_baseline` tests compare the median times to the baseline stored by 
+  `python run_benchmarks.py --save-baseline default` (baselines/default.json, or the one named
+  by the LIBRA_BENCH_BASELINE environment variable). The baselines are machine-specific, so 
+  none is stored in the repository: the tests are skipped when the baseline file or the case 
+  in it is absent
+"""
+
+import os
+import sys
+import json
+import pytest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bench_cases
+import run_benchmarks
+
+try:
+    import pytest_benchmark
+    have_plugin = True
+except ImportError:
+    have_plugin = False
+
+
+# The relative slowdown reported as a regression
+THRESHOLD = 0.2
+
+
+def load_baseline():
+    """
+    Returns:
+        dictionary or None: the baseline timings, as stored by `run_benchmarks.py`, None if there is no baseline
+    """
+
+    filename = os.path.join(run_benchmarks.BASELINE_DIR, os.environ.get("LIBRA_BENCH_BASELINE", "default") + ".json")
+    if not os.path.exists(filename):
+        return None
+
+    with open(filename, "r") as f:
+        return json.load(f)["results"]
+
+
+@pytest.mark.skipif(not have_plugin, reason="pytest-benchmark is not installed")
+@pytest.mark.parametrize("key, funct, value", bench_cases.case_instances(), ids=lambda x: x if isinstance(x, str) else "")
+def test_benchmark(benchmark, tmp_path, monkeypatch, key, funct, value):
+    monkeypatch.chdir(tmp_path)
+    run = funct(value)
+    benchmark.pedantic(run, rounds=3, iterations=1)
+
+
+
+@pytest.mark.parametrize("key, funct, value", bench_cases.case_instances(), ids=lambda x: x if isinstance(x, str) else "")
+def test_baseline(key, funct, value):
+    baseline = load_baseline()
+    if baseline is None:
+        pytest.skip("no baseline timings, create them with: python run_benchmarks.py --save-baseline default")
+    if key not in baseline:
+        pytest.skip(F"the case {key} is not in the baseline")
+
+    times = run_benchmarks.time_case(funct, value, baseline[key]["repeat"])
+    regressed, improved = run_benchmarks.compare({key: {"median": float(np.median(times))}}, baseline, THRESHOLD)
+
+    assert key not in regressed